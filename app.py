@@ -1,26 +1,134 @@
 import streamlit as st
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
-import pandas as pd
-import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+import inspect
+import os
+import re
+import uuid
+
+from zhuoji import (
+    CATEGORY_LABELS, build_common_chicken_cfg, aggregate_transactions, check_round, net_flows, SettlementCache, Rules,
+    RoundInput,
+)
+from zhuoji import metrics
+from zhuoji.export import FORMATS, TABLES, export_bytes, parquet_available
+from zhuoji.ledger import LedgerStore, VersionConflict
+from zhuoji.payout import min_transfers
+from zhuoji.table import Table, TableRegistry, TableSnapshot
+from zhuoji.whatif import FAN_CARDS, NO_WHO, tile_outcomes, what_if
+
+HISTORY_PAGE = 20
+DEFAULT_SEATS = 4
+MAX_SEATS = 8
+SYNC_SECONDS = 2  # 同桌其他设备的变动最多这么久后出现
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+LAZY_PANELS = "on_change" in inspect.signature(st.expander).parameters  # 较新的 Streamlit 才回传面板展开状态
+# pandas 只在画表的面板里按需导入：冷启动省下约半秒，折叠的面板不会触发
 
 
 # ==============================================================================
-# 🧠 Logic Kernel (V45 - 全功能回归版)
+# 🧠 Logic Kernel (V45 - 全功能回归版)，规则内核见 zhuoji/kernel.py
 # ==============================================================================
 
 # -------------------------------
 # 1. 状态初始化
 # -------------------------------
+@st.cache_resource
+def get_ledger_store() -> LedgerStore:
+    """进程内共用的持久化账本（刷新页面/重启服务不丢）"""
+    return LedgerStore(os.environ.get("ZHUOJI_LEDGER_DB", "ledger.db"))
+
+
+@st.cache_resource
+def get_tables() -> TableRegistry:
+    """进程内的牌桌表：闲置半小时或超出张数/字节上限的桌被放掉，再来时从账本重读"""
+    return TableRegistry(get_ledger_store())
+
+
+def get_table(sid: str) -> Table:
+    """同一场次的所有设备共用一份牌桌状态（版本号、累计分、草稿），不在各会话里各存一份"""
+    return get_tables().get(sid)
+
+
+@st.cache_resource
+def get_settlement_cache() -> SettlementCache:
+    """试算与记账共用的结算缓存：同一局输入 + 规则只算一次"""
+    return SettlementCache(512)
+
+
+@st.cache_resource
+def start_metrics(port: int):
+    """开启分阶段计时；给了端口时再在本机提供 Prometheus 文本 /metrics"""
+    metrics.enable()
+    if port: metrics.serve(port)
+
+
+def debug_mode() -> bool:
+    """?debug=1 显示隐藏的性能面板；设置 ZHUOJI_METRICS_PORT 时计时常开"""
+    port = int(os.environ.get("ZHUOJI_METRICS_PORT", 0))
+    debug = st.query_params.get("debug") == "1"
+    if port or debug: start_metrics(port)
+    return debug
+
+
 def init_app_state():
+    if "session_id" not in st.session_state:
+        # 场次号写进 URL (?s=...)，刷新页面后沿用同一本账
+        sid = st.query_params.get("s") or uuid.uuid4().hex[:12]
+        st.query_params["s"] = sid
+        st.session_state["session_id"] = sid
+        st.session_state["device"] = uuid.uuid4().hex[:4]
+        snap = get_table(sid).snapshot()
+        st.session_state["main_round"] = st.session_state["last_round"] = snap.last_round
+        if snap.players: st.session_state.p_names = list(snap.players)  # 沿用账本里最新一局的座位名单与人数
+        st.session_state["table_version"] = snap.version
+        st.session_state["hist_page"], st.session_state["hist_open"] = 0, None
     if "main_round" not in st.session_state:
         st.session_state["main_round"] = 0
     if "gang_rows" not in st.session_state:
         st.session_state["gang_rows"] = 1
-    if "ledger_data" not in st.session_state:
-        st.session_state["ledger_data"] = []
     if "p_names" not in st.session_state:
-        st.session_state.p_names = ["玩家A", "玩家B", "玩家C", "玩家D"]
+        st.session_state.p_names = [seat_name(i) for i in range(DEFAULT_SEATS)]
+
+
+def seat_name(i: int) -> str:
+    return f"玩家{chr(65 + i)}"
+
+
+def set_seat_count():
+    """改人数：名单截断或补默认名"""
+    n, names = st.session_state["n_seats"], st.session_state.p_names
+    st.session_state.p_names = names[:n] + [seat_name(i) for i in range(len(names), n)]
+
+
+def sync_table(snap: TableSnapshot):
+    """牌桌快照 -> 本设备：别的设备记账/撤销/重算后换到新的一局，座位名单跟着账本走"""
+    ss = st.session_state
+    if ss["table_version"] != snap.version:
+        ss["table_version"] = snap.version
+        st.toast("账本已由同桌其他设备更新", icon="🔄")
+        if snap.last_round != ss["last_round"]:
+            ss["main_round"] = max(ss["main_round"] + 1, snap.last_round)  # 换一批控件，丢掉本设备未记的录入
+            ss["gang_rows"] = 1
+        if snap.players and snap.players != ss.p_names:
+            ss.p_names = list(snap.players)
+            for k in [k for k in ss if isinstance(k, str) and k.startswith("pn_")] + ["n_seats"]: ss.pop(k, None)
+    ss["last_round"], ss["n_rounds"] = snap.last_round, snap.n_rounds
+    ss["totals"] = snap.totals + [0] * (len(ss.p_names) - len(snap.totals))
+
+
+def seat_columns(players):
+    """每行最多 4 列，多于 4 人时换行"""
+    cols = st.columns(min(len(players), 4))
+    return [cols[i % len(cols)] for i in range(len(players))]
+
+
+def prune_round_state():
+    """只留当前局的录入状态：旧局的草稿与非控件键不会被 Streamlit 回收，长场次里会随局数一直涨"""
+    ss, prefix = st.session_state, K("")
+    for k in [k for k in ss if isinstance(k, str) and k[:5] == "main_" and k[5:6].isdigit() and
+              not k.startswith(prefix)]:
+        del ss[k]
 
 
 def next_round():
@@ -30,261 +138,521 @@ def next_round():
     st.rerun()
 
 
-# -------------------------------
-# 2. 基础工具函数
-# -------------------------------
-def parse_card(card_str: str) -> Optional[Tuple[int, str]]:
-    if not card_str: return None
+def record_round(summary, players, scores, txs, event=None):
+    """记账为本设备看到的下一局；期间别的设备已记过账则抛 VersionConflict，不会重复记同一局。
+    event 为 (录入, 规则)，改规则后据此重算"""
+    ss = st.session_state
+    snap = get_table(ss["session_id"]).record(ss["table_version"], ss["last_round"] + 1, summary, players, scores,
+                                               txs, event)
+    ss["table_version"] = snap.version
+    sync_table(snap)
+    ss["hist_page"] = 0
+
+
+def undo_last_round():
+    """撤销最后一局，局号退回；别的设备刚改过账本时不撤销"""
+    ss = st.session_state
+    table = get_table(ss["session_id"])
     try:
-        suit = card_str[-1];
-        num = int(card_str[:-1])
-        if suit not in ["筒", "条", "万"] or num < 1 or num > 9: return None
-        return num, suit
-    except:
-        return None
+        rec = table.undo(ss["table_version"])
+    except VersionConflict as e:
+        ss["flash"], ss["flash_icon"] = str(e), "⚠️"
+        return
+    if rec is None: return
+    snap = table.snapshot()
+    ss["table_version"], ss["main_round"] = snap.version, snap.last_round
+    sync_table(snap)
+    ss["gang_rows"] = 1
+    if ss["hist_open"] == rec["id"]: ss["hist_open"] = None
+
+
+@st.fragment(run_every=SYNC_SECONDS)
+def watch_table(sid: str):
+    """定时只重跑这一小块：账本有变才整页重跑，别的设备的试算草稿只更新这里的提示"""
+    snap = get_table(sid).poll()
+    if snap.version != st.session_state["table_version"]: st.rerun(scope="app")
+    d = snap.draft
+    if d and d.device != st.session_state["device"] and d.round_no == snap.last_round + 1:
+        st.caption(f"📝 设备 {d.device} 已试算第 {d.round_no} 局：{d.summary}")
+
+
+def render_history(store: LedgerStore, sid: str):
+    """历史记录只渲染当前一页；明细只为展开的那一局查询"""
+    n_rounds = st.session_state["n_rounds"]
+    n_pages = (n_rounds + HISTORY_PAGE - 1) // HISTORY_PAGE
+    page = min(st.session_state["hist_page"], n_pages - 1)
+    opened = st.session_state["hist_open"]
+
+    def set_state(k, v):
+        st.session_state[k] = v
+
+    for rec in store.page(sid, page * HISTORY_PAGE, HISTORY_PAGE):
+        s_txt = " | ".join([f"{p}:{s}" for p, s in rec['scores'].items()])
+        label = f"第{rec['round']}局: {s_txt}"
+        if rec['id'] != opened:
+            st.button(label, key=f"hist_{rec['id']}", use_container_width=True,
+                      on_click=set_state, args=("hist_open", rec['id']))
+            continue
+        with st.container(border=True):
+            st.markdown(f"**{label}**")
+            st.caption(f"{rec['summary']}")
+            _, details = aggregate_transactions(rec['players'], store.round_transactions(rec['id']))
+            for p in rec['players']:
+                if details[p]:
+                    st.markdown(f"**{p}**")
+                    for l in details[p]: st.text(l)
+            st.button("收起", key=f"hist_close_{rec['id']}", on_click=set_state, args=("hist_open", None))
+
+    if n_pages > 1:
+        c_p1, c_p2, c_p3 = st.columns([1, 2, 1])
+        c_p1.button("◀", key="hist_prev", disabled=page == 0, on_click=set_state, args=("hist_page", page - 1))
+        c_p2.caption(f"第 {page + 1}/{n_pages} 页 · 共 {n_rounds} 局")
+        c_p3.button("▶", key="hist_next", disabled=page >= n_pages - 1,
+                    on_click=set_state, args=("hist_page", page + 1))
+
+
+def render_transfers(transfers):
+    for dn, cn, amt in transfers:
+        st.markdown(f"**{dn}** ➜ **{cn}** : <span style='color:#4ed9ff; font-weight:bold'>¥{int(amt)}</span>",
+                    unsafe_allow_html=True)
 
 
-def get_fan_multipliers(fan_card: str) -> Tuple[int, int]:
-    parsed = parse_card(fan_card)
-    if not parsed: return 1, 1
-    num, suit = parsed
-    if num == 9 and suit == "条": return 2, 1
-    if num == 7 and suit == "筒": return 1, 2
-    return 1, 1
+def render_payout(players):
+    """整场结账：按累计分求最少笔数的转账"""
+    plan = min_transfers(dict(zip(players, st.session_state["totals"])))
+    render_transfers(plan.transfers)
+    st.caption(f"共 {len(plan.transfers)} 笔" + ("（最少）" if plan.optimal else f"（距下界 {plan.gap} 笔）"))
+
+
+def render_debug():
+    """隐藏的性能面板：各阶段/区块耗时（桶估计的分位数）与牌桌、本会话的内存占用"""
+    rows = metrics.REGISTRY.snapshot()
+    if rows:
+        import pandas as pd
+        df = pd.DataFrame(rows).set_index(["metric", "label"]).round(1)
+        st.dataframe(df, use_container_width=True)
+    counters = metrics.REGISTRY.counters
+    st.caption(" · ".join(f"{k}={v}" for k, v in sorted(counters.items())) or "暂无数据")
+    tables, ss = get_tables().usage(), st.session_state
+    st.caption(f"内存中牌桌 {len(tables)} 张，约 {sum(r[1] for r in tables) / 1024:.1f} KB"
+               f"（本桌 {next((r[1] for r in tables if r[0] == ss['session_id']), 0) / 1024:.1f} KB）· "
+               f"本会话状态约 {metrics.approx_size({k: ss[k] for k in ss}) / 1024:.1f} KB")
+    st.button("清零", key="metrics_reset", on_click=metrics.REGISTRY.reset)
+
+
+def render_flows(store: LedgerStore, sid: str, players):
+    """本场次谁欠谁：直接读按类别累计的净额矩阵，不回放流水"""
+    flows = store.session_flows(sid, len(players))
+    cat = st.selectbox("类别", range(-1, len(CATEGORY_LABELS)), key="flow_cat",
+                       format_func=lambda c: "全部" if c < 0 else CATEGORY_LABELS[c])
+    m = net_flows(flows) if cat < 0 else flows[cat]
+    import pandas as pd
+    st.dataframe(pd.DataFrame([[max(v, 0) for v in row] for row in m], index=players, columns=players),
+                 use_container_width=True)
+    st.caption("行 ➜ 列 的净付款")
+
+
+@st.fragment
+@metrics.timed("stats")
+def render_stats(store: LedgerStore, sid: str):
+    """玩家统计：全场直接读累计表，近 N 局只汇总窗口内的计数；图表只用汇总结果，不回放流水"""
+    last = st.selectbox("范围", [None, 10, 30, 100], key="stats_window",
+                        format_func=lambda n: "全场" if n is None else f"近 {n} 局")
+    stats = store.stats(sid, last)
+    if not stats: return
+    import pandas as pd
+    names = [s.player for s in stats]
+    st.dataframe(pd.DataFrame({
+        "局数": [s.rounds for s in stats], "胜率": [f"{s.win_rate:.0%}" for s in stats],
+        "自摸": [s.zimo for s in stats], "点炮率": [f"{s.dianpao_rate:.0%}" for s in stats],
+        "局均": [round(s.mean, 1) for s in stats], "包赔付": [s.baopei_paid for s in stats],
+        "包赔收": [s.baopei_recv for s in stats], "责任鸡": [s.liable for s in stats],
+        "连胜": [f"{s.win_run}/{s.win_best}" for s in stats], "连败": [f"{s.lose_run}/{s.lose_best}" for s in stats],
+    }, index=names), use_container_width=True)
+    st.caption("连胜/连败为 当前/最长；包赔为未听牌反向包赔的金额；责任鸡为按责任价付出的次数")
+    st.bar_chart(pd.DataFrame([s.income for s in stats], index=names, columns=list(CATEGORY_LABELS)), height=220)
+    st.caption("按类别的净收入")
+    st.bar_chart(pd.DataFrame({"胜率": [s.win_rate for s in stats], "点炮率": [s.dianpao_rate for s in stats]},
+                              index=names), stack=False, height=180)
+
+
+def render_rescore(store: LedgerStore, sid: str, rules: Rules):
+    """改了侧边栏规则后按新规则重算旧局：先试算出每人累计变化，确认后一次写回"""
+    plan = st.session_state.get("rescore_plan")
+    if plan is not None and (plan.session != sid or plan.rules != rules): plan = None
+    if st.button("试算重算", key="rescore_try", use_container_width=True):
+        plan = st.session_state["rescore_plan"] = store.rescore(sid, rules)
+    if plan is None:
+        st.caption("修改规则分值/常鸡价值后，按当前规则重算本场已记的局")
+        return
+    import pandas as pd
+    st.dataframe(pd.DataFrame({"原累计": plan.before, "重算后": plan.after, "变化": plan.diff}),
+                 use_container_width=True)
+    st.caption(f"{len(plan.changes)} 局结果有变（重算 {plan.rescored} 局，{plan.elapsed * 1000:.0f} ms）"
+               + (f" · {plan.skipped} 局为旧账，无录入记录未重算" if plan.skipped else ""))
+
+    def apply():
+        store.apply_rescore(plan)
+        snap = get_table(sid).reload()
+        st.session_state["table_version"] = snap.version
+        sync_table(snap)
+        st.session_state["rescore_plan"] = None
+        st.session_state["flash"] = "♻️ 已按新规则重算"
+
+    st.button("确认重算", key="rescore_apply", type="primary", use_container_width=True,
+              disabled=not plan.changes and not plan.checked, on_click=apply)
+
+
+@st.cache_data(max_entries=8, ttl=600, show_spinner=False)
+def build_export(sid: str, version: int, fmt: str, table: str, players: tuple) -> bytes:
+    """按账本版本缓存：记账/撤销/重算后版本变化，旧文件自然失效"""
+    return export_bytes(get_ledger_store(), sid, fmt, table, list(players))
+
+
+def render_export(store: LedgerStore, sid: str, players):
+    """导出文件只在点“生成”时才读账本编码，平时重跑不碰流水"""
+    fmts = [f for f in FORMATS if f != "parquet" or parquet_available()]
+    c1, c2 = st.columns(2)
+    fmt = c1.selectbox("格式", fmts, key="export_fmt", format_func=str.upper)
+    table = c2.selectbox("内容", list(TABLES), key="export_table", format_func=TABLES.get)
+    key = (sid, store.version(sid), fmt, table, tuple(players))
+    if st.button("生成导出文件", key="export_build", use_container_width=True):
+        st.session_state["export_key"] = key
+    if st.session_state.get("export_key") != key: return
+    mime, ext = FORMATS[fmt]
+    st.download_button("📥 下载", build_export(*key), f"{table}.{ext}", mime, key="export_download",
+                       use_container_width=True)
 
 
-@dataclass
-class Transaction:
-    payer: str;
-    receiver: str;
-    amount: int;
-    reason: str;
-    category: str
+# ==============================================================================
+# UI (V45 - 全功能回归 + iOS优化)
+# ==============================================================================
 
-    def reverse(self):
-        return Transaction(self.receiver, self.payer, self.amount, f"未听牌包赔-{self.reason}", self.category)
+@st.cache_resource
+def app_style() -> str:
+    """静态样式在 static/app.css。开了静态文件服务时每次整页运行只发一行 @import，样式表由浏览器缓存；
+    否则读一次文件、去掉注释与空白后内联（按进程缓存，不随重跑重读）"""
+    if st.get_option("server.enableStaticServing"): return '<style>@import url("app/static/app.css");</style>'
+    with open(os.path.join(STATIC_DIR, "app.css"), encoding="utf-8") as f:
+        css = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+    return "<style>" + re.sub(r"\s+", " ", css).strip() + "</style>"
 
 
-def build_common_chicken_cfg(base_yj, mul_yj, base_b8, mul_b8, fan_card):
-    f_yj, f_b8 = get_fan_multipliers(fan_card)
-    return {"幺鸡": int(base_yj) * int(mul_yj) * int(f_yj), "八筒": int(base_b8) * int(mul_b8) * int(f_b8)}
+# --- UI 辅助函数 (已找回) ---
+def ui_section(title: str, icon: str = "", caption: Optional[str] = None):
+    cap_html = f'<span class="glass-caption">{caption}</span>' if caption else ""
+    st.markdown(f'<div class="glass-header"><span class="glass-header-icon">{icon}</span> {title}{cap_html}</div>',
+                unsafe_allow_html=True)
 
 
-# -------------------------------
-# 3. 校验逻辑
-# -------------------------------
-def validate_objective_facts(players, fan_card, hand_counts, f_yj_who, f_yj_res, f_yj_tar, f_b8_who, f_b8_res, f_b8_tar,
-                             e_yj, e_b8, gang_data):
-    if fan_card and sum(hand_counts.get(p, 0) for p in players) > 4: raise ValueError("翻鸡总数超过4张")
-
-    def check_tile(name, f_who, f_res, f_tar, extra_map):
-        total = sum(extra_map.get(p, 0) for p in players)
-        gangs = [g for g in gang_data if g['card'] == name and g['type'] in ["暗杠", "补杠", "普通明杠", "责任明杠"]]
-        consumed = 0
-        if f_who and f_who != "无/未现":
-            if f_res == "被碰":
-                consumed = 3
-            elif f_res == "被明杠":
-                consumed = 4
-            elif f_res == "被胡":
-                consumed = 1
-            else:
-                consumed = 1
+def ui_divider(label: Optional[str] = None):
+    if label:
+        st.markdown(f'<div class="ui-divider"><span>{label}</span></div>', unsafe_allow_html=True)
+    else:
+        st.markdown('<div class="ui-divider" style="margin-top:10px;"></div>', unsafe_allow_html=True)
 
-        bu_gangs = [g for g in gangs if g['type'] == "补杠"]
-        if bu_gangs:
-            if len(bu_gangs) > 1: raise ValueError(f"{name}补杠重复")
-            if not (f_who and f_res == "被碰"): raise ValueError(f"{name}补杠需基于首出被碰")
-            if bu_gangs[0]['doer'] != f_tar: raise ValueError(f"{name}补杠者必须是碰牌者")
 
-        if gangs or (f_who and f_res == "被明杠"):
-            if total != 0: raise ValueError(f"{name}有杠时，非首出应为0")
-        else:
-            if consumed + total > 4: raise ValueError(f"{name}总数超限(>4)")
+@contextmanager
+def lazy_expander(label: str, key: str):
+    """折叠着就不执行内容的面板，产出是否展开；旧版 Streamlit 没有展开状态，退回普通面板、内容照常执行"""
+    if not LAZY_PANELS:
+        with st.expander(label): yield True
+        return
+    with st.expander(label, key=key, on_change="rerun") as exp: yield exp.open
+
 
-    check_tile("幺鸡", f_yj_who, f_yj_res, f_yj_tar, e_yj)
-    check_tile("八筒", f_b8_who, f_b8_res, f_b8_tar, e_b8)
+def K(s: str) -> str:
+    return f"main_{st.session_state['main_round']}_{s}"
 
 
-def validate_consistency(players, winners, method, fyw, fyr, fyt, fbw, fbr, fbt, gang_data):
-    if method == "自摸" and (fyr == "被胡" or fbr == "被胡"): raise ValueError("自摸不能接首出胡")
-    if fyr == "被胡" and fbr == "被胡": raise ValueError("双常鸡不能同时被胡")
+def draft() -> dict:
+    """本局录入草稿：各片段把自己的输出写在这里，操作台在点击时读取"""
+    return st.session_state.setdefault(K("draft"), {})
 
-    def check_gang_conflict(tile, res):
-        has_gang = any(g['card'] == tile for g in gang_data if g['type'] in ["暗杠", "补杠", "普通明杠", "责任明杠"])
-        if res == "被胡" and has_gang: raise ValueError(f"{tile}被胡时不能有杠")
-        if has_gang and res == "被胡": raise ValueError(f"{tile}有杠时不能被胡")
 
-    check_gang_conflict("幺鸡", fyr);
-    check_gang_conflict("八筒", fbr)
+def gang_deps(first) -> list:
+    """首出中会影响杠牌登记区的部分（被碰→补杠勾选，被明杠→自动责任杠）"""
+    fyw, fyr, fyt, fbw, fbr, fbt = first
+    return [(w, r, t) if r in ("被碰", "被明杠") else None for w, r, t in [(fyw, fyr, fyt), (fbw, fbr, fbt)]]
 
 
 # -------------------------------
-# 4. 核心计算管道
+# 录入片段：各自独立重跑，互不触发整页刷新
 # -------------------------------
-def calculate_all_pipeline(
-        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
-        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
-        hand_total_counts, gang_data, common_v, fan_unit
-) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
-    raw_txs = []
-    winners_set = set(winners)
-    ready_set = set([p for p in ready_list if p in players]) | winners_set
-
-    # 1. Validation
-    validate_objective_facts(players, fan_card, hand_total_counts, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
-                             gang_data)
-    validate_consistency(players, winners, method, fyw, fyr, fyt, fbw, fbr, fbt, gang_data)
-
-    get_price = lambda c: int(common_v.get(c, 0))
-
-    # 2. Score Calculation
-    # 2.1 Hu
-    if winners:
-        base = rules_config.get(hu_shape, 0) + (rules_config.get("清一色加成", 0) if is_qing else 0)
-        spec = sum(rules_config.get(e, 0) for e in special_events)
-        total = base + spec
-        desc = f"{hu_shape}" + ("+清" if is_qing else "") + (f"+{'+'.join(special_events)}" if special_events else "")
-        if method == "自摸":
-            for p in players:
-                if p != winners[0]: raw_txs.append(Transaction(p, winners[0], total, f"自摸({desc})", "hu"))
-        elif method == "点炮" and loser:
-            for w in winners: raw_txs.append(Transaction(loser, w, total, f"点炮({desc})", "hu"))
-
-    # 2.2 Gang
-    for g in gang_data:
-        d, t, v, c = g['doer'], g['type'], g['victim'], g['card']
-        if not d: continue
-        score = 4 if t == "暗杠" else 2
-        if t in ["暗杠", "补杠"]:
-            for p in players:
-                if p != d: raw_txs.append(Transaction(p, d, score, f"{t}-{c}", "gang"))
-        elif v and v in players:
-            raw_txs.append(Transaction(v, d, score, f"{t}-{c}", "gang"))
-
-    # 2.3 Fan Chicken
-    for i in range(len(players)):
-        for j in range(i + 1, len(players)):
-            p1, p2 = players[i], players[j]
-            c1, c2 = hand_total_counts.get(p1, 0), hand_total_counts.get(p2, 0)
-            if c1 != c2:
-                win, los = (p1, p2) if c1 > c2 else (p2, p1)
-                raw_txs.append(Transaction(los, win, abs(c1 - c2) * fan_unit, "翻鸡互斥", "chicken_fan_luck"))
-
-    # 2.4 Common Chicken
-    # Charge
-    for card, who, res in [("幺鸡", fyw, fyr), ("八筒", fbw, fbr)]:
-        if who and who != "无/未现" and res == "安全":
-            u = get_price(card)
-            if u > 0:
-                for p in players:
-                    if p != who: raw_txs.append(Transaction(p, who, u * 2, f"冲锋鸡-{card}", "chicken_charge"))
-
-    # Extra (Split)
-    for card, e_map in [("幺鸡", extra_yj), ("八筒", extra_b8)]:
-        u = get_price(card)
-        if u > 0:
-            for owner, count in e_map.items():
-                if count > 0:
-                    for p in players:
-                        if p != owner: raw_txs.append(
-                            Transaction(p, owner, count * u, f"常鸡-{card}({count}张)", "chicken_extra"))
-
-    # Landed
-    landed = []
-    for g in gang_data:
-        if g['card'] in ["幺鸡", "八筒"]:
-            vic = g['victim']
-            if g['type'] == "补杠":
-                if g['card'] == "幺鸡" and fyr == "被碰" and fyt == g['doer']:
-                    vic = fyw
-                elif g['card'] == "八筒" and fbr == "被碰" and fbt == g['doer']:
-                    vic = fbw
-            landed.append({'o': g['doer'], 'c': g['card'], 'n': 4, 'v': vic, 't': g['type']})
-
-    # Add Peng
-    if fyr == "被碰" and fyt and not any(
-            g['card'] == "幺鸡" and g['type'] == "补杠" and g['doer'] == fyt for g in gang_data):
-        landed.append({'o': fyt, 'c': "幺鸡", 'n': 3, 'v': fyw, 't': "碰"})
-    if fbr == "被碰" and fbt and not any(
-            g['card'] == "八筒" and g['type'] == "补杠" and g['doer'] == fbt for g in gang_data):
-        landed.append({'o': fbt, 'c': "八筒", 'n': 3, 'v': fbw, 't': "碰"})
-
-    # Add Hu
-    def add_h(c, r, t, v):
-        if r == "被胡" and t:
-            for tar in (t if isinstance(t, list) else [t]): landed.append({'o': tar, 'c': c, 'n': 1, 'v': v, 't': "胡"})
-
-    add_h("幺鸡", fyr, fyt, fyw);
-    add_h("八筒", fbr, fbt, fbw)
-
-    for l in landed:
-        o, c, n, v, t = l['o'], l['c'], l['n'], l['v'], l['t']
-        u = get_price(c)
-        if u <= 0: continue
-        for p in players:
-            if p == o: continue
-            is_liable = (v and p == v)
-            amt = (2 * u) + (u * (n - 1)) if is_liable else (u * n)
-            reason = f"{t}鸡-{c}({n}张{',责任' if is_liable else ''})"
-            raw_txs.append(Transaction(p, o, amt, reason, "chicken_resp"))
-
-    # 3. Filter
-    final = []
-    zero_income = set()
-    if method == "点炮" and loser and ("热炮" in special_events or "抢杠胡" in special_events) and loser in ready_set:
-        zero_income.add(loser)
-
-    for tx in raw_txs:
-        if tx.receiver in zero_income: continue
-        if tx.receiver in ready_set:
-            final.append(tx)
+@st.fragment
+@metrics.timed("first_discard")
+def section_first_discard(players, winners, method, common_v):
+    with st.container(border=True):
+        ui_section(f"首出 (1条:{common_v['幺鸡']} / 8筒:{common_v['八筒']})", "🚀")
+        if st.session_state.get(K("fyr")) == "被胡" and st.session_state.get(K("fbr")) == "被胡": st.session_state[
+            K("fbr")] = "安全"
+
+        c1, c2 = st.columns([1, 2])
+        with c1:
+            fyw = st.selectbox("1条 首出", ["无/未现"] + players, key=K("fyw"))
+        fyr, fyt = "安全", None
+        if fyw != "无/未现":
+            with c2:
+                opts = ["安全", "被碰", "被明杠", "被胡"]
+                if method == "自摸" or st.session_state.get(K("fbr")) == "被胡": opts = ["安全", "被碰", "被明杠"]
+                fyr = st.radio("1条 结局", opts, horizontal=True, key=K("fyr"))
+                if fyr == "被胡":
+                    fyt = [w for w in winners if w in players]
+                    st.caption(f"-> {','.join(fyt) if fyt else '?'}")
+                elif fyr != "安全":
+                    fyt = st.selectbox("被谁?", [p for p in players if p != fyw], key=K("fyt"))
+
+        st.markdown("---")
+        c3, c4 = st.columns([1, 2])
+        with c3:
+            fbw = st.selectbox("8筒 首出", ["无/未现"] + players, key=K("fbw"))
+        fbr, fbt = "安全", None
+        if fbw != "无/未现":
+            with c4:
+                opts = ["安全", "被碰", "被明杠", "被胡"]
+                if method == "自摸" or st.session_state.get(K("fyr")) == "被胡": opts = ["安全", "被碰", "被明杠"]
+                fbr = st.radio("8筒 结局", opts, horizontal=True, key=K("fbr"))
+                if fbr == "被胡":
+                    fbt = [w for w in winners if w in players]
+                    st.caption(f"-> {','.join(fbt) if fbt else '?'}")
+                elif fbr != "安全":
+                    fbt = st.selectbox("被谁?", [p for p in players if p != fbw], key=K("fbt"))
+
+    first = (fyw, fyr, fyt, fbw, fbr, fbt)
+    draft()["first"] = first
+    # 杠牌登记区上次按哪组首出渲染；变了才需要整页重跑，其余改动只重跑本片段
+    rendered = st.session_state.get(K("gang_deps"))
+    if rendered is not None and rendered != gang_deps(first): st.rerun(scope="app")
+
+
+@st.fragment
+@metrics.timed("extra")
+def section_extra(players):
+    with st.container(border=True):
+        ui_section("常鸡 (非首出)", "🔢")
+        extra_yj, extra_b8 = {}, {}
+        for i, (p, col) in enumerate(zip(players, seat_columns(players))):
+            with col:
+                st.caption(f"**{p}**")
+                extra_yj[p] = st.number_input(f"1条", 0, 4, 0, key=K(f"ey_{i}"), label_visibility="collapsed")
+                extra_b8[p] = st.number_input(f"8筒", 0, 4, 0, key=K(f"eb_{i}"), label_visibility="collapsed")
+    draft()["extra"] = (extra_yj, extra_b8)
+
+
+@st.fragment
+@metrics.timed("fan")
+def section_fan(players, fan_card):
+    with st.container(border=True):
+        ui_section("翻鸡 (手牌+桌面)", "🖐️")
+        hand_total_counts = {}
+        if fan_card in ["9条", "7筒"]:
+            st.info("翻倍鸡规则：不互斥")
         else:
-            if tx.category in ["gang", "chicken_charge", "chicken_resp", "chicken_extra"]:
-                if tx.payer in ready_set: final.append(tx.reverse())
+            for i, (p, col) in enumerate(zip(players, seat_columns(players))):
+                with col:
+                    st.caption(f"**{p}**")
+                    hand_total_counts[p] = st.number_input(f"fc", 0, 4, 0, key=K(f"fc_{i}"),
+                                                           label_visibility="collapsed")
+    draft()["hand"] = hand_total_counts
+
+
+def add_gang_row():
+    st.session_state.gang_rows += 1
+
+
+@st.fragment
+@metrics.timed("gang")
+def section_gang(players):
+    first = draft()["first"]
+    fyw, fyr, fyt, fbw, fbr, fbt = first
+    with st.container(border=True):
+        ui_section("杠牌登记", "🛠️")
+        gang_data = []
+
+        auto_gangs = []
+        if fyw != "无/未现" and fyr == "被明杠" and fyt: auto_gangs.append(f"{fyt} 杠 {fyw} (幺鸡)")
+        if fbw != "无/未现" and fbr == "被明杠" and fbt: auto_gangs.append(f"{fbt} 杠 {fbw} (八筒)")
+        if auto_gangs:
+            for ag in auto_gangs: st.info(f"⚡ 自动: {ag}")
+
+        for i in range(st.session_state.gang_rows):
+            c1, c2, c3, c4 = st.columns([1.5, 1.5, 1.5, 1.5])
+            with c1:
+                gw = st.selectbox("杠主", ["无"] + players, key=K(f"gw{i}"))
+            if gw != "无":
+                with c2:
+                    gt = st.selectbox("类型", ["暗杠", "补杠", "普通明杠"], key=K(f"gt{i}"))
+                with c3:
+                    gc = st.selectbox("牌", ["杂牌", "幺鸡", "八筒"] if gt != "补杠" else ["杂牌"], key=K(f"gc{i}"))
+                with c4:
+                    gv = None
+                    if gt == "普通明杠": gv = st.selectbox("被杠", [p for p in players if p != gw], key=K(f"gv{i}"))
+                gang_data.append({'doer': gw, 'type': gt, 'card': gc, 'victim': gv})
+
+        if fyw != "无/未现" and fyr == "被明杠" and fyt: gang_data.append(
+            {'doer': fyt, 'type': '责任明杠', 'card': '幺鸡', 'victim': fyw})
+        if fbw != "无/未现" and fbr == "被明杠" and fbt: gang_data.append(
+            {'doer': fbt, 'type': '责任明杠', 'card': '八筒', 'victim': fbw})
+
+        if fyw != "无/未现" and fyr == "被碰" and fyt:
+            if st.checkbox(f"幺鸡补杠 ({fyt})", key=K("yj_bu")):
+                gang_data.append({'doer': fyt, 'type': '补杠', 'card': '幺鸡', 'victim': None})
+        if fbw != "无/未现" and fbr == "被碰" and fbt:
+            if st.checkbox(f"八筒补杠 ({fbt})", key=K("b8_bu")):
+                gang_data.append({'doer': fbt, 'type': '补杠', 'card': '八筒', 'victim': None})
+
+        st.button("➕ 增加一条杠", key=K("add_gang"), on_click=add_gang_row)
+    draft()["gang"] = gang_data
+    st.session_state[K("gang_deps")] = gang_deps(first)
+
+
+# ================== 操作控制台 ==================
+@st.fragment
+@metrics.timed("console")
+def section_console(players, winners, method, loser, hu_shape, is_qing, special_events, ready_list,
+                    rules_config, fan_card, common_v, fan_unit, rules):
+    st.markdown('<div class="sticky-panel">', unsafe_allow_html=True)
+    st.markdown('<div class="action-bar">', unsafe_allow_html=True)
+    st.markdown('<div class="glass-header">⚡️ 操作台</div>', unsafe_allow_html=True)
+
+    c_a1, c_a2 = st.columns(2)
+    with c_a1:
+        settle = st.button("💰 试算", use_container_width=True, key=K("settle"))
+    with c_a2:
+        reset = st.button("🔄 重置", use_container_width=True, key=K("reset"))
+    confirm = st.button("✅ 记账 & 下一局", type="primary", use_container_width=True, key=K("confirm"))
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    if reset: next_round()
+
+    valid = True
+    if not winners: valid = False
+    if method == "点炮" and not loser: valid = False
+
+    if settle or confirm:
+        if not valid:
+            st.error("❌ 信息不完整：请检查胡牌者/点炮者")
+        else:
+            # 其余片段可能刚单独重跑过，输入以草稿为准
+            d = draft()
+            fyw, fyr, fyt, fbw, fbr, fbt = d["first"]
+            extra_yj, extra_b8 = d["extra"]
+            hand_total_counts, gang_data = d["hand"], d["gang"]
+            violations = check_round(players, winners, method, fan_card, hand_total_counts, fyw, fyr, fyt,
+                                     fbw, fbr, fbt, extra_yj, extra_b8, gang_data)
+            if violations:
+                # 一次列出全部问题，不必改一处试算一次
+                st.error("\n\n".join(v.message for v in violations))
             else:
-                pass
+                try:
+                    # ⚠️ 关键修正：从侧边栏的 rules_config 传入逻辑，而不是硬编码
+                    final_txs = get_settlement_cache().settle(
+                        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
+                        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+                        hand_total_counts, gang_data, common_v, fan_unit
+                    )
+                    scores, details = aggregate_transactions(players, final_txs)
 
-    scores = {p: 0 for p in players}
-    details = {p: [] for p in players}
-    for tx in final:
-        scores[tx.receiver] += tx.amount
-        scores[tx.payer] -= tx.amount
-        details[tx.receiver].append(f"{tx.reason}: +{tx.amount} ({tx.payer})")
-        details[tx.payer].append(f"{tx.reason}: -{tx.amount} ({tx.receiver})")
+                    with st.container(border=True):
+                        ui_section("结算", "🧾")
+                        cols_s = st.columns(2)
+                        for i, p in enumerate(players):
+                            s = scores[p]
+                            color = "green" if s > 0 else "red" if s < 0 else "off"
+                            cols_s[i % 2].metric(p, int(s), delta=int(s))
 
-    return scores, details
+                        st.caption("转账流水")
+                        render_transfers(min_transfers(scores).transfers)
 
+                        with st.expander("📄 查看详细账单"):
+                            for p in players:
+                                if details[p]:
+                                    st.markdown(f"**{p}**")
+                                    for line in details[p]:
+                                        color = "red" if ": -" in line else "green"
+                                        st.markdown(f"- :{color}[{line}]")
+
+                    summary = f"{' & '.join(winners)} {method}" + (f" ({loser})" if loser else "")
+                    event = RoundInput(players, winners, method, loser, hu_shape, is_qing, special_events, fan_card,
+                                       ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+                                       hand_total_counts, gang_data)
+                    if confirm:
+                        try:
+                            record_round(summary, players, scores, final_txs, (event, rules))
+                        except VersionConflict as e:
+                            # 别的设备先记了这一局：整页重跑换到新局
+                            st.session_state["flash"], st.session_state["flash_icon"] = str(e), "⚠️"
+                            st.rerun(scope="app")
+                        # 提示留到下一次整页运行再弹出，不阻塞脚本线程
+                        st.session_state["flash"] = "✅ 已记账！"
+                        next_round()
+                    else:
+                        get_table(st.session_state["session_id"]).put_draft(
+                            st.session_state["last_round"] + 1, st.session_state["device"], summary, event.to_dict())
+
+                except ValueError as e:
+                    st.error(str(e))
+
+    if valid:
+        with lazy_expander("🔮 假如…", K("wi_open")) as shown:
+            if shown: render_what_if(players, winners, method, loser, hu_shape, is_qing, special_events,
+                                   ready_list, fan_card, rules)
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def render_what_if(players, winners, method, loser, hu_shape, is_qing, special_events, ready_list, fan_card, rules):
+    """勾选尚未确定的项，穷举后给出每人得分范围"""
+    c1, c2, c3 = st.columns(3)
+    any_fan = c1.checkbox("翻牌未定", key=K("wi_fan"))
+    any_yj = c2.checkbox("1条未定", key=K("wi_yj"))
+    any_b8 = c3.checkbox("8筒未定", key=K("wi_b8"))
+    unknown = st.multiselect("听牌未定", [p for p in players if p not in winners], key=K("wi_ready"))
+    if not (any_fan or any_yj or any_b8 or unknown):
+        st.caption("勾选未定项后按全部可能情形推演")
+        return
+    d = draft()
+    fyw, fyr, fyt, fbw, fbr, fbt = d["first"]
+    base = RoundInput(players, winners, method, loser, hu_shape, is_qing, special_events, fan_card, ready_list,
+                      fyw, fyr, fyt, fbw, fbr, fbt, *d["extra"], d["hand"], d["gang"])
+    res = what_if(
+        base, rules, FAN_CARDS if any_fan else None,
+        tile_outcomes(players, winners, None if fyw == NO_WHO else fyw) if any_yj else None,
+        tile_outcomes(players, winners, None if fbw == NO_WHO else fbw) if any_b8 else None,
+        unknown)
+    if not res.total:
+        st.warning("没有符合校验的情形")
+        return
+    summary = res.summary()
+    import pandas as pd
+    st.dataframe(pd.DataFrame([[lo, round(avg, 1), hi] for lo, avg, hi in summary.values()],
+                              index=list(summary), columns=["最少", "平均", "最多"]), use_container_width=True)
+    st.caption(f"{res.total} 种情形（剪除 {res.pruned} 种不合规的）· {res.elapsed * 1000:.0f} ms")
 
-# ==============================================================================
-# UI (V45 - 全功能回归 + iOS优化)
-# ==============================================================================
 
 def main():
     st.set_page_config(page_title="捉鸡Pro", page_icon="🀄", layout="wide", initial_sidebar_state="collapsed")
+    st.html(app_style())  # 仅含 <style>，放进事件容器，不占版面
     init_app_state()
 
-    main_round = st.session_state["main_round"]
-
-    # --- UI 辅助函数 (已找回) ---
-    def ui_section(title: str, icon: str = "", caption: Optional[str] = None):
-        cap_html = f'<span class="glass-caption">{caption}</span>' if caption else ""
-        st.markdown(f'<div class="glass-header"><span class="glass-header-icon">{icon}</span> {title}{cap_html}</div>',
-                    unsafe_allow_html=True)
-
-    def ui_divider(label: Optional[str] = None):
-        if label:
-            st.markdown(f'<div class="ui-divider"><span>{label}</span></div>', unsafe_allow_html=True)
-        else:
-            st.markdown('<div class="ui-divider" style="margin-top:10px;"></div>', unsafe_allow_html=True)
+    store, sid = get_ledger_store(), st.session_state["session_id"]
+    # 本次整页运行会重画杠牌登记区，首出片段无需再触发整页重跑
+    st.session_state[K("gang_deps")] = None
+    flash = st.session_state.pop("flash", None)
+    if flash: st.toast(flash, icon=st.session_state.pop("flash_icon", "💾"))
+    sync_table(get_table(sid).poll())
+    prune_round_state()
 
-    K = lambda s: f"main_{main_round}_{s}"
+    debug = debug_mode()
 
     # --- 侧边栏：恢复全局设置与规则 ---
-    with st.sidebar:
+    with metrics.section("sidebar"), st.sidebar:
         st.markdown("### ⚙️ 全局设置")
         # 1. 玩家改名
         with st.expander("👥 玩家署名", expanded=True):
+            st.number_input("人数", 2, MAX_SEATS, len(st.session_state.p_names), key="n_seats",
+                            on_change=set_seat_count, disabled=st.session_state["n_rounds"] > 0,
+                            help="本场已记账后人数固定；换人数请开新场次")
             new_names = []
             for i, n in enumerate(st.session_state.p_names):
                 new_names.append(st.text_input(f"座位 {i + 1}", n, key=f"pn_{i}"))
@@ -321,88 +689,59 @@ def main():
         # 4. 翻鸡单位
         with st.expander("🖐️ 翻鸡单位", expanded=False):
             fan_unit = st.number_input("互斥单位分", 1)
+        rules = Rules(rules_config, base_yj, mul_yj, base_b8, mul_b8, fan_unit)
 
         st.divider()
 
         # 5. 历史记录与导出 (保留之前的逻辑)
         st.markdown("### 📜 历史记录")
-        ledger = st.session_state["ledger_data"]
-
-        if ledger:
-            # 导出
-            df = pd.DataFrame([r['scores'] for r in ledger])
-            df.insert(0, "局", [r['round'] for r in ledger])
-            csv = df.to_csv(index=False).encode('utf-8-sig')
-            st.download_button("📥 导出表格", csv, "results.csv", "text/csv", use_container_width=True)
-
-            # 历史列表
-            for rec in reversed(ledger):
-                s_txt = " | ".join([f"{p}:{rec['scores'][p]}" for p in players])
-                label = f"第{rec['round']}局: {s_txt}"
-                with st.expander(label):
-                    st.caption(f"{rec['summary']}")
-                    for p in players:
-                        if rec['details'][p]:
-                            st.markdown(f"**{p}**")
-                            for l in rec['details'][p]: st.text(l)
+        n_rounds = st.session_state["n_rounds"]
+
+        if n_rounds:
+            # 面板展开/收起时重跑一次，折叠着就不查库、不画表（也就不导入 pandas）
+            with lazy_expander("📥 导出", "open_export") as shown:
+                if shown: render_export(store, sid, players)
+
+            st.button("↩️ 撤销上一局", use_container_width=True, on_click=undo_last_round)
+
+            with lazy_expander("💸 结账方案", "open_payout") as shown:
+                if shown: render_payout(players)
+
+            with lazy_expander("🔀 对账矩阵", "open_flows") as shown:
+                if shown: render_flows(store, sid, players)
+
+            with lazy_expander("📊 玩家统计", "open_stats") as shown:
+                if shown: render_stats(store, sid)
+
+            with lazy_expander("♻️ 按当前规则重算", "open_rescore") as shown:
+                if shown: render_rescore(store, sid, rules)
+                else: st.session_state.pop("rescore_plan", None)  # 收起即丢弃试算结果（含各局的新转账）
+
+            # 历史列表（分页，点开才加载明细）
+            render_history(store, sid)
         else:
             st.caption("暂无数据")
 
-    # --- CSS 样式 ---
-    st.markdown("""
-        <style>
-        /* iOS Optimization */
-        input, select, textarea, button { font-size: 16px !important; } 
-        div[data-baseweb="select"] > div { min-height: 44px; }
-        .stNumberInput input { min-height: 44px; }
-        .stButton button { min-height: 48px; border-radius: 12px !important; font-weight: bold !important; }
-        :root { --bg-dark: #0e1117; --glass: rgba(255, 255, 255, 0.05); --border: rgba(255, 255, 255, 0.1); }
-        .stApp { background-color: var(--bg-dark); }
-        .glass-header { 
-            font-size: 1.15rem; font-weight: 800; color: #fff; 
-            padding: 10px 0; margin-bottom: 8px; border-bottom: 1px solid var(--border);
-            display: flex; align-items: center; gap: 8px;
-        }
-        .mini-score-card {
-            background: var(--glass); border: 1px solid var(--border); border-radius: 12px;
-            padding: 8px 12px; text-align: center; margin-bottom: 8px;
-        }
-        .mini-score-val { font-size: 1.1rem; font-weight: 700; color: #4ed9ff; }
-        .mini-score-label { font-size: 0.75rem; color: #aaa; }
-        .chip { 
-            padding: 4px 10px; border-radius: 20px; font-size: 0.8rem; font-weight: 600;
-            background: var(--glass); border: 1px solid var(--border); color: #ccc;
-        }
-        .chip.ok { border-color: #00c853; color: #b9f6ca; background: rgba(0, 200, 83, 0.1); }
-        .chip.warn { border-color: #ffd600; color: #fff9c4; background: rgba(255, 214, 0, 0.1); }
-        .holo-ticket { padding: 12px 16px; margin-bottom: 10px; border-radius: 18px; background: rgba(255,255,255,0.05); border: 1px solid rgba(255,255,255,0.14); box-shadow: 0 4px 12px rgba(0,0,0,0.2); }
-        .tx-pay, .tx-get { font-weight:bold; } .tx-arrow { color: #888; margin: 0 8px; } .tx-amt-box { margin-left: auto; font-family: monospace; font-weight: bold; color: #4ed9ff; }
-        [data-testid="stVerticalBlockBorderWrapper"] { padding: 12px !important; border-radius: 16px !important; }
-        .block-container { padding-top: 2rem; padding-bottom: 3rem; }
-        .sticky-panel { position: sticky; top: 14px; z-index: 5; }
-        .action-bar { background: rgba(18,22,32,0.85); border: 1px solid rgba(255,255,255,0.14); border-radius: 20px; padding: 12px; backdrop-filter: blur(20px); margin-bottom: 14px; }
-        # footer {visibility: hidden;}
-        </style>
-    """, unsafe_allow_html=True)
+        if debug:
+            with st.expander("🛠 性能", expanded=True):
+                render_debug()
 
     # --- 顶部迷你计分板 ---
-    total_scores = {p: 0 for p in players}
-    for r in st.session_state["ledger_data"]:
-        for p, s in r['scores'].items(): total_scores[p] += s
+    total_scores = dict(zip(players, st.session_state["totals"]))
 
-    cols_top = st.columns(4)
-    for i, p in enumerate(players):
-        with cols_top[i]:
+    for p, col in zip(players, seat_columns(players)):
+        with col:
             val = total_scores[p]
             color = "#ff4b4b" if val < 0 else "#00c853" if val > 0 else "#aaa"
             st.markdown(
                 f"""<div class="mini-score-card"><div class="mini-score-label">{p}</div><div class="mini-score-val" style="color:{color}">{val}</div></div>""",
                 unsafe_allow_html=True)
+    watch_table(sid)
 
     # --- 主界面 ---
     left, right = st.columns([1.3, 0.7], gap="large")
 
-    with left:
+    with metrics.section("entry"), left:
         # 1. 胜负
         with st.container(border=True):
             ui_section("本局胜负", "🏆")
@@ -445,192 +784,22 @@ def main():
 
         # 3. 首出 (动态计算常鸡价值)
         common_v = build_common_chicken_cfg(base_yj, mul_yj, base_b8, mul_b8, fan_card)
-
-        with st.container(border=True):
-            ui_section(f"首出 (1条:{common_v['幺鸡']} / 8筒:{common_v['八筒']})", "🚀")
-            if st.session_state.get(K("fyr")) == "被胡" and st.session_state.get(K("fbr")) == "被胡": st.session_state[
-                K("fbr")] = "安全"
-
-            c1, c2 = st.columns([1, 2])
-            with c1:
-                fyw = st.selectbox("1条 首出", ["无/未现"] + players, key=K("fyw"))
-            fyr, fyt = "安全", None
-            if fyw != "无/未现":
-                with c2:
-                    opts = ["安全", "被碰", "被明杠", "被胡"]
-                    if method == "自摸" or st.session_state.get(K("fbr")) == "被胡": opts = ["安全", "被碰", "被明杠"]
-                    fyr = st.radio("1条 结局", opts, horizontal=True, key=K("fyr"))
-                    if fyr == "被胡":
-                        fyt = [w for w in winners if w in players]
-                        st.caption(f"-> {','.join(fyt) if fyt else '?'}")
-                    elif fyr != "安全":
-                        fyt = st.selectbox("被谁?", [p for p in players if p != fyw], key=K("fyt"))
-
-            st.markdown("---")
-            c3, c4 = st.columns([1, 2])
-            with c3:
-                fbw = st.selectbox("8筒 首出", ["无/未现"] + players, key=K("fbw"))
-            fbr, fbt = "安全", None
-            if fbw != "无/未现":
-                with c4:
-                    opts = ["安全", "被碰", "被明杠", "被胡"]
-                    if method == "自摸" or st.session_state.get(K("fyr")) == "被胡": opts = ["安全", "被碰", "被明杠"]
-                    fbr = st.radio("8筒 结局", opts, horizontal=True, key=K("fbr"))
-                    if fbr == "被胡":
-                        fbt = [w for w in winners if w in players]
-                        st.caption(f"-> {','.join(fbt) if fbt else '?'}")
-                    elif fbr != "安全":
-                        fbt = st.selectbox("被谁?", [p for p in players if p != fbw], key=K("fbt"))
+        section_first_discard(players, winners, method, common_v)
 
         # 4. 常鸡
-        with st.container(border=True):
-            ui_section("常鸡 (非首出)", "🔢")
-            extra_yj, extra_b8 = {}, {}
-            cols = st.columns(4)
-            for i, p in enumerate(players):
-                with cols[i]:
-                    st.caption(f"**{p}**")
-                    extra_yj[p] = st.number_input(f"1条", 0, 4, 0, key=K(f"ey_{i}"), label_visibility="collapsed")
-                    extra_b8[p] = st.number_input(f"8筒", 0, 4, 0, key=K(f"eb_{i}"), label_visibility="collapsed")
+        section_extra(players)
 
         # 5. 翻鸡
-        with st.container(border=True):
-            ui_section("翻鸡 (手牌+桌面)", "🖐️")
-            hand_total_counts = {}
-            if fan_card in ["9条", "7筒"]:
-                st.info("翻倍鸡规则：不互斥")
-            else:
-                cols = st.columns(4)
-                for i, p in enumerate(players):
-                    with cols[i]:
-                        st.caption(f"**{p}**")
-                        hand_total_counts[p] = st.number_input(f"fc", 0, 4, 0, key=K(f"fc_{i}"),
-                                                               label_visibility="collapsed")
+        section_fan(players, fan_card)
 
         # 6. 杠牌
-        with st.container(border=True):
-            ui_section("杠牌登记", "🛠️")
-            gang_data = []
-
-            auto_gangs = []
-            if fyw != "无/未现" and fyr == "被明杠" and fyt: auto_gangs.append(f"{fyt} 杠 {fyw} (幺鸡)")
-            if fbw != "无/未现" and fbr == "被明杠" and fbt: auto_gangs.append(f"{fbt} 杠 {fbw} (八筒)")
-            if auto_gangs:
-                for ag in auto_gangs: st.info(f"⚡ 自动: {ag}")
-
-            for i in range(st.session_state.gang_rows):
-                c1, c2, c3, c4 = st.columns([1.5, 1.5, 1.5, 1.5])
-                with c1:
-                    gw = st.selectbox("杠主", ["无"] + players, key=K(f"gw{i}"))
-                if gw != "无":
-                    with c2:
-                        gt = st.selectbox("类型", ["暗杠", "补杠", "普通明杠"], key=K(f"gt{i}"))
-                    with c3:
-                        gc = st.selectbox("牌", ["杂牌", "幺鸡", "八筒"] if gt != "补杠" else ["杂牌"], key=K(f"gc{i}"))
-                    with c4:
-                        gv = None
-                        if gt == "普通明杠": gv = st.selectbox("被杠", [p for p in players if p != gw], key=K(f"gv{i}"))
-                    gang_data.append({'doer': gw, 'type': gt, 'card': gc, 'victim': gv})
-
-            if fyw != "无/未现" and fyr == "被明杠" and fyt: gang_data.append(
-                {'doer': fyt, 'type': '责任明杠', 'card': '幺鸡', 'victim': fyw})
-            if fbw != "无/未现" and fbr == "被明杠" and fbt: gang_data.append(
-                {'doer': fbt, 'type': '责任明杠', 'card': '八筒', 'victim': fbw})
-
-            if fyw != "无/未现" and fyr == "被碰" and fyt:
-                if st.checkbox(f"幺鸡补杠 ({fyt})", key=K("yj_bu")):
-                    gang_data.append({'doer': fyt, 'type': '补杠', 'card': '幺鸡', 'victim': None})
-            if fbw != "无/未现" and fbr == "被碰" and fbt:
-                if st.checkbox(f"八筒补杠 ({fbt})", key=K("b8_bu")):
-                    gang_data.append({'doer': fbt, 'type': '补杠', 'card': '八筒', 'victim': None})
-
-            if st.button("➕ 增加一条杠", key=K("add_gang")):
-                st.session_state.gang_rows += 1
-                st.rerun()
+        section_gang(players)
 
-    # ================== 操作控制台 ==================
     with right:
-        st.markdown('<div class="sticky-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="action-bar">', unsafe_allow_html=True)
-        st.markdown('<div class="glass-header">⚡️ 操作台</div>', unsafe_allow_html=True)
-
-        c_a1, c_a2 = st.columns(2)
-        with c_a1:
-            settle = st.button("💰 试算", use_container_width=True, key=K("settle"))
-        with c_a2:
-            reset = st.button("🔄 重置", use_container_width=True, key=K("reset"))
-        confirm = st.button("✅ 记账 & 下一局", type="primary", use_container_width=True, key=K("confirm"))
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        if reset: next_round()
-
-        valid = True
-        if not winners: valid = False
-        if method == "点炮" and not loser: valid = False
-
-        if settle or confirm:
-            if not valid:
-                st.error("❌ 信息不完整：请检查胡牌者/点炮者")
-            else:
-                try:
-                    # ⚠️ 关键修正：从侧边栏的 rules_config 传入逻辑，而不是硬编码
-                    scores, details = calculate_all_pipeline(
-                        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
-                        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
-                        hand_total_counts, gang_data, common_v, fan_unit
-                    )
-
-                    with st.container(border=True):
-                        ui_section("结算", "🧾")
-                        cols_s = st.columns(2)
-                        for i, p in enumerate(players):
-                            s = scores[p]
-                            color = "green" if s > 0 else "red" if s < 0 else "off"
-                            cols_s[i % 2].metric(p, int(s), delta=int(s))
-
-                        st.caption("转账流水")
-                        cred = sorted([[k, v] for k, v in scores.items() if v > 0], key=lambda x: x[1], reverse=True)
-                        debt = sorted([[k, -v] for k, v in scores.items() if v < 0], key=lambda x: x[1], reverse=True)
-                        i, j = 0, 0
-                        while i < len(debt) and j < len(cred):
-                            dn, da = debt[i];
-                            cn, ca = cred[j]
-                            amt = min(da, ca)
-                            if amt > 0:
-                                st.markdown(
-                                    f"**{dn}** ➜ **{cn}** : <span style='color:#4ed9ff; font-weight:bold'>¥{int(amt)}</span>",
-                                    unsafe_allow_html=True)
-                            debt[i][1] -= amt;
-                            cred[j][1] -= amt
-                            if debt[i][1] < 0.1: i += 1
-                            if cred[j][1] < 0.1: j += 1
-
-                        with st.expander("📄 查看详细账单"):
-                            for p in players:
-                                if details[p]:
-                                    st.markdown(f"**{p}**")
-                                    for line in details[p]:
-                                        color = "red" if ": -" in line else "green"
-                                        st.markdown(f"- :{color}[{line}]")
-
-                    if confirm:
-                        summary = f"{' & '.join(winners)} {method}" + (f" ({loser})" if loser else "")
-                        rec = {
-                            "round": main_round + 1,
-                            "summary": summary,
-                            "scores": scores,
-                            "details": details
-                        }
-                        st.session_state["ledger_data"].append(rec)
-                        st.toast("✅ 已记账！", icon="💾")
-                        time.sleep(0.8)
-                        next_round()
-
-                except ValueError as e:
-                    st.error(str(e))
-
-        st.markdown('</div>', unsafe_allow_html=True)
+        section_console(players, winners, method, loser, hu_shape, is_qing, special_events, ready_list,
+                        rules_config, fan_card, common_v, fan_unit, rules)
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.section("rerun"):
+        main()
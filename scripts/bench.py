@@ -0,0 +1,265 @@
+"""基准套件：固定种子的五类牌局语料，量内核、校验、账本、导出与整页重跑，结果存 JSON 并可与基线对比。
+
+    python scripts/bench.py run -o bench.json [--rounds 2000] [--repeat 7] [--seed 1] [--only pipeline,ledger] [--no-app]
+    python scripts/bench.py compare bench.json [--baseline scripts/bench_baseline.json] [--threshold 0.3]
+
+语料（每类 --rounds 局，随机流只取决于种子与语料名）：
+    zimo          单人自摸，无杠，首出多为安全
+    multi_win     点炮一炮多响
+    heavy_gang    每局多达 6 个杂牌杠，首出常被碰/被明杠并补杠
+    liable_gang   常鸡首出必现，被碰补杠或被明杠（责任明杠）
+    not_ready     非胡牌者全部未听牌，可包赔的转账反向
+微基准取 --repeat 次里最快的一次（本机噪声大，最小值最稳）；整页重跑取中位数。
+compare 只比两边都有的指标，变差超过阈值的标出并以退出码 1 结束，便于接进 CI。
+基线与机器相关，换机器后先用 run -o scripts/bench_baseline.json 重新生成。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from zhuoji import Rules, RoundInput, calculate_all_pipeline, score_round  # noqa: E402
+from zhuoji.kernel import validate_consistency, validate_objective_facts  # noqa: E402
+from zhuoji.export import export_bytes, parquet_available  # noqa: E402
+from zhuoji.fuzz import mutate  # noqa: E402
+from zhuoji.ledger import LedgerStore  # noqa: E402
+from zhuoji.simulate import PLAYERS, SimProfile, random_round  # noqa: E402
+
+BASELINE = os.path.join(ROOT, "scripts", "bench_baseline.json")
+SUITES = ("pipeline", "validate", "ledger", "export", "rerun")
+LEDGER_SIZES = (10, 100, 1000)
+
+CORPORA: Dict[str, SimProfile] = {
+    "zimo": SimProfile(p_zimo=1.0, p_event=0.0, first_weights=(1.0, 0.0, 0.0, 0.0), max_gangs=0),
+    "multi_win": SimProfile(p_zimo=0.0, p_multi_win=1.0),
+    "heavy_gang": SimProfile(first_weights=(0.2, 0.4, 0.4, 0.0), p_bu_gang=1.0, max_gangs=6),
+    "liable_gang": SimProfile(p_first_seen=1.0, first_weights=(0.0, 0.5, 0.5, 0.0), p_bu_gang=0.7),
+    "not_ready": SimProfile(p_ready=0.0, first_weights=(0.4, 0.3, 0.3, 0.0), p_bu_gang=0.5),
+}
+
+
+def corpus(name: str, n: int, seed: int) -> List[RoundInput]:
+    rng = random.Random(f"{seed}:{name}")
+    return [random_round(rng, CORPORA[name]) for _ in range(n)]
+
+
+def best(fn: Callable[[], object], repeat: int) -> float:
+    """repeat 次里最快的一次（秒）"""
+    out = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        out = min(out, time.perf_counter() - t)
+    return out
+
+
+def metric(value: float, unit: str, better: str) -> dict:
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+
+def pipeline_args(r: RoundInput, rules: Rules) -> tuple:
+    ready = r.players if r.ready_list is None else r.ready_list
+    return (r.players, r.winners, r.method, r.loser, r.hu_shape, r.is_qing, r.special_events, rules.rules_config,
+            r.fan_card, ready, r.fyw, r.fyr, r.fyt, r.fbw, r.fbr, r.fbt, r.extra_yj, r.extra_b8,
+            r.hand_total_counts, r.gang_data, rules.common_v(r.fan_card), rules.fan_unit)
+
+
+def bench_pipeline(corpora: Dict[str, List[RoundInput]], rules: Rules, repeat: int) -> dict:
+    out = {}
+    for name, rounds in corpora.items():
+        args = [pipeline_args(r, rules) for r in rounds]
+        sec = best(lambda: [calculate_all_pipeline(*a) for a in args], repeat)
+        out[f"pipeline/{name}"] = metric(len(args) / sec, "局/秒", "higher")
+    return out
+
+
+def bench_validate(corpora: Dict[str, List[RoundInput]], repeat: int) -> dict:
+    def run(rounds):
+        for r in rounds:
+            validate_objective_facts(r.players, r.fan_card, r.hand_total_counts, r.fyw, r.fyr, r.fyt,
+                                     r.fbw, r.fbr, r.fbt, r.extra_yj, r.extra_b8, r.gang_data)
+            validate_consistency(r.players, r.winners, r.method, r.fyw, r.fyr, r.fyt, r.fbw, r.fbr, r.fbt,
+                                 r.gang_data)
+
+    out = {f"validate/{name}": metric(best(lambda: run(rounds), repeat) / len(rounds) * 1e6, "µs/局", "lower")
+           for name, rounds in corpora.items()}
+
+    # 约一半不合法的语料：抛异常逐局报第一条 vs 结构化全量问题 vs 向量化整批
+    rng = random.Random("invalid")
+    bad = [mutate(rng, mutate(rng, r)) for rounds in corpora.values() for r in rounds]
+
+    def raising():
+        for r in bad:
+            try:
+                run([r])
+            except ValueError:
+                pass
+
+    def structured():
+        for r in bad: r.violations()
+
+    n = len(bad)
+    out["validate/invalid-raise"] = metric(best(raising, repeat) / n * 1e6, "µs/局", "lower")
+    out["validate/invalid-check"] = metric(best(structured, repeat) / n * 1e6, "µs/局", "lower")
+    try:
+        from zhuoji.vectorized import RoundBatch, batch_violations
+    except ImportError:
+        return out
+    batch = RoundBatch.from_rounds(bad)  # 列式批次通常已为结算建好，只计校验本身
+    out["validate/invalid-batch"] = metric(best(lambda: batch_violations(batch), repeat) / n * 1e6, "µs/局", "lower")
+    return out
+
+
+def ledger_records(rounds: List[RoundInput], rules: Rules) -> list:
+    records = []
+    for i, r in enumerate(rounds):
+        res = score_round(r, rules)
+        if res.error is not None: raise SystemExit(f"语料第 {i + 1} 局校验失败：{res.error}")
+        records.append((i + 1, f"{'、'.join(r.winners)} {r.method}", r.players, res.scores, res.transactions))
+    return records
+
+
+def bench_ledger(mixed: List[RoundInput], rules: Rules, repeat: int, suites) -> dict:
+    out = {}
+    tmp = tempfile.mkdtemp()
+    for n in LEDGER_SIZES:
+        records = ledger_records(mixed[:n], rules)
+        store = LedgerStore(os.path.join(tmp, f"ledger{n}.db"))
+        sid = f"bench{n}"
+        t = time.perf_counter()
+        store.append_rounds(sid, records)
+        append = time.perf_counter() - t
+        if "ledger" in suites:
+            # 侧边栏每次重跑读的汇总：累计分、按名字的余额、对账矩阵；scan 为不用汇总表时的全量重算
+            def aggregate():
+                store.totals(sid)
+                store.balances(sid)
+                store.session_flows(sid)
+
+            def scan():
+                acc = [0] * len(PLAYERS)
+                for r in store.iter_rounds(sid):
+                    for k, v in enumerate(r['scores'].values()): acc[k] += v
+
+            out[f"ledger/append/{n}"] = metric(append * 1e3, "ms", "lower")
+            out[f"ledger/aggregate/{n}"] = metric(best(aggregate, repeat) * 1e3, "ms", "lower")
+            out[f"ledger/scan/{n}"] = metric(best(scan, repeat) * 1e3, "ms", "lower")
+            # 统计面板：全场读累计表，近 50 局只汇总窗口内的计数行
+            out[f"ledger/stats/{n}"] = metric(best(lambda: store.stats(sid), repeat) * 1e3, "ms", "lower")
+            out[f"ledger/stats-window/{n}"] = metric(best(lambda: store.stats(sid, 50), repeat) * 1e3, "ms", "lower")
+        if "export" in suites:
+            fmts = ("csv", "jsonl", "parquet") if parquet_available() else ("csv", "jsonl")
+            for fmt in fmts:
+                for table in ("rounds", "transactions"):
+                    sec = best(lambda: export_bytes(store, sid, fmt, table, PLAYERS), repeat)
+                    key = f"export/{fmt}/{n}" if table == "rounds" else f"export/{fmt}-tx/{n}"
+                    out[key] = metric(sec * 1e3, "ms", "lower")
+        store.close()
+    return out
+
+
+def bench_rerun(rounds: int, repeat: int) -> dict:
+    from rerun_latency import measure
+    m = measure(os.path.join(ROOT, "app.py"), rounds, repeat)
+    return {f"rerun/{k}": metric(v, "ms", "lower") for k, v in m.items()}
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run(args) -> int:
+    suites = SUITES if not args.only else tuple(s.strip() for s in args.only.split(","))
+    unknown = set(suites) - set(SUITES)
+    if unknown: raise SystemExit(f"未知的基准项：{', '.join(sorted(unknown))}")
+    if args.no_app: suites = tuple(s for s in suites if s != "rerun")
+    rules = Rules()
+    t0 = time.perf_counter()
+
+    results = {}
+    if "pipeline" in suites or "validate" in suites:
+        corpora = {name: corpus(name, args.rounds, args.seed) for name in CORPORA}
+        if "pipeline" in suites: results.update(bench_pipeline(corpora, rules, args.repeat))
+        if "validate" in suites: results.update(bench_validate(corpora, args.repeat))
+    if "ledger" in suites or "export" in suites:
+        rng = random.Random(f"{args.seed}:ledger")
+        mixed = [random_round(rng, SimProfile()) for _ in range(max(LEDGER_SIZES))]
+        results.update(bench_ledger(mixed, rules, args.repeat, suites))
+    if "rerun" in suites:
+        results.update(bench_rerun(args.app_rounds, args.app_repeat))
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": git_rev(), "python": platform.python_version(),
+            "machine": platform.machine(), "cpus": os.cpu_count(), "seed": args.seed, "rounds": args.rounds,
+            "repeat": args.repeat, "elapsed": round(time.perf_counter() - t0, 1),
+        },
+        "results": results,
+    }
+    for name, m in results.items(): print(f"{name:28s} {m['value']:12.3f} {m['unit']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"已写入 {args.output}")
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.baseline, encoding="utf-8") as f: base = json.load(f)["results"]
+    with open(args.current, encoding="utf-8") as f: cur = json.load(f)["results"]
+    regressions = 0
+    print(f"{'指标':28s} {'基线':>12s} {'当前':>12s} {'变化':>8s}")
+    for name in sorted(set(base) & set(cur)):
+        b, c = base[name]["value"], cur[name]["value"]
+        # 统一成“越大越差”的比值：耗时看 当前/基线，吞吐看 基线/当前
+        worse = (c / b if base[name]["better"] == "lower" else b / c) if b and c else 1.0
+        flag = ""
+        if base[name]["unit"] == "ms" and max(b, c) < args.floor:
+            pass  # 亚毫秒级的差异主要是噪声
+        elif worse > 1 + args.threshold:
+            flag, regressions = "  ← 退步", regressions + 1
+        elif worse < 1 / (1 + args.threshold):
+            flag = "  提升"
+        print(f"{name:28s} {b:12.3f} {c:12.3f} {(c / b - 1) * 100 if b else 0:+7.1f}%{flag}")
+    for name in sorted(set(base) - set(cur)): print(f"{name:28s} 当前结果缺少此项")
+    for name in sorted(set(cur) - set(base)): print(f"{name:28s} 基线中没有，跳过")
+    if regressions: print(f"{regressions} 项退步超过 {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="捉鸡基准套件")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="运行基准")
+    r.add_argument("-o", "--output", help="结果 JSON 路径")
+    r.add_argument("--rounds", type=int, default=2000, help="每类语料的局数")
+    r.add_argument("--repeat", type=int, default=7, help="微基准重复次数，取最快")
+    r.add_argument("--seed", type=int, default=1)
+    r.add_argument("--only", help=f"逗号分隔，可选 {','.join(SUITES)}")
+    r.add_argument("--no-app", action="store_true", help="跳过 AppTest 整页重跑")
+    r.add_argument("--app-rounds", type=int, default=200, help="整页重跑时账本里的局数")
+    r.add_argument("--app-repeat", type=int, default=10)
+    c = sub.add_parser("compare", help="与基线对比，退步时退出码为 1")
+    c.add_argument("current")
+    c.add_argument("--baseline", default=BASELINE)
+    c.add_argument("--threshold", type=float, default=0.3, help="允许的变差比例")
+    c.add_argument("--floor", type=float, default=0.5, help="两边都低于此毫秒数的耗时不判退步")
+    args = ap.parse_args(argv)
+    return run(args) if args.cmd == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
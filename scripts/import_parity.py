@@ -0,0 +1,71 @@
+"""批量导入的回归检查：同一份语料分别用 -j 1 与 -j N 导入，错误报告与写进账本的局必须逐字一致。
+
+    python scripts/import_parity.py [--rounds 2000] [-j 2] [--seed 1]
+
+语料由 simulate.random_round 生成，约三成经 fuzz.mutate 篡改（多半校验不通过，覆盖错误报告里的问题列表），
+另混入几行字段有误的记录。多进程时结果要经 pickle 从子进程传回，这里比的就是这一来一回有没有走样。
+不一致时打印第一处差异并以退出码 1 结束。
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from zhuoji.fuzz import mutate  # noqa: E402
+from zhuoji.ledger import LedgerStore  # noqa: E402
+from zhuoji.simulate import PLAYERS, SimProfile, random_round  # noqa: E402
+
+SID = "parity"
+
+
+def corpus(path: str, n: int, seed: int):
+    rng, prof = random.Random(seed), SimProfile()
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            r = random_round(rng, prof, PLAYERS)
+            if rng.random() < 0.3: r = mutate(rng, r)
+            f.write(json.dumps(r.to_dict(), ensure_ascii=False) + "\n")
+            if i % 97 == 0: f.write('{"players": "玩家A", "winners": 3}\n')
+
+
+def run(src: str, jobs: int, tmp: str) -> tuple:
+    db, err = os.path.join(tmp, f"j{jobs}.db"), os.path.join(tmp, f"j{jobs}.errors.jsonl")
+    subprocess.run([sys.executable, "-m", "zhuoji.importer", db, SID, src, "-j", str(jobs), "--errors", err],
+                   cwd=ROOT, capture_output=True)
+    with open(err, encoding="utf-8") as f: errors = f.read().splitlines()
+    store = LedgerStore(db)
+    rounds = [(r["round"], r["summary"], r["scores"]) for r in store.iter_rounds(SID)]
+    txs = [(round_no, seq, t.astuple()) for _, round_no, seq, t in store.iter_transactions(SID)]
+    store.close()
+    return errors, rounds, txs
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="导入单进程/多进程一致性检查")
+    ap.add_argument("--rounds", type=int, default=2000)
+    ap.add_argument("-j", "--jobs", type=int, default=2)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp()
+    src = os.path.join(tmp, "rounds.jsonl")
+    corpus(src, args.rounds, args.seed)
+    one, many = run(src, 1, tmp), run(src, args.jobs, tmp)
+    for name, a, b in zip(("错误报告", "局", "转账"), one, many):
+        if a != b:
+            k = next((k for k, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+            print(f"{name}不一致（-j 1: {len(a)} 条，-j {args.jobs}: {len(b)} 条），第 {k + 1} 条：\n"
+                  f"  -j 1: {a[k] if k < len(a) else '缺'}\n  -j {args.jobs}: {b[k] if k < len(b) else '缺'}")
+            return 1
+    print(f"一致：{len(one[1])} 局、{len(one[2])} 笔转账、{len(one[0])} 条错误（-j 1 vs -j {args.jobs}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""结算服务压测：多条 keep-alive 连接并发打随机局，统计吞吐、客户端 p50/p99 与状态码，最后附上服务端 /stats。
+
+    python scripts/loadgen.py --serve -j 2 -c 64 -n 20000 --endpoint score
+    python scripts/loadgen.py --url 127.0.0.1:8765 -c 128 --seconds 10
+
+--serve 时先起一个子进程服务（其余服务参数照传），压完再关掉；否则压已有的服务。
+局由 zhuoji.simulate.random_round 生成，每条连接按顺序循环使用预先编码好的请求体。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from zhuoji.simulate import SimProfile, random_round, seat_names  # noqa: E402
+
+
+def payloads(n: int, seats: int, seed: int) -> list:
+    rng, prof, players = random.Random(seed), SimProfile(), seat_names(seats)
+    return [json.dumps(random_round(rng, prof, players).to_dict(), ensure_ascii=False).encode("utf-8")
+            for _ in range(n)]
+
+
+async def request(reader, writer, host: str, path: str, body: bytes = b"", method: str = "POST"):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b""): break
+        k, _, v = h.decode("latin-1").partition(":")
+        if k.lower() == "content-length": length = int(v)
+    return status, await reader.readexactly(length)
+
+
+async def client(host: str, port: int, path: str, bodies: list, offset: int, stop, lat: list, codes: dict):
+    reader, writer = await asyncio.open_connection(host, port)
+    k = offset
+    try:
+        while not stop():
+            t0 = time.perf_counter()
+            status, _ = await request(reader, writer, host, path, bodies[k % len(bodies)])
+            lat.append((time.perf_counter() - t0) * 1e3)
+            codes[status] = codes.get(status, 0) + 1
+            if status == 503: await asyncio.sleep(0.01)
+            k += 1
+    finally:
+        writer.close()
+
+
+async def run(args) -> dict:
+    host, _, port = args.url.partition(":")
+    port = int(port or 8765)
+    bodies = payloads(args.corpus, args.seats, args.seed)
+    lat, codes = [], {}
+    deadline = time.perf_counter() + args.seconds if args.seconds else None
+    stop = (lambda: time.perf_counter() >= deadline) if deadline else (lambda: len(lat) >= args.requests)
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(host, port, f"/{args.endpoint}", bodies, c * 97, stop, lat, codes)
+                           for c in range(args.concurrency)])
+    elapsed = time.perf_counter() - t0
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await request(reader, writer, host, "/stats", method="GET")
+    writer.close()
+    lat.sort()
+    q = lambda p: lat[min(len(lat) - 1, int(p * len(lat)))] if lat else 0.0
+    return {"requests": len(lat), "elapsed": elapsed, "rps": len(lat) / elapsed, "p50_ms": q(0.5),
+            "p99_ms": q(0.99), "codes": codes, "server": json.loads(body)}
+
+
+async def wait_port(host: str, port: int, timeout: float = 30.0):
+    end = time.perf_counter() + timeout
+    while True:
+        try:
+            _, w = await asyncio.open_connection(host, port)
+            w.close()
+            return
+        except OSError:
+            if time.perf_counter() > end: raise
+            await asyncio.sleep(0.1)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="结算服务压测")
+    ap.add_argument("--url", default="127.0.0.1:8765", help="host:port")
+    ap.add_argument("--endpoint", choices=["score", "settle", "validate"], default="score")
+    ap.add_argument("-c", "--concurrency", type=int, default=64, help="并发连接数")
+    ap.add_argument("-n", "--requests", type=int, default=20000, help="总请求数（给了 --seconds 时忽略）")
+    ap.add_argument("--seconds", type=float, help="按时长压测")
+    ap.add_argument("--corpus", type=int, default=2000, help="预生成的不同局数")
+    ap.add_argument("--seats", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true", help="以 JSON 输出")
+    ap.add_argument("--serve", action="store_true", help="先起一个服务子进程")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="--serve 时服务的进程数")
+    ap.add_argument("--batch", type=int, default=64, help="--serve 时每批最多请求数")
+    ap.add_argument("--delay-ms", type=float, default=2.0, help="--serve 时攒批最长等待")
+    ap.add_argument("--queue", type=int, default=2048, help="--serve 时排队上限")
+    args = ap.parse_args(argv)
+
+    proc = None
+    if args.serve:
+        host, _, port = args.url.partition(":")
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "zhuoji.service", "--host", host, "--port", port or "8765", "-j", str(args.jobs),
+             "--batch", str(args.batch), "--delay-ms", str(args.delay_ms), "--queue", str(args.queue)], cwd=ROOT)
+        asyncio.run(wait_port(host, int(port or 8765)))
+    try:
+        res = asyncio.run(run(args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+    if args.json:
+        print(json.dumps(res, ensure_ascii=False))
+        return 0
+    srv = res["server"]
+    ep = srv["endpoints"][args.endpoint]
+    print(f"{res['requests']} 请求 / {res['elapsed']:.1f}s = {res['rps']:,.0f} 请求/秒（{args.concurrency} 连接）")
+    print(f"客户端  p50 {res['p50_ms']:.2f}ms  p99 {res['p99_ms']:.2f}ms  状态码 {res['codes']}")
+    print(f"服务端  p50 {ep.get('p50_ms', 0):.2f}ms  p99 {ep.get('p99_ms', 0):.2f}ms  "
+          f"平均批大小 {srv['mean_batch']:.1f}  拒绝 {srv['rejected']}  ({srv['jobs']} 进程)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
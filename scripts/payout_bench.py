@@ -0,0 +1,65 @@
+"""结账方案基准：4–40 人的随机净输赢，统计耗时、笔数、下界差距与精确求解比例。
+
+    python scripts/payout_bench.py [--sizes 4,6,8,...] [--trials 20] [--budget 0.5] [--seed 7]
+
+净输赢按 5 分取整（与常见底分一致），取整后更容易出现零和子集，也是最优解与贪心差距最大的情形。
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from zhuoji.payout import min_transfers  # noqa: E402
+
+
+def random_balances(rng: random.Random, n: int, step: int = 5, spread: int = 60) -> dict:
+    v = [rng.randint(-spread, spread) * step for _ in range(n - 1)]
+    v.append(-sum(v))
+    return {f"P{i + 1}": x for i, x in enumerate(v)}
+
+
+def greedy_count(balances: dict) -> int:
+    """旧版“最大欠款对最大应收”一次贪心的笔数"""
+    debt = sorted([-v for v in balances.values() if v < 0], reverse=True)
+    cred = sorted([v for v in balances.values() if v > 0], reverse=True)
+    i = j = k = 0
+    while i < len(debt) and j < len(cred):
+        amt = min(debt[i], cred[j])
+        debt[i] -= amt
+        cred[j] -= amt
+        k += 1
+        if debt[i] == 0: i += 1
+        if cred[j] == 0: j += 1
+    return k
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="4,6,8,10,12,14,16,18,20,24,28,32,36,40")
+    ap.add_argument("--trials", type=int, default=20)
+    ap.add_argument("--budget", type=float, default=0.5)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'人数':>4} {'中位耗时ms':>10} {'最大耗时ms':>10} {'笔数':>6} {'贪心':>6} {'平均差距':>8} {'精确':>6}")
+    for n in map(int, args.sizes.split(",")):
+        times, counts, greedy, gaps, exact = [], [], [], [], 0
+        for _ in range(args.trials):
+            b = random_balances(rng, n)
+            plan = min_transfers(b, time_budget=args.budget)
+            times.append(plan.elapsed * 1000)
+            counts.append(len(plan.transfers))
+            greedy.append(greedy_count(b))
+            gaps.append(plan.gap)
+            exact += plan.exact
+        print(f"{n:>4} {statistics.median(times):>10.1f} {max(times):>10.1f} {statistics.mean(counts):>6.1f} "
+              f"{statistics.mean(greedy):>6.1f} {statistics.mean(gaps):>8.2f} {exact / args.trials:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
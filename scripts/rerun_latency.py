@@ -0,0 +1,80 @@
+"""测量 200 局场次下的整页重跑延迟（Streamlit AppTest 无界面运行）。
+
+    python scripts/rerun_latency.py [--app app.py] [--rounds 200] [--repeat 20]
+
+输出：整页运行中位数、录入一项常鸡后的重跑、点击试算的重跑、点击记账到下一局可用的耗时。
+AppTest 每次交互都会整页重跑，片段局部重跑的收益需在真实浏览器里观察；这里量的是整页成本的上限。
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from zhuoji import Rules, RoundInput, score_round  # noqa: E402
+from zhuoji.ledger import LedgerStore  # noqa: E402
+
+PLAYERS = ["玩家A", "玩家B", "玩家C", "玩家D"]
+SID = "bench200"
+
+
+def seed_ledger(path: str, n: int):
+    store = LedgerStore(path)
+    rules, records = Rules(), []
+    for i in range(n):
+        w = PLAYERS[i % 4]
+        r = RoundInput(PLAYERS, [w], "自摸", fyw=PLAYERS[(i + 1) % 4], extra_yj={PLAYERS[(i + 2) % 4]: 1})
+        res = score_round(r, rules)
+        records.append((i + 1, f"{w} 自摸", PLAYERS, res.scores, res.transactions))
+    store.append_rounds(SID, records)
+    store.close()
+
+
+def timed(fn) -> float:
+    t = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t) * 1000
+
+
+def measure(app: str, rounds: int = 200, repeat: int = 20) -> dict:
+    """返回各类重跑的中位数（毫秒）；账本建在临时目录"""
+    os.environ["ZHUOJI_LEDGER_DB"] = db = os.path.join(tempfile.mkdtemp(), "bench.db")
+    seed_ledger(db, rounds)
+
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(app, default_timeout=60)
+    at.query_params["s"] = SID
+    at.run()
+    key = lambda s: f"main_{at.session_state['main_round']}_{s}"
+    at.multiselect(key=key("winners")).set_value(["玩家A"]).run()
+
+    full = [timed(at.run) for _ in range(repeat)]
+    extra = [timed(lambda k=k: at.number_input(key=key("ey_1")).set_value(k % 3).run()) for k in range(repeat)]
+    settle = [timed(lambda: at.button(key=key("settle")).click().run()) for _ in range(repeat)]
+    confirm = timed(lambda: at.button(key=key("confirm")).click().run())
+    if at.exception: raise SystemExit(at.exception[0].message)
+
+    med = statistics.median
+    return {"full": med(full), "extra": med(extra), "settle": med(settle), "confirm": confirm}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    ap.add_argument("--rounds", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args(argv)
+
+    m = measure(args.app, args.rounds, args.repeat)
+    print(f"app={os.path.relpath(args.app, ROOT)} rounds={args.rounds}")
+    print(f"整页重跑     {m['full']:7.1f} ms")
+    print(f"改常鸡重跑   {m['extra']:7.1f} ms")
+    print(f"试算         {m['settle']:7.1f} ms")
+    print(f"记账→下一局  {m['confirm']:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""冷启动预算：在全新的解释器里量导入耗时与首屏，超出预算或加载了不该加载的重依赖时以退出码 1 结束。
+
+    python scripts/startup.py [--repeat 5] [--rounds 200] [--json]
+    python scripts/startup.py --kernel-ms 100 --app-ms 700 --first-ms 1600
+
+三项各在独立子进程里量 --repeat 次取中位数（先空跑一次写好字节码缓存，量的是进程冷、磁盘缓存热的启动）：
+    kernel   导入内核与无界面模块，不得加载 numpy / pandas / streamlit
+    app      import app（含 Streamlit 自身的导入），不得加载 pandas
+    first    账本里已有 --rounds 局时 AppTest 的首次整页运行，侧边栏面板全折叠，不得加载 pandas
+预算与机器相关，默认值按 1 核小容器留了约五成余量；模块检查与机器无关，任何机器上都应通过。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+from rerun_latency import SID, seed_ledger  # noqa: E402
+
+KERNEL_MODULES = "zhuoji, zhuoji.ledger, zhuoji.table, zhuoji.stats, zhuoji.payout, zhuoji.whatif, zhuoji.export"
+PROBES = {
+    "kernel": (f"import {KERNEL_MODULES}", ("numpy", "pandas", "streamlit")),
+    "app": ("import app", ("pandas",)),
+    "first": ("from streamlit.testing.v1 import AppTest\n"
+              "at = AppTest.from_file('app.py', default_timeout=60)\n"
+              f"at.query_params['s'] = {SID!r}\n"
+              "at.run()\n"
+              "if at.exception: raise SystemExit(at.exception[0].message)", ("pandas",)),
+}
+PROBE = """import json, sys, time
+t = time.perf_counter()
+{body}
+ms = (time.perf_counter() - t) * 1000
+print(json.dumps({{"ms": ms, "loaded": [m for m in {banned!r} if m in sys.modules]}}))
+"""
+
+
+def probe(name: str, env: dict) -> dict:
+    body, banned = PROBES[name]
+    out = subprocess.run([sys.executable, "-c", PROBE.format(body=body, banned=banned)], cwd=ROOT, env=env,
+                         capture_output=True, text=True)
+    if out.returncode: raise SystemExit(f"{name} 运行失败：\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(repeat: int = 5, rounds: int = 200) -> dict:
+    """各项的中位数毫秒与载入的违禁模块；账本建在临时目录"""
+    env = dict(os.environ, PYTHONPATH=ROOT, ZHUOJI_LEDGER_DB=os.path.join(tempfile.mkdtemp(), "startup.db"))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    seed_ledger(env["ZHUOJI_LEDGER_DB"], rounds)
+    res = {}
+    for name in PROBES:
+        probe(name, env)
+        runs = [probe(name, env) for _ in range(repeat)]
+        res[name] = {"ms": statistics.median(r["ms"] for r in runs),
+                     "loaded": sorted({m for r in runs for m in r["loaded"]})}
+    return res
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="冷启动预算检查")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--rounds", type=int, default=200, help="首屏时账本里的局数")
+    ap.add_argument("--kernel-ms", type=float, default=100, help="内核导入预算")
+    ap.add_argument("--app-ms", type=float, default=700, help="import app 预算")
+    ap.add_argument("--first-ms", type=float, default=1600, help="首次整页运行预算（含导入）")
+    ap.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = ap.parse_args(argv)
+
+    res = measure(args.repeat, args.rounds)
+    budget = {"kernel": args.kernel_ms, "app": args.app_ms, "first": args.first_ms}
+    failed = [n for n, r in res.items() if r["ms"] > budget[n] or r["loaded"]]
+    if args.json:
+        print(json.dumps({"results": res, "budget": budget, "failed": failed}, ensure_ascii=False))
+        return 1 if failed else 0
+    for name, r in res.items():
+        mark = "超出" if name in failed else "ok"
+        extra = f"  多载入 {','.join(r['loaded'])}" if r["loaded"] else ""
+        print(f"{name:<7}{r['ms']:8.1f} ms  / 预算 {budget[name]:6.0f} ms  {mark}{extra}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+"""捉鸡记账规则内核（无界面依赖），供 app.py、脚本与批处理共用。"""
+from .kernel import (
+    Transaction, parse_card, get_fan_multipliers, build_common_chicken_cfg,
+    validate_objective_facts, validate_consistency, Violation, check_round,
+    CATEGORIES, CATEGORY_LABELS, CompiledRules, compile_rules, settle_compiled, settle_scores, iter_settled,
+    settle_transactions, aggregate_scores, render_details, aggregate_transactions, calculate_all_pipeline,
+    FlowMatrix, empty_flows, add_flows, flow_matrix, settle_flows, net_flows, flow_scores,
+)
+from .cache import SettlementCache, round_fingerprint, rules_fingerprint
+from .rounds import DEFAULT_RULES_CONFIG, Rules, RoundInput, RoundResult, score_round, score_many
@@ -0,0 +1,90 @@
+"""结算结果缓存：按规范化的局指纹 + 规则指纹做有界 LRU。
+
+规范化只合并不影响结果的写法差异（为 0 的计数、听牌名单的顺序与重复、被胡对象写成字符串还是列表、
+杠表行的字典键顺序），命中时返回的流水与现算的逐条一致、顺序相同。列表顺序与额外鸡计数的键顺序
+会影响流水顺序，保持原样。
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .kernel import CompiledRules, Transaction, compile_rules, settle_compiled
+
+
+def _counts(m: Dict[str, int]) -> tuple:
+    # 不排序：额外鸡的流水按字典插入顺序产出
+    return tuple((k, v) for k, v in m.items() if v)
+
+
+def _target(res: str, t) -> Hashable:
+    if isinstance(t, list): return tuple(t)
+    if res == "被胡": return (t,) if t else ()
+    return t
+
+
+def round_fingerprint(players, winners, method, loser, hu_shape, is_qing, special_events,
+                      fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+                      hand_total_counts, gang_data) -> tuple:
+    """一局输入的规范化、可哈希表示；参数与 calculate_all_pipeline 相同（不含规则部分）"""
+    ready = set(ready_list) | set(winners)
+    return (
+        tuple(players), tuple(winners), method, loser, hu_shape, bool(is_qing), tuple(special_events),
+        fan_card, tuple(p in ready for p in players),
+        fyw, fyr, _target(fyr, fyt), fbw, fbr, _target(fbr, fbt),
+        _counts(extra_yj), _counts(extra_b8), tuple(hand_total_counts.get(p, 0) for p in players),
+        tuple((g['doer'], g['type'], g['card'], g['victim']) for g in gang_data),
+    )
+
+
+def rules_fingerprint(rules_config: Dict[str, int]) -> tuple:
+    return tuple(sorted(rules_config.items()))
+
+
+class SettlementCache:
+    """settle_transactions 的有界 LRU；校验失败（ValueError）同样缓存并重新抛出"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[tuple, Tuple[Optional[List[Transaction]], Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def settle(self, players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
+               fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+               hand_total_counts, gang_data, common_v, fan_unit) -> List[Transaction]:
+        """与 settle_transactions 同签名"""
+        return self.settle_compiled(
+            compile_rules(rules_config, common_v, fan_unit),
+            players, winners, method, loser, hu_shape, is_qing, special_events,
+            fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data
+        )
+
+    def settle_compiled(self, cr: CompiledRules, *round_args, checked: bool = False) -> List[Transaction]:
+        """与 settle_compiled 同签名；规则部分直接用编译结果的 key"""
+        key = (round_fingerprint(*round_args), cr.key)
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+        if hit is None:
+            try:
+                hit = (settle_compiled(cr, *round_args, checked=checked), None)
+            except ValueError as e:
+                hit = (None, str(e))
+            with self._lock:
+                self.misses += 1
+                self._data[key] = hit
+                if len(self._data) > self.maxsize: self._data.popitem(last=False)
+        txs, err = hit
+        if err is not None: raise ValueError(err)
+        return list(txs)
+
+    def info(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
@@ -0,0 +1,112 @@
+"""命令行批量结算：逐行读取 JSONL 局记录，逐行写出得分/流水。
+
+    python -m zhuoji rounds.jsonl -o scores.jsonl --rules rules.json --transactions --jobs 4
+
+输入每行一个 RoundInput 字段的 JSON 对象（可带 "round" 编号，原样回写）；
+rules.json 为 Rules 字段（rules_config / base_yj / mul_yj / base_b8 / mul_b8 / fan_unit）。
+出错的行写 "error"；人名字段里有 players 之外的名字时另带 "unknown": {字段: [名字]}，不结算。
+"""
+import argparse
+import json
+import sys
+from itertools import islice
+from typing import Dict, Iterator, Optional, Tuple
+
+from .cache import SettlementCache
+from .kernel import CompiledRules
+from .rounds import RoundInput, Rules, score_round, unknown_names_error
+
+_rules: Optional[Rules] = None
+_with_tx = False
+_compiled: Dict[str, CompiledRules] = {}
+_settle_cache: Optional[SettlementCache] = None
+
+
+def _init_worker(rules: Rules, with_tx: bool, dedupe: int = 0):
+    global _rules, _with_tx, _settle_cache
+    _rules, _with_tx = rules, with_tx
+    _settle_cache = SettlementCache(dedupe) if dedupe > 0 else None
+    _compiled.clear()
+
+
+def _score_line(item) -> Optional[Tuple[str, bool]]:
+    lineno, line = item
+    line = line.strip()
+    if not line: return None
+    out = {"line": lineno}
+    try:
+        d = json.loads(line)
+        if "round" in d: out["round"] = d["round"]
+        r = RoundInput.from_dict(d)
+        unknown = r.unknown_names()
+        if unknown:
+            out.update(error=unknown_names_error(unknown), unknown=unknown)
+            return json.dumps(out, ensure_ascii=False), True
+        cr = _compiled.get(r.fan_card)
+        if cr is None: cr = _compiled[r.fan_card] = _rules.compile(r.fan_card)
+        res = score_round(r, _rules, cr, _settle_cache, transactions=_with_tx or _settle_cache is not None)
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        out["error"] = str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"
+        return json.dumps(out, ensure_ascii=False), True
+    if res.error is not None:
+        out["error"] = res.error
+    else:
+        out["scores"] = res.scores
+        if _with_tx:
+            out["transactions"] = [[t.payer, t.receiver, t.amount, t.reason, t.category] for t in res.transactions]
+    return json.dumps(out, ensure_ascii=False), res.error is not None
+
+
+def iter_scored_lines(lines, rules: Rules, with_tx: bool = False, jobs: int = 1,
+                      chunksize: int = 512, dedupe: int = 0) -> Iterator[Tuple[str, bool]]:
+    """按输入顺序产出 (结果行, 是否出错)；多进程时按固定窗口分批投递，避免 Pool.imap 预读整个输入。
+    dedupe > 0 时每个进程用该容量的 SettlementCache 跳过重复局"""
+    numbered = enumerate(lines, 1)
+    if jobs <= 1:
+        _init_worker(rules, with_tx, dedupe)
+        for item in numbered:
+            out = _score_line(item)
+            if out is not None: yield out
+        return
+
+    from multiprocessing import Pool
+    window = jobs * chunksize * 4
+    with Pool(jobs, initializer=_init_worker, initargs=(rules, with_tx, dedupe)) as pool:
+        while True:
+            batch = list(islice(numbered, window))
+            if not batch: break
+            for out in pool.imap(_score_line, batch, chunksize):
+                if out is not None: yield out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m zhuoji", description="捉鸡批量结算 (JSONL)")
+    ap.add_argument("input", nargs="?", default="-", help="输入 JSONL，- 表示标准输入")
+    ap.add_argument("-o", "--output", default="-", help="输出 JSONL，- 表示标准输出")
+    ap.add_argument("--rules", help="规则 JSON 文件，缺省使用界面默认值")
+    ap.add_argument("--transactions", action="store_true", help="同时输出每局转账流水")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="并行进程数")
+    ap.add_argument("--dedupe", type=int, default=0, metavar="N", help="用容量 N 的指纹缓存跳过重复局")
+    args = ap.parse_args(argv)
+
+    rules = Rules()
+    if args.rules:
+        with open(args.rules, encoding="utf-8") as f:
+            rules = Rules.from_dict(json.load(f))
+
+    fin = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    fout = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    errors = 0
+    try:
+        for out, failed in iter_scored_lines(fin, rules, args.transactions, args.jobs, dedupe=args.dedupe):
+            errors += failed
+            fout.write(out + "\n")
+    finally:
+        if fin is not sys.stdin: fin.close()
+        if fout is not sys.stdout: fout.close()
+    if errors: print(f"{errors} 局校验失败", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
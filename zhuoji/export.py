@@ -0,0 +1,168 @@
+"""账本导出：CSV / Parquet / JSONL，逐批从 SQLite 读出并逐块编码，不在内存里拼整张表。
+
+    python -m zhuoji.export ledger.db 场次号 -f parquet -t transactions -o tx.parquet
+
+两张表：
+    rounds        每局一行：局号、摘要、各座位得分（列名为最新一局的座位名单；场次里人数有过变化时
+                  按出现过的最多座位数出列，多出的列名为“座位N”，人少的局留空）
+    transactions  每笔转账一行：局号、序号、付/收款人、金额、类别码与类别名、说明码与参数、说明文字
+CSV 表头用中文、带 BOM，方便直接用 Excel 打开；Parquet 与 JSONL 用英文字段名，给分析任务用。
+Parquet 依赖 pyarrow（随 streamlit 安装），缺少时只提供另外两种格式。
+"""
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import sys
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .kernel import CATEGORIES
+from .ledger import LedgerStore
+
+FORMATS = {  # 格式 -> (MIME, 扩展名)
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+TABLES = {"rounds": "每局得分", "transactions": "转账流水"}
+
+# (字段名, CSV 表头, Arrow 类型名)
+TX_COLUMNS = [
+    ("round", "局", "int32"), ("seq", "序号", "int32"), ("payer", "付款人", "string"),
+    ("receiver", "收款人", "string"), ("amount", "金额", "int64"), ("cat", "类别码", "int8"),
+    ("category", "类别", "string"), ("code", "说明码", "int16"), ("args", "参数", "string"),
+    ("reason", "说明", "string"),
+]
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def columns(table: str, players: Sequence[str], n_seats: int = 0) -> List[Tuple[str, str, str]]:
+    """n_seats 大于名单人数时补上“座位N”列"""
+    if table == "transactions": return TX_COLUMNS
+    names = list(players) + [f"座位{i + 1}" for i in range(len(players), n_seats)]
+    return [("round", "局", "int32"), ("summary", "摘要", "string")] + [(p, p, "int64") for p in names]
+
+
+def iter_rows(store: LedgerStore, session: str, table: str, n_seats: int = 0) -> Iterator[tuple]:
+    """rounds 表每行补齐到 n_seats 个得分，人少的局多出的格为 None"""
+    if table == "transactions":
+        text = {}  # (说明码, 参数) -> (参数 JSON, 说明文字)，同一局面的说明大量重复
+        for _, round_no, seq, t in store.iter_transactions(session):
+            k = (t.code, t.args)
+            hit = text.get(k)
+            if hit is None: hit = text[k] = (json.dumps(t.args, ensure_ascii=False), t.reason)
+            yield (round_no, seq, t.payer, t.receiver, t.amount, t.cat, CATEGORIES[t.cat], t.code) + hit
+    else:
+        for r in store.iter_rounds(session):
+            scores = list(r['scores'].values())
+            yield (r['round'], r['summary'], *scores, *[None] * (n_seats - len(scores)))
+
+
+def _batches(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    buf = []
+    for row in rows:
+        buf.append(row)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf: yield buf
+
+
+def _iter_csv(cols, rows, batch: int) -> Iterator[bytes]:
+    out = io.StringIO()
+    w = csv.writer(out)
+    w.writerow([label for _, label, _ in cols])
+    yield "﻿".encode("utf-8") + out.getvalue().encode("utf-8")
+    for chunk in _batches(rows, batch):
+        out.seek(0)
+        out.truncate()
+        w.writerows(chunk)
+        yield out.getvalue().encode("utf-8")
+
+
+def _iter_jsonl(cols, rows, batch: int) -> Iterator[bytes]:
+    names = [name for name, _, _ in cols]
+    for chunk in _batches(rows, batch):
+        yield "".join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in chunk).encode("utf-8")
+
+
+class _Sink(io.RawIOBase):
+    """ParquetWriter 的输出端：攒下写入的字节，由调用方逐块取走"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        out = b"".join(self.parts)
+        self.parts.clear()
+        return out
+
+
+def _iter_parquet(cols, rows, batch: int) -> Iterator[bytes]:
+    """每批一个行组；字符串列字典编码，类别/人名重复度高，体积远小于 CSV"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, getattr(pa, kind)()) for name, _, kind in cols])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for chunk in _batches(rows, batch):
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=f.type) for col, f in zip(zip(*chunk), schema)], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(store: LedgerStore, session: str, fmt: str = "csv", table: str = "rounds",
+                players: Optional[Sequence[str]] = None, batch: int = 5000) -> Iterator[bytes]:
+    """逐块产出导出文件的字节；players 缺省为最新一局的座位名单"""
+    if fmt not in FORMATS: raise ValueError(f"不支持的导出格式: {fmt}")
+    if table not in TABLES: raise ValueError(f"不支持的导出表: {table}")
+    if players is None: players = list(store.balances(session))
+    n_seats = max(len(players), len(store.totals(session))) if table == "rounds" else 0  # 出现过的最多座位数
+    cols = columns(table, players, n_seats)
+    rows = iter_rows(store, session, table, n_seats)
+    if fmt == "csv": return _iter_csv(cols, rows, batch)
+    if fmt == "jsonl": return _iter_jsonl(cols, rows, batch)
+    return _iter_parquet(cols, rows, batch)
+
+
+def export_bytes(store: LedgerStore, session: str, fmt: str = "csv", table: str = "rounds",
+                 players: Optional[Sequence[str]] = None) -> bytes:
+    return b"".join(iter_export(store, session, fmt, table, players))
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m zhuoji.export", description="导出账本")
+    ap.add_argument("db", help="SQLite 账本路径")
+    ap.add_argument("session", help="场次号（网址里的 ?s=）")
+    ap.add_argument("-f", "--format", choices=list(FORMATS), default="csv")
+    ap.add_argument("-t", "--table", choices=list(TABLES), default="rounds")
+    ap.add_argument("-o", "--output", default="-", help="输出文件，- 表示标准输出")
+    args = ap.parse_args(argv)
+
+    store = LedgerStore(args.db)
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in iter_export(store, args.session, args.format, args.table): out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer: out.close()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
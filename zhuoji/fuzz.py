@@ -0,0 +1,334 @@
+"""结算内核的不变量模糊测试：多进程随机生成牌局，逐局检查 calculate_all_pipeline 的输出。
+
+    python -m zhuoji.fuzz --rounds 2000000 --jobs 8 [--seconds 60] [--seed 1] [--fixtures fuzz_fixtures]
+    python -m zhuoji.fuzz --replay fuzz_fixtures
+
+检查项：
+    oracle         逐笔流水（付/收/金额/说明/类别）与报错文字都与 zhuoji.reference（原始慢速实现）一致；
+                   calculate_all_pipeline 的得分与明细由流水逐笔汇总，流水一致即输出一致
+    zero_sum       得分合计为 0
+    unready        未听牌者不收任何钱（包赔是反向付款）
+    zero_income    热炮/抢杠胡的点炮者本局不收钱；未听牌者退给他的包赔不算收入（与原规则一致）
+    fan_symmetry   翻鸡互斥按张数差两两对称：每人的翻鸡净额等于按公式逐对算出的值
+    seat_order     换座次（玩家顺序）后按人名的得分不变
+    direct         kernel.settle_scores（不生成流水的直接算分）与逐笔汇总一致
+    crash          抛出 ValueError 以外的异常
+大部分局由 simulate.random_round 按随机抽取的分布参数生成（构造即合法，约四成批次为 2–8 人）；另有一部分在合法局上随机篡改
+字段，可能不合法，只要求与参照实现一致（同样报错或同样结果）。规则每批随机抽取，含底分为 0 等边界。
+失败的局逐项化简（删杠、删事件、清首出、规则还原默认……）直到再删任何一项都不再触发同一检查，
+存成 JSON 夹具；--replay 重跑目录下全部夹具，作为回归测试。
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import reference
+from .kernel import CAT_FAN, R_REVERSED, aggregate_scores, settle_scores, settle_transactions
+from .rounds import DEFAULT_RULES_CONFIG, Rules, RoundInput
+from .simulate import FAN_CARDS, PLAYERS, SHAPES, SimProfile, chunk_seeds, random_round
+
+Failure = Tuple[str, str]  # (检查项, 说明)
+
+TILES = ("幺鸡", "八筒")
+RESULTS = ["安全", "被碰", "被明杠", "被胡"]
+GANG_TYPES = ["暗杠", "补杠", "普通明杠", "责任明杠"]
+EVENTS = ["报听胡", "杀报", "天胡", "地胡", "杠上花", "热炮", "抢杠胡"]
+BATCH = 64  # 每批共用一组分布参数、规则与座位数
+SEATS = [f"P{k}" for k in range(8)]
+SEAT_COUNTS = (2, 3, 5, 6, 8)  # 其余批次为 4 人
+
+
+# -------------------------------
+# 1. 生成
+# -------------------------------
+def random_profile(rng: random.Random) -> SimProfile:
+    w = [rng.random() for _ in RESULTS]
+    return SimProfile(
+        p_zimo=rng.random(), p_multi_win=rng.choice([0.0, 0.3, 1.0]), p_qing=rng.random() * 0.5,
+        p_event=rng.random(), p_fan=rng.random(), p_ready=rng.choice([0.0, 0.5, 1.0, rng.random()]),
+        p_first_seen=rng.random(), first_weights=tuple(w), p_bu_gang=rng.random(),
+        p_extra=rng.random(), p_hand=rng.random(), max_gangs=rng.randint(0, 6),
+    )
+
+
+def random_rules(rng: random.Random) -> Rules:
+    rules = Rules(base_yj=rng.choice([0, 1, 2, 3]), mul_yj=rng.choice([1, 2]), base_b8=rng.choice([0, 1, 2, 3]),
+                  mul_b8=rng.choice([1, 2]), fan_unit=rng.choice([0, 1, 2, 5]))
+    for k in rng.sample(list(DEFAULT_RULES_CONFIG), 3): rules.rules_config[k] = rng.choice([0, 1, 5, 10, 100])
+    return rules
+
+
+def mutate(rng: random.Random, r: RoundInput) -> RoundInput:
+    """随机篡改 1–3 个字段，结果可能不合法"""
+    r = RoundInput.from_dict(json.loads(json.dumps(r.to_dict())))
+    players = r.players
+    for _ in range(rng.randint(1, 3)):
+        k = rng.randrange(7)
+        if k == 0:
+            tile = rng.choice(TILES)
+            who, res = rng.choice(["无/未现"] + players), rng.choice(RESULTS)
+            tar = list(r.winners) if res == "被胡" else rng.choice([None] + players)
+            if tile == "幺鸡": r.fyw, r.fyr, r.fyt = who, res, tar
+            else: r.fbw, r.fbr, r.fbt = who, res, tar
+        elif k == 1:
+            r.gang_data.append({'doer': rng.choice(players), 'type': rng.choice(GANG_TYPES),
+                                'card': rng.choice(TILES + ("杂牌",)), 'victim': rng.choice([None] + players)})
+        elif k == 2 and r.gang_data:
+            r.gang_data.pop(rng.randrange(len(r.gang_data)))
+        elif k == 3:
+            getattr(r, rng.choice(["extra_yj", "extra_b8", "hand_total_counts"]))[rng.choice(players)] = rng.randint(0, 5)
+        elif k == 4:
+            r.special_events = rng.sample(EVENTS, rng.randint(0, 2))
+        elif k == 5:
+            r.fan_card = rng.choice([""] + FAN_CARDS)
+        else:
+            r.ready_list = rng.sample(players, rng.randint(0, len(players)))
+    return r
+
+
+# -------------------------------
+# 2. 检查
+# -------------------------------
+def _args(r: RoundInput, rules: Rules, players: Optional[List[str]] = None) -> tuple:
+    ready = r.players if r.ready_list is None else r.ready_list
+    return (players or r.players, r.winners, r.method, r.loser, r.hu_shape, r.is_qing, r.special_events,
+            rules.rules_config, r.fan_card, ready, r.fyw, r.fyr, r.fyt, r.fbw, r.fbr, r.fbt, r.extra_yj, r.extra_b8,
+            r.hand_total_counts, r.gang_data, rules.common_v(r.fan_card), rules.fan_unit)
+
+
+def _run(fn, args):
+    try:
+        return fn(*args), None
+    except Exception as e:  # noqa: BLE001 — 任何异常都要与参照实现比对
+        return None, f"{type(e).__name__}: {e}"
+
+
+def check_round(r: RoundInput, rules: Rules, invariants: bool = True) -> Optional[Failure]:
+    """返回第一个不满足的检查项；invariants=False 时只与参照实现比对"""
+    args = _args(r, rules)
+    final, err = _run(settle_transactions, args)
+    want, want_err = _run(reference.settle_transactions, args)
+    if err and not err.startswith("ValueError"): return "crash", err
+    got = None if final is None else [(t.payer, t.receiver, t.amount, t.reason, t.category) for t in final]
+    if want is not None: want = [(t.payer, t.receiver, t.amount, t.reason, t.category) for t in want]
+    if (got, err) != (want, want_err):
+        if err or want_err: return "oracle", f"内核 {err or '通过'}，参照 {want_err or '通过'}"
+        diff = next(k for k, (a, b) in enumerate(zip(got + [None], want + [None])) if a != b)
+        return "oracle", f"第 {diff + 1} 笔：内核 {(got + [None])[diff]}，参照 {(want + [None])[diff]}"
+    if final is None or not invariants: return None
+
+    scores = aggregate_scores(r.players, final)
+    if sum(scores.values()) != 0: return "zero_sum", f"得分合计 {sum(scores.values())}"
+    ready = set(p for p in args[9] if p in r.players) | set(r.winners)
+    zero = {r.loser} if r.method == "点炮" and r.loser in ready and \
+        ("热炮" in r.special_events or "抢杠胡" in r.special_events) else set()
+    for tx in final:
+        if tx.receiver not in ready: return "unready", f"未听牌的 {tx.receiver} 收到 {tx.reason} {tx.amount}"
+        if tx.receiver in zero and not tx.code & R_REVERSED:
+            return "zero_income", f"点炮者 {tx.receiver} 收到 {tx.reason} {tx.amount}"
+
+    # 逐对：张数多的收 差×单位，收款人须听牌且不是零收入；不可包赔，收款人不合格时直接作废
+    fan = {p: 0 for p in r.players}
+    for tx in final:
+        if tx.cat == CAT_FAN:
+            fan[tx.receiver] += tx.amount
+            fan[tx.payer] -= tx.amount
+    c = {p: r.hand_total_counts.get(p, 0) for p in r.players}
+    expect = {p: 0 for p in r.players}
+    for i, p in enumerate(r.players):
+        for q in r.players[i + 1:]:
+            if c[p] == c[q]: continue
+            win, lose = (p, q) if c[p] > c[q] else (q, p)
+            if win in ready and win not in zero:
+                amt = abs(c[p] - c[q]) * rules.fan_unit
+                expect[win] += amt
+                expect[lose] -= amt
+    if fan != expect: return "fan_symmetry", f"翻鸡 {fan}，应为 {expect}"
+
+    direct = settle_scores(rules.compile(r.fan_card), *args[:7], *args[8:20])
+    if direct != scores: return "direct", f"直接算分 {direct}，逐笔汇总 {scores}"
+
+    perm = list(reversed(r.players))
+    alt, alt_err = _run(settle_transactions, _args(r, rules, perm))
+    if alt_err: return "seat_order", f"换座后报错 {alt_err}"
+    moved = aggregate_scores(perm, alt)
+    if moved != scores: return "seat_order", f"换座后 {moved}，原 {scores}"
+    return None
+
+
+def fuzz_chunk(n: int, seed: int, p_mutate: float = 0.2, deadline: float = 0.0,
+               max_failures: int = 5) -> Tuple[int, List[dict]]:
+    """检查 n 局，返回 (已检查局数, 失败样例)；deadline（time.time()）到了提前返回"""
+    rng = random.Random(seed)
+    done = 0
+    failures: List[dict] = []
+    while done < n:
+        if deadline and time.time() > deadline: break
+        prof, rules = random_profile(rng), random_rules(rng)
+        players = PLAYERS if rng.random() < 0.6 else SEATS[:rng.choice(SEAT_COUNTS)]
+        for _ in range(min(BATCH, n - done)):
+            r = random_round(rng, prof, players)
+            mutated = rng.random() < p_mutate
+            if mutated: r = mutate(rng, r)
+            bad = check_round(r, rules, invariants=not mutated)
+            done += 1
+            if bad is None: continue
+            failures.append({"invariant": bad[0], "message": bad[1], "mutated": mutated,
+                             "round": r.to_dict(), "rules": asdict(rules)})
+            if len(failures) >= max_failures: return done, failures
+    return done, failures
+
+
+def _run_chunk(args) -> Tuple[int, List[dict]]:
+    return fuzz_chunk(*args)
+
+
+# -------------------------------
+# 3. 化简与夹具
+# -------------------------------
+def _variants(d: dict) -> Iterator[dict]:
+    """局记录的各种“更简单”版本，每次只改一处"""
+    def with_(**kw):
+        return {**d, **kw}
+
+    for k in range(len(d["gang_data"])):
+        yield with_(gang_data=d["gang_data"][:k] + d["gang_data"][k + 1:])
+    for k in range(len(d["special_events"])):
+        yield with_(special_events=d["special_events"][:k] + d["special_events"][k + 1:])
+    if d["method"] == "点炮":
+        yield with_(method="自摸", winners=d["winners"][:1], loser=None)
+        for k in range(1, len(d["winners"])):
+            yield with_(winners=d["winners"][:k] + d["winners"][k + 1:])
+    for key in ("extra_yj", "extra_b8", "hand_total_counts"):
+        for p, v in d[key].items():
+            rest = {q: x for q, x in d[key].items() if q != p}
+            yield with_(**{key: rest})
+            if v > 1: yield with_(**{key: {**rest, p: v - 1}})
+    for w, res, t in (("fyw", "fyr", "fyt"), ("fbw", "fbr", "fbt")):
+        if d[w] != "无/未现": yield with_(**{w: "无/未现", res: "安全", t: None})
+        if d[res] != "安全": yield with_(**{res: "安全", t: None})
+    if d["ready_list"] is not None:
+        yield with_(ready_list=None)
+        for p in d["players"]:
+            if p not in d["ready_list"]: yield with_(ready_list=d["ready_list"] + [p])
+    if d["is_qing"]: yield with_(is_qing=False)
+    if d["hu_shape"] != SHAPES[0]: yield with_(hu_shape=SHAPES[0])
+    if d["fan_card"]: yield with_(fan_card="")
+
+
+def _rule_variants(d: dict) -> Iterator[dict]:
+    default = asdict(Rules())
+    for k, v in default.items():
+        if k != "rules_config" and d[k] != v: yield {**d, k: v}
+    for k, v in d["rules_config"].items():
+        if v != DEFAULT_RULES_CONFIG.get(k): yield {**d, "rules_config": {**d["rules_config"], k: DEFAULT_RULES_CONFIG[k]}}
+
+
+def shrink(fail: dict, max_steps: int = 2000) -> dict:
+    """贪心化简：任一改动仍触发同一检查项就接受，直到没有可接受的改动"""
+    inv, mutated = fail["invariant"], fail["mutated"]
+
+    def still(rd: dict, ru: dict) -> Optional[Failure]:
+        try:
+            bad = check_round(RoundInput.from_dict(rd), Rules.from_dict(ru), invariants=not mutated)
+        except Exception:  # noqa: BLE001 — 化简出了生成器不会产生的形状，跳过
+            return None
+        return bad if bad is not None and bad[0] == inv else None
+
+    rd, ru, msg = fail["round"], fail["rules"], fail["message"]
+    steps, progress = 0, True
+    while progress and steps < max_steps:
+        progress = False
+        for cand_r, cand_u in [(v, ru) for v in _variants(rd)] + [(rd, v) for v in _rule_variants(ru)]:
+            steps += 1
+            bad = still(cand_r, cand_u)
+            if bad:
+                rd, ru, msg, progress = cand_r, cand_u, bad[1], True
+                break
+    return {**fail, "round": rd, "rules": ru, "message": msg}
+
+
+def save_fixture(fail: dict, directory: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    body = json.dumps({"round": fail["round"], "rules": fail["rules"]}, ensure_ascii=False, sort_keys=True)
+    path = os.path.join(directory, f"{fail['invariant']}-{hashlib.sha1(body.encode()).hexdigest()[:10]}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fail, f, ensure_ascii=False, indent=1)
+    return path
+
+
+def replay(directory: str) -> int:
+    """重跑目录下的全部夹具，返回仍失败的个数"""
+    names = sorted(n for n in os.listdir(directory) if n.endswith(".json")) if os.path.isdir(directory) else []
+    bad = 0
+    for name in names:
+        with open(os.path.join(directory, name), encoding="utf-8") as f: fail = json.load(f)
+        got = check_round(RoundInput.from_dict(fail["round"]), Rules.from_dict(fail["rules"]),
+                          invariants=not fail.get("mutated", False))
+        if got is not None:
+            bad += 1
+            print(f"FAIL {name}: {got[0]} {got[1]}")
+    print(f"{len(names) - bad}/{len(names)} 个夹具通过")
+    return bad
+
+
+def fuzz(rounds: int, jobs: int = 1, seed: int = 0, chunk: int = 20000, p_mutate: float = 0.2,
+         seconds: float = 0.0, max_failures: int = 5) -> Tuple[int, List[dict]]:
+    """返回 (已检查局数, 失败样例)；seconds > 0 时到点后各块提前收尾"""
+    deadline = time.time() + seconds if seconds > 0 else 0.0
+    sizes = [chunk] * (rounds // chunk) + ([rounds % chunk] if rounds % chunk else [])
+    tasks = [(n, s, p_mutate, deadline, max_failures) for n, s in zip(sizes, chunk_seeds(seed, len(sizes)))]
+    done, failures = 0, []
+    if jobs <= 1:
+        results = map(_run_chunk, tasks)
+    else:
+        from multiprocessing import Pool
+        pool = Pool(jobs)
+        results = pool.imap_unordered(_run_chunk, tasks)
+    try:
+        for n, fails in results:
+            done += n
+            failures += fails
+    finally:
+        if jobs > 1:
+            pool.terminate()
+            pool.join()
+    return done, failures
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m zhuoji.fuzz", description="捉鸡结算内核不变量模糊测试")
+    ap.add_argument("--rounds", type=int, default=1000000)
+    ap.add_argument("--seconds", type=float, default=0.0, help="时间上限，0 表示跑满 --rounds")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--chunk", type=int, default=20000, help="每块局数")
+    ap.add_argument("--mutate", type=float, default=0.2, help="篡改局（可能不合法）的比例")
+    ap.add_argument("--fixtures", default="fuzz_fixtures", help="化简后的失败局存放目录")
+    ap.add_argument("--replay", metavar="DIR", help="只重跑该目录下的夹具")
+    args = ap.parse_args(argv)
+
+    if args.replay: return 1 if replay(args.replay) else 0
+    t0 = time.perf_counter()
+    done, failures = fuzz(args.rounds, args.jobs, args.seed, args.chunk, args.mutate, args.seconds)
+    elapsed = time.perf_counter() - t0
+    print(f"{done} 局 用时 {elapsed:.1f}s（{done / elapsed * 60:,.0f}/分钟，{args.jobs} 进程）", file=sys.stderr)
+
+    # 同一检查项只化简、保存前几例，避免一个缺陷刷出成百上千个夹具
+    seen: Dict[str, int] = {}
+    for fail in failures:
+        if seen.get(fail["invariant"], 0) >= 3: continue
+        seen[fail["invariant"]] = seen.get(fail["invariant"], 0) + 1
+        small = shrink(fail)
+        print(f"{small['invariant']}: {small['message']}\n  -> {save_fixture(small, args.fixtures)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""历史场次批量导入：流式读取 JSONL / CSV 局记录，逐局校验结算，分批写进账本。
+
+    python -m zhuoji.importer ledger.db 场次号 rounds.jsonl [--rules rules.json] [-j 8] [--errors errors.jsonl]
+
+每条记录为 RoundInput 的字段（与界面录入一致），可带 "round" 局号，缺省时接着本场次最新局号顺延。
+与界面一样，同一场次座位数固定（已有局时以账本为准，否则以第一条导入的局为准），局号只增不减；
+人数不符、局号不大于已有最新局号的记录同样进错误报告。
+CSV 首行为字段名；列表/字典字段（winners、gang_data、hand_total_counts……）的单元格写 JSON，
+人名列表也可用“、”或逗号分隔；is_qing 写 1/true/是；空单元格取默认值（ready_list 空表示全员听牌）。
+校验不通过或字段有误的记录不中断导入，写进错误报告（每行 {"line", "round", "error", "violations"}，
+violations 为全部校验问题 [问题码, 牌, 玩家]，问题码见 kernel.VALIDATION_FORMATS；
+人名字段里出现 players 之外的名字时另带 "unknown": {字段: [名字]}，该局不导入）。
+多进程时主进程只读文件与写库，解析、校验、结算都在子进程里；按固定窗口投递，内存与文件大小无关。
+导入的局同时保存录入与规则，之后可按新规则重算。
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .kernel import CompiledRules
+from .ledger import LedgerStore
+from .rounds import RoundInput, Rules, score_round, unknown_names_error
+
+LIST_FIELDS = frozenset(["players", "winners", "special_events", "ready_list", "gang_data"])
+DICT_FIELDS = frozenset(["extra_yj", "extra_b8", "hand_total_counts"])
+TARGET_FIELDS = frozenset(["fyt", "fbt"])  # 单个对象或被胡时的胡牌者列表
+
+# (行号, 局号或 None, 录入, 得分, 流水)，出错时为 (行号, 局号或 None, 错误文字, 问题列表, 未知人名)
+Scored = tuple
+
+_rules: Optional[Rules] = None
+_compiled: Dict[str, CompiledRules] = {}
+
+
+@dataclass
+class ImportReport:
+    read: int = 0        # 读到的记录数（不含空行）
+    imported: int = 0
+    errors: int = 0
+    first_round: int = 0
+    last_round: int = 0
+    elapsed: float = 0.0
+
+
+def _cell(name: str, v: str):
+    """CSV 单元格 -> 字段值；空单元格返回 None 表示取默认值"""
+    v = v.strip()
+    if not v: return None
+    if v[0] in "[{": return json.loads(v)
+    if name in LIST_FIELDS: return [s.strip() for s in v.replace("，", ",").replace("、", ",").split(",") if s.strip()]
+    if name in DICT_FIELDS: raise ValueError(f"{name} 须为 JSON 对象")
+    if name == "is_qing": return v.lower() in ("1", "true", "yes", "y", "是")
+    if name == "round": return int(v)
+    if name in TARGET_FIELDS and ("、" in v or "," in v): return _cell("winners", v)
+    return v
+
+
+def _record(raw: Union[str, dict]) -> Optional[dict]:
+    if isinstance(raw, dict):
+        return {k: c for k, v in raw.items() if k and v is not None for c in [_cell(k, v)] if c is not None}
+    raw = raw.strip()
+    return json.loads(raw) if raw else None
+
+
+def _init_worker(rules: Rules):
+    global _rules
+    _rules = rules
+    _compiled.clear()
+
+
+def _score_chunk(chunk: List[Tuple[int, Union[str, dict]]]) -> List[Scored]:
+    out = []
+    for lineno, raw in chunk:
+        round_no = None
+        try:
+            d = _record(raw)
+            if d is None: continue
+            round_no = d.get("round")
+            if round_no is not None: round_no = int(round_no)
+            r = RoundInput.from_dict(d)
+            if not r.players: raise ValueError("缺少 players")
+            unknown = r.unknown_names()
+            if unknown:
+                out.append((lineno, round_no, unknown_names_error(unknown), [], unknown))
+                continue
+            cr = _compiled.get(r.fan_card)
+            if cr is None: cr = _compiled[r.fan_card] = _rules.compile(r.fan_card)
+            res = score_round(r, _rules, cr)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            out.append((lineno, round_no, str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}", [], {}))
+            continue
+        if res.error is not None:
+            out.append((lineno, round_no, res.error, res.violations, {}))
+        else:
+            out.append((lineno, round_no, r, res.scores, res.transactions))
+    return out
+
+
+def read_records(f, fmt: str = "jsonl") -> Iterator[Tuple[int, Union[str, dict]]]:
+    """(行号, 原始记录)；JSONL 为整行文本，CSV 为按表头的字典。逐行读，不整体载入"""
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader: yield reader.line_num, row
+    else:
+        yield from enumerate(f, 1)
+
+
+def iter_scored(records: Iterable[Tuple[int, Union[str, dict]]], rules: Rules, jobs: int = 1,
+                chunksize: int = 256) -> Iterator[Scored]:
+    """按输入顺序产出结算结果；多进程时每次只投递 jobs * 4 块，避免 Pool.imap 预读整个文件"""
+    chunks = iter(lambda: list(islice(records, chunksize)), [])
+    if jobs <= 1:
+        _init_worker(rules)
+        for chunk in chunks: yield from _score_chunk(chunk)
+        return
+
+    from multiprocessing import Pool
+    with Pool(jobs, initializer=_init_worker, initargs=(rules,)) as pool:
+        while True:
+            window = list(islice(chunks, jobs * 4))
+            if not window: break
+            for part in pool.imap(_score_chunk, window): yield from part
+
+
+def summarize(r: RoundInput) -> str:
+    """与界面记账时的摘要一致"""
+    return f"{' & '.join(r.winners)} {r.method}" + (f" ({r.loser})" if r.loser else "")
+
+
+def import_rounds(store: LedgerStore, session: str, records: Iterable[Tuple[int, Union[str, dict]]],
+                  rules: Optional[Rules] = None, jobs: int = 1, batch: int = 2000,
+                  errors=None) -> ImportReport:
+    """逐局结算后每 batch 局一个事务写入；errors 为可写文本流时逐行写错误报告"""
+    t0 = time.perf_counter()
+    rules = rules or Rules()
+    report = ImportReport()
+    n_rounds, last = store.session_info(session)
+    seats = len(store.totals(session)) if n_rounds else None  # 界面在已有局时锁定人数
+    pending = []
+
+    def flush():
+        if pending: store.append_rounds(session, pending)
+        pending.clear()
+
+    def reject(lineno, round_no, error, violations=(), unknown=None):
+        report.errors += 1
+        if errors is None: return
+        line = {"line": lineno, "round": round_no, "error": error, "violations": [list(v) for v in violations]}
+        if unknown: line["unknown"] = unknown
+        errors.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    for item in iter_scored(records, rules, jobs):
+        report.read += 1
+        if isinstance(item[2], str):
+            reject(*item)
+            continue
+        lineno, round_no, r, scores, txs = item
+        if seats is not None and len(r.players) != seats:
+            reject(lineno, round_no, f"本场次为 {seats} 人，此局 {len(r.players)} 人")
+            continue
+        if round_no is None: round_no = last + 1
+        if round_no <= last:
+            reject(lineno, round_no, f"局号须大于本场次已有的最新局号 {last}")
+            continue
+        seats, last = len(r.players), round_no
+        if not report.imported: report.first_round = round_no
+        report.imported += 1
+        report.last_round = round_no
+        pending.append((round_no, summarize(r), r.players, scores, txs, r, rules))
+        if len(pending) >= batch: flush()
+    flush()
+    report.elapsed = time.perf_counter() - t0
+    return report
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m zhuoji.importer", description="批量导入历史局到账本")
+    ap.add_argument("db", help="SQLite 账本路径")
+    ap.add_argument("session", help="导入到的场次号（网址里的 ?s=）")
+    ap.add_argument("input", nargs="?", default="-", help="JSONL 或 CSV，- 表示标准输入")
+    ap.add_argument("-f", "--format", choices=["jsonl", "csv"], help="缺省按扩展名判断")
+    ap.add_argument("--rules", help="规则 JSON 文件，缺省使用界面默认值")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="并行进程数")
+    ap.add_argument("--batch", type=int, default=2000, help="每个事务写入的局数")
+    ap.add_argument("--errors", default="-", help="错误报告 JSONL，- 表示标准错误")
+    args = ap.parse_args(argv)
+
+    rules = Rules()
+    if args.rules:
+        with open(args.rules, encoding="utf-8") as f:
+            rules = Rules.from_dict(json.load(f))
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+
+    store = LedgerStore(args.db)
+    fin = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8-sig", newline="")
+    ferr = sys.stderr if args.errors == "-" else open(args.errors, "w", encoding="utf-8")
+    try:
+        report = import_rounds(store, args.session, read_records(fin, fmt), rules, args.jobs, args.batch, ferr)
+    finally:
+        if fin is not sys.stdin: fin.close()
+        if ferr is not sys.stderr: ferr.close()
+        store.close()
+    span = f"，局号 {report.first_round}–{report.last_round}" if report.imported else ""
+    print(f"读入 {report.read} 局，导入 {report.imported} 局{span}，{report.errors} 局有误，"
+          f"用时 {report.elapsed:.1f}s（{report.read / max(report.elapsed, 1e-9):,.0f} 局/秒）", file=sys.stderr)
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,617 @@
+"""捉鸡记账规则内核：校验与结算管道，不依赖 Streamlit / pandas。"""
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from functools import lru_cache
+from time import perf_counter
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+
+# -------------------------------
+# 1. 基础工具函数
+# -------------------------------
+def parse_card(card_str: str) -> Optional[Tuple[int, str]]:
+    if not card_str: return None
+    try:
+        suit = card_str[-1];
+        num = int(card_str[:-1])
+        if suit not in ["筒", "条", "万"] or num < 1 or num > 9: return None
+        return num, suit
+    except:
+        return None
+
+
+def _fan_multipliers(fan_card: str) -> Tuple[int, int]:
+    parsed = parse_card(fan_card)
+    if not parsed: return 1, 1
+    num, suit = parsed
+    if num == 9 and suit == "条": return 2, 1
+    if num == 7 and suit == "筒": return 1, 2
+    return 1, 1
+
+
+# 27 张标准写法预先算好，其它写法（如 "09条"）再走解析
+_FAN_MULTIPLIERS = {f"{n}{s}": _fan_multipliers(f"{n}{s}") for s in ["筒", "条", "万"] for n in range(1, 10)}
+
+
+def get_fan_multipliers(fan_card: str) -> Tuple[int, int]:
+    hit = _FAN_MULTIPLIERS.get(fan_card)
+    return hit if hit is not None else _fan_multipliers(fan_card)
+
+
+CATEGORIES = ("hu", "gang", "chicken_fan_luck", "chicken_charge", "chicken_extra", "chicken_resp")
+CAT_HU, CAT_GANG, CAT_FAN, CAT_CHARGE, CAT_EXTRA, CAT_RESP = range(len(CATEGORIES))
+CAT_CODE = {c: i for i, c in enumerate(CATEGORIES)}
+CATEGORY_LABELS = ("胡牌", "杠", "翻鸡", "冲锋鸡", "常鸡", "落地鸡")
+# 收款人未听牌时反向包赔的类别（按类别码的位掩码）；胡与翻鸡直接作废
+REVERSIBLE_MASK = (1 << CAT_GANG) | (1 << CAT_CHARGE) | (1 << CAT_RESP) | (1 << CAT_EXTRA)
+
+# 流水说明按 (模板码, 参数) 保存，只有显示/导出时才拼成文字
+REASON_FORMATS = (
+    "自摸({})", "点炮({})", "{}-{}", "翻鸡互斥", "冲锋鸡-{}", "常鸡-{}({}张)",
+    "{}鸡-{}({}张)", "{}鸡-{}({}张,责任)", "{}",
+)
+R_ZIMO, R_DIANPAO, R_GANG, R_FAN, R_CHARGE, R_EXTRA, R_LANDED, R_LIABLE, R_TEXT = range(len(REASON_FORMATS))
+R_REVERSED = 0x100  # 未听牌包赔
+
+
+class Transaction:
+    """一笔转账。紧凑存储：说明文字与类别名按需生成"""
+    __slots__ = ("payer", "receiver", "amount", "code", "args", "cat")
+
+    def __init__(self, payer: str, receiver: str, amount: int, code: int, args: tuple, cat: int):
+        self.payer = payer
+        self.receiver = receiver
+        self.amount = amount
+        self.code = code
+        self.args = args
+        self.cat = cat
+
+    @classmethod
+    def from_text(cls, payer: str, receiver: str, amount: int, reason: str, category: str) -> "Transaction":
+        return cls(payer, receiver, amount, R_TEXT, (reason,), CAT_CODE[category])
+
+    @property
+    def reason(self) -> str:
+        text = REASON_FORMATS[self.code & 0xff].format(*self.args)
+        return f"未听牌包赔-{text}" if self.code & R_REVERSED else text
+
+    @property
+    def category(self) -> str:
+        return CATEGORIES[self.cat]
+
+    def reverse(self):
+        return Transaction(self.receiver, self.payer, self.amount, self.code | R_REVERSED, self.args, self.cat)
+
+    def astuple(self) -> tuple:
+        return self.payer, self.receiver, self.amount, self.reason, self.category
+
+    def __eq__(self, other):
+        return isinstance(other, Transaction) and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        return "Transaction(payer={!r}, receiver={!r}, amount={!r}, reason={!r}, category={!r})".format(
+            *self.astuple())
+
+
+def build_common_chicken_cfg(base_yj, mul_yj, base_b8, mul_b8, fan_card):
+    f_yj, f_b8 = get_fan_multipliers(fan_card)
+    return {"幺鸡": int(base_yj) * int(mul_yj) * int(f_yj), "八筒": int(base_b8) * int(mul_b8) * int(f_b8)}
+
+
+# -------------------------------
+# 2. 校验逻辑
+# -------------------------------
+# 校验结果按 (问题码, 牌, 玩家) 返回，不抛异常、一次给出全部问题；文字只在显示时拼出，与原报错一致
+VALIDATION_FORMATS = (
+    "翻鸡总数超过4张", "{}补杠重复", "{}补杠需基于首出被碰", "{}补杠者必须是碰牌者", "{}有杠时，非首出应为0",
+    "{}总数超限(>4)", "自摸不能接首出胡", "双常鸡不能同时被胡", "{}被胡时不能有杠",
+)
+(V_FAN_TOTAL, V_BU_DUP, V_BU_NO_PENG, V_BU_DOER, V_GANG_EXTRA, V_TILE_TOTAL, V_ZIMO_FIRST_HU, V_DOUBLE_HU,
+ V_HU_GANG) = range(len(VALIDATION_FORMATS))
+GANG_TYPES = ("暗杠", "补杠", "普通明杠", "责任明杠")
+
+
+class Violation(tuple):
+    """一条校验问题：(问题码, 牌或 None, 相关玩家或 None)"""
+    __slots__ = ()
+
+    def __new__(cls, code: int, tile: Optional[str] = None, player: Optional[str] = None):
+        return tuple.__new__(cls, (code, tile, player))
+
+    def __getnewargs__(self):
+        """pickle（多进程导入/重算）按三个字段重建，不把整个元组当成问题码"""
+        return tuple(self)
+
+    code = property(lambda self: self[0])
+    tile = property(lambda self: self[1])
+    player = property(lambda self: self[2])
+
+    @property
+    def message(self) -> str:
+        return VALIDATION_FORMATS[self[0]].format(self[1])
+
+
+_NO_GANGS: Dict[str, Tuple[int, List[dict]]] = {"幺鸡": (0, []), "八筒": (0, [])}
+
+
+def gang_index(gang_data) -> Dict[str, Tuple[int, List[dict]]]:
+    """幺鸡/八筒 -> (计数的杠数, 补杠行)；每局只扫一遍杠表，各项检查共用"""
+    if not gang_data: return _NO_GANGS
+    n = {"幺鸡": 0, "八筒": 0}
+    bu: Dict[str, List[dict]] = {"幺鸡": [], "八筒": []}
+    for g in gang_data:
+        card, kind = g['card'], g['type']
+        if card in n and kind in GANG_TYPES:
+            n[card] += 1
+            if kind == "补杠": bu[card].append(g)
+    return {t: (n[t], bu[t]) for t in TILES}
+
+
+def check_objective_facts(players, fan_card, hand_counts, f_yj_who, f_yj_res, f_yj_tar, f_b8_who, f_b8_res,
+                          f_b8_tar, e_yj, e_b8, gang_data, index=None) -> List[Violation]:
+    """validate_objective_facts 的全量版：返回全部问题（按原报错的先后顺序），不抛异常"""
+    out = []
+    if fan_card and sum(hand_counts.get(p, 0) for p in players) > 4: out.append(Violation(V_FAN_TOTAL))
+    if index is None: index = gang_index(gang_data)
+    for name, f_who, f_res, f_tar, extra_map in (("幺鸡", f_yj_who, f_yj_res, f_yj_tar, e_yj),
+                                                ("八筒", f_b8_who, f_b8_res, f_b8_tar, e_b8)):
+        total = sum(extra_map.get(p, 0) for p in players)
+        n_gang, bu_gangs = index[name]
+        consumed = 0
+        if f_who and f_who != "无/未现":
+            consumed = 3 if f_res == "被碰" else 4 if f_res == "被明杠" else 1
+
+        if bu_gangs:
+            if len(bu_gangs) > 1: out.append(Violation(V_BU_DUP, name))
+            if not (f_who and f_res == "被碰"): out.append(Violation(V_BU_NO_PENG, name))
+            if bu_gangs[0]['doer'] != f_tar: out.append(Violation(V_BU_DOER, name, bu_gangs[0]['doer']))
+
+        if n_gang or (f_who and f_res == "被明杠"):
+            if total != 0: out.append(Violation(V_GANG_EXTRA, name))
+        elif consumed + total > 4:
+            out.append(Violation(V_TILE_TOTAL, name))
+    return out
+
+
+def check_consistency(players, winners, method, fyw, fyr, fyt, fbw, fbr, fbt, gang_data,
+                      index=None) -> List[Violation]:
+    """validate_consistency 的全量版"""
+    out = []
+    if method == "自摸" and (fyr == "被胡" or fbr == "被胡"): out.append(Violation(V_ZIMO_FIRST_HU))
+    if fyr == "被胡" and fbr == "被胡": out.append(Violation(V_DOUBLE_HU))
+    if fyr == "被胡" or fbr == "被胡":
+        if index is None: index = gang_index(gang_data)
+        for tile, res in (("幺鸡", fyr), ("八筒", fbr)):
+            if res == "被胡" and index[tile][0]: out.append(Violation(V_HU_GANG, tile))
+    return out
+
+
+def check_round(players, winners, method, fan_card, hand_counts, fyw, fyr, fyt, fbw, fbr, fbt, e_yj, e_b8,
+                gang_data) -> List[Violation]:
+    """整局校验（客观事实在前、一致性在后），杠表索引只建一次；空列表表示通过"""
+    index = gang_index(gang_data)
+    return check_objective_facts(players, fan_card, hand_counts, fyw, fyr, fyt, fbw, fbr, fbt, e_yj, e_b8,
+                                 gang_data, index) + \
+        check_consistency(players, winners, method, fyw, fyr, fyt, fbw, fbr, fbt, gang_data, index)
+
+
+def validate_objective_facts(players, fan_card, hand_counts, f_yj_who, f_yj_res, f_yj_tar, f_b8_who, f_b8_res,
+                             f_b8_tar, e_yj, e_b8, gang_data):
+    v = check_objective_facts(players, fan_card, hand_counts, f_yj_who, f_yj_res, f_yj_tar, f_b8_who, f_b8_res,
+                              f_b8_tar, e_yj, e_b8, gang_data)
+    if v: raise ValueError(v[0].message)
+
+
+def validate_consistency(players, winners, method, fyw, fyr, fyt, fbw, fbr, fbt, gang_data):
+    v = check_consistency(players, winners, method, fyw, fyr, fyt, fbw, fbr, fbt, gang_data)
+    if v: raise ValueError(v[0].message)
+
+
+# -------------------------------
+# 3. 规则编译
+# -------------------------------
+TILES = ("幺鸡", "八筒")
+
+
+@dataclass(frozen=True, eq=False)
+class CompiledRules:
+    """rules_config + 常鸡单价 + 翻鸡单位 编译成的只读规则表，同一套规则只编译一次"""
+    key: tuple
+    values: Mapping[str, int]                                 # 牌型/事件分值
+    qing_bonus: int
+    price: Tuple[int, int]                                    # 按 TILES 下标的常鸡单价（已含翻牌倍数）
+    landed_amount: Mapping[Tuple[int, int], Tuple[int, int]]  # (牌, 张数) -> (普通, 责任) 每家应付
+    fan_unit: int
+    _hu: dict = field(default_factory=dict, compare=False, repr=False)
+
+    def hu_payout(self, hu_shape: str, is_qing: bool, special_events) -> Tuple[int, tuple]:
+        """(每家应付, 说明参数)，按 牌型/清一色/事件 组合记忆"""
+        k = (hu_shape, bool(is_qing), tuple(special_events))
+        hit = self._hu.get(k)
+        if hit is None:
+            total = self.values.get(hu_shape, 0) + (self.qing_bonus if is_qing else 0)
+            total += sum(self.values.get(e, 0) for e in special_events)
+            desc = f"{hu_shape}" + ("+清" if is_qing else "") + (
+                f"+{'+'.join(special_events)}" if special_events else "")
+            if len(self._hu) >= 4096: self._hu.clear()
+            hit = self._hu[k] = (total, (desc,))
+        return hit
+
+
+def compile_rules(rules_config: Dict[str, int], common_v: Dict[str, int], fan_unit: int) -> CompiledRules:
+    return _compile_rules(tuple(sorted(rules_config.items())), int(common_v.get("幺鸡", 0)),
+                          int(common_v.get("八筒", 0)), fan_unit)
+
+
+@lru_cache(maxsize=256)
+def _compile_rules(rc_items: tuple, u_yj: int, u_b8: int, fan_unit: int) -> CompiledRules:
+    values = dict(rc_items)
+    price = (u_yj, u_b8)
+    landed = {(t, n): (u * n, 2 * u + u * (n - 1)) for t, u in enumerate(price) for n in (1, 3, 4)}
+    cr = CompiledRules((rc_items, u_yj, u_b8, fan_unit), MappingProxyType(values), values.get("清一色加成", 0),
+                       price, MappingProxyType(landed), fan_unit)
+    for shape in ("平胡", "大对子", "七对", "龙七对"):
+        for qing in (False, True): cr.hu_payout(shape, qing, ())
+    return cr
+
+
+# -------------------------------
+# 4. 核心计算管道
+# -------------------------------
+# 分阶段计时：zhuoji.metrics.enable() 时装上 Registry，关闭时为 None（热路径只多一次判空）
+_timer = None
+
+
+def settle_transactions(
+        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+        hand_total_counts, gang_data, common_v, fan_unit
+) -> List[Transaction]:
+    """校验并生成本局最终生效的转账列表（已应用未听牌过滤/包赔）"""
+    return settle_compiled(
+        compile_rules(rules_config, common_v, fan_unit),
+        players, winners, method, loser, hu_shape, is_qing, special_events,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data
+    )
+
+
+def settle_compiled(
+        cr: CompiledRules, players, winners, method, loser, hu_shape, is_qing, special_events,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data,
+        checked: bool = False
+) -> List[Transaction]:
+    """settle_transactions 的编译规则版本，批量结算时同一套规则反复使用"""
+    return list(iter_settled(
+        cr, players, winners, method, loser, hu_shape, is_qing, special_events,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data,
+        checked
+    ))
+
+
+def iter_settled(
+        cr: CompiledRules, players, winners, method, loser, hu_shape, is_qing, special_events,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data,
+        checked: bool = False
+) -> Iterator[Transaction]:
+    """校验后逐笔产出最终生效的转账；生成与过滤都是流式的，不建中间列表"""
+    timer = _timer
+    if timer: t_lap = perf_counter()
+    ready_set = set([p for p in ready_list if p in players]) | set(winners)
+
+    # 1. Validation（checked=True 表示调用方已用 check_round 校验过）
+    if not checked:
+        violations = check_round(players, winners, method, fan_card, hand_total_counts, fyw, fyr, fyt, fbw, fbr, fbt,
+                                 extra_yj, extra_b8, gang_data)
+        if violations:
+            if timer: timer.inc("zhuoji_round_errors_total")
+            raise ValueError(violations[0].message)
+    if timer: timer.lap("validate", t_lap)
+
+    # 3. Filter（2. 原始转账见 _iter_raw）
+    zero_income = set()
+    if method == "点炮" and loser and ("热炮" in special_events or "抢杠胡" in special_events) and loser in ready_set:
+        zero_income.add(loser)
+
+    raw = _iter_raw(cr, players, winners, method, loser, hu_shape, is_qing, special_events,
+                    fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data)
+    if timer:
+        raw = list(raw)  # 计时时先生成完，各阶段耗时不混入过滤
+        t_lap = perf_counter()
+    for tx in raw:
+        if tx.receiver in zero_income: continue
+        if tx.receiver in ready_set:
+            yield tx
+        elif REVERSIBLE_MASK >> tx.cat & 1:
+            if tx.payer in ready_set: yield tx.reverse()
+    if timer:
+        timer.lap("filter", t_lap)
+        timer.inc("zhuoji_rounds_total")
+
+
+def settle_scores(
+        cr: CompiledRules, players, winners, method, loser, hu_shape, is_qing, special_events,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data,
+        checked: bool = False
+) -> Dict[str, int]:
+    """只要每人得分时的快速版：等于 aggregate_scores(players, settle_compiled(...))，但不生成逐笔转账。
+
+    过滤只看收款人（是否听牌/零收入）与付款人是否听牌，对金额是线性的，所以“其余每家付给某人”的块
+    直接记成 整体偏移 + 收款人净额（每块 O(1)），翻鸡互斥按张数排序后用前缀和（O(P log P)），
+    人数多时不再逐对生成流水。players 须不重名。
+    """
+    if not checked:
+        violations = check_round(players, winners, method, fan_card, hand_total_counts, fyw, fyr, fyt, fbw, fbr, fbt,
+                                 extra_yj, extra_b8, gang_data)
+        if violations: raise ValueError(violations[0].message)
+    ready = set([p for p in ready_list if p in players]) | set(winners)
+    zero = loser if method == "点炮" and loser and ("热炮" in special_events or "抢杠胡" in special_events) \
+        and loser in ready else None
+    n = len(players)
+    n_ready = sum(1 for p in players if p in ready)
+    score = {p: 0 for p in players}
+    every = every_ready = 0  # 每人都加 / 每个听牌者都加
+
+    def block(o, a, reversible):
+        """其余每家付给 o 金额 a"""
+        nonlocal every, every_ready
+        if o == zero: return
+        if o in ready:
+            score[o] += a * n
+            every -= a
+        elif reversible:
+            score[o] -= a * n_ready
+            every_ready += a
+
+    def single(p, r, a, reversible):
+        if r == zero: return
+        if r in ready:
+            score[r] += a
+            score[p] -= a
+        elif reversible and p in ready:
+            score[p] += a
+            score[r] -= a
+
+    # 胡
+    if winners:
+        total, _ = cr.hu_payout(hu_shape, is_qing, special_events)
+        if method == "自摸":
+            block(winners[0], total, False)
+        elif method == "点炮" and loser:
+            for w in winners: single(loser, w, total, False)
+
+    # 杠
+    for g in gang_data:
+        d, t, v = g['doer'], g['type'], g['victim']
+        if not d: continue
+        if t in ["暗杠", "补杠"]:
+            block(d, 4 if t == "暗杠" else 2, True)
+        elif v and v in players:
+            single(v, d, 2, True)
+
+    # 翻鸡互斥：多者向每个少者收 差 × 单位，收款人须听牌且非零收入，不包赔
+    counts = [hand_total_counts.get(p, 0) for p in players]
+    if cr.fan_unit and len(set(counts)) > 1:
+        unit = cr.fan_unit
+        srt = sorted(counts)
+        pre = [0]
+        for c in srt: pre.append(pre[-1] + c)
+        ok = sorted(c for p, c in zip(players, counts) if p in ready and p != zero)
+        ok_pre = [0]
+        for c in ok: ok_pre.append(ok_pre[-1] + c)
+        for p, c in zip(players, counts):
+            if p in ready and p != zero:
+                k = bisect_left(srt, c)                  # 张数比 p 少的人
+                score[p] += (c * k - pre[k]) * unit
+            k = bisect_right(ok, c)                      # 能收 p 钱的人（张数比 p 多）
+            score[p] -= ((ok_pre[-1] - ok_pre[k]) - c * (len(ok) - k)) * unit
+
+    # 冲锋鸡 / 常鸡
+    price = cr.price
+    for tile, (who, res) in enumerate([(fyw, fyr), (fbw, fbr)]):
+        if who and who != "无/未现" and res == "安全" and price[tile] > 0: block(who, price[tile] * 2, True)
+    for tile, e_map in enumerate([extra_yj, extra_b8]):
+        if price[tile] > 0:
+            for owner, count in e_map.items():
+                if count > 0: block(owner, count * price[tile], True)
+
+    # 落地鸡：每家付普通价，责任人另补差价
+    for o, c, k, v, _ in _landed(fyw, fyr, fyt, fbw, fbr, fbt, gang_data):
+        tile = TILES.index(c)
+        if price[tile] <= 0: continue
+        plain, liable = cr.landed_amount[(tile, k)]
+        block(o, plain, True)
+        if v and v != o and v in players: single(v, o, liable - plain, True)
+
+    return {p: score[p] + every + (every_ready if p in ready else 0) for p in players}
+
+
+def _iter_raw(cr: CompiledRules, players, winners, method, loser, hu_shape, is_qing, special_events,
+              fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data) -> Iterator[Transaction]:
+    """未经听牌过滤的原始转账，按 胡/杠/翻鸡/冲锋鸡/常鸡/落地鸡 顺序产出"""
+    timer = _timer
+    if timer: t_lap = perf_counter()
+    price = cr.price
+    fan_unit = cr.fan_unit
+
+    # 2. Score Calculation
+    # 2.1 Hu
+    if winners:
+        total, desc = cr.hu_payout(hu_shape, is_qing, special_events)
+        if method == "自摸":
+            for p in players:
+                if p != winners[0]: yield Transaction(p, winners[0], total, R_ZIMO, desc, CAT_HU)
+        elif method == "点炮" and loser:
+            for w in winners: yield Transaction(loser, w, total, R_DIANPAO, desc, CAT_HU)
+    if timer: t_lap = timer.lap("hu", t_lap)
+
+    # 2.2 Gang
+    for g in gang_data:
+        d, t, v, c = g['doer'], g['type'], g['victim'], g['card']
+        if not d: continue
+        score = 4 if t == "暗杠" else 2
+        args = (t, c)
+        if t in ["暗杠", "补杠"]:
+            for p in players:
+                if p != d: yield Transaction(p, d, score, R_GANG, args, CAT_GANG)
+        elif v and v in players:
+            yield Transaction(v, d, score, R_GANG, args, CAT_GANG)
+    if timer: t_lap = timer.lap("gang", t_lap)
+
+    # 2.3 Fan Chicken
+    for i in range(len(players)):
+        for j in range(i + 1, len(players)):
+            p1, p2 = players[i], players[j]
+            c1, c2 = hand_total_counts.get(p1, 0), hand_total_counts.get(p2, 0)
+            if c1 != c2:
+                win, los = (p1, p2) if c1 > c2 else (p2, p1)
+                yield Transaction(los, win, abs(c1 - c2) * fan_unit, R_FAN, (), CAT_FAN)
+    if timer: t_lap = timer.lap("fan", t_lap)
+
+    # 2.4 Common Chicken
+    # Charge
+    for tile, (card, who, res) in enumerate([("幺鸡", fyw, fyr), ("八筒", fbw, fbr)]):
+        if who and who != "无/未现" and res == "安全":
+            u = price[tile]
+            if u > 0:
+                args = (card,)
+                for p in players:
+                    if p != who: yield Transaction(p, who, u * 2, R_CHARGE, args, CAT_CHARGE)
+    if timer: t_lap = timer.lap("charge", t_lap)
+
+    # Extra (Split)
+    for tile, (card, e_map) in enumerate([("幺鸡", extra_yj), ("八筒", extra_b8)]):
+        u = price[tile]
+        if u > 0:
+            for owner, count in e_map.items():
+                if count > 0:
+                    args = (card, count)
+                    for p in players:
+                        if p != owner: yield Transaction(p, owner, count * u, R_EXTRA, args, CAT_EXTRA)
+    if timer: t_lap = timer.lap("extra", t_lap)
+
+    # Landed
+    landed = _landed(fyw, fyr, fyt, fbw, fbr, fbt, gang_data)
+    for o, c, n, v, t in landed:
+        tile = TILES.index(c)
+        if price[tile] <= 0: continue
+        plain, liable = cr.landed_amount[(tile, n)]
+        args = (t, c, n)
+        for p in players:
+            if p == o: continue
+            if v and p == v:
+                yield Transaction(p, o, liable, R_LIABLE, args, CAT_RESP)
+            else:
+                yield Transaction(p, o, plain, R_LANDED, args, CAT_RESP)
+    if timer: timer.lap("landed", t_lap)
+
+
+def _landed(fyw, fyr, fyt, fbw, fbr, fbt, gang_data) -> List[Tuple[str, str, int, Optional[str], str]]:
+    """落地鸡：(得主, 牌, 张数, 责任人, 来源)，顺序即流水顺序"""
+    landed = []
+    for g in gang_data:
+        if g['card'] in ["幺鸡", "八筒"]:
+            vic = g['victim']
+            if g['type'] == "补杠":
+                if g['card'] == "幺鸡" and fyr == "被碰" and fyt == g['doer']:
+                    vic = fyw
+                elif g['card'] == "八筒" and fbr == "被碰" and fbt == g['doer']:
+                    vic = fbw
+            landed.append((g['doer'], g['card'], 4, vic, g['type']))
+
+    # Add Peng
+    if fyr == "被碰" and fyt and not any(
+            g['card'] == "幺鸡" and g['type'] == "补杠" and g['doer'] == fyt for g in gang_data):
+        landed.append((fyt, "幺鸡", 3, fyw, "碰"))
+    if fbr == "被碰" and fbt and not any(
+            g['card'] == "八筒" and g['type'] == "补杠" and g['doer'] == fbt for g in gang_data):
+        landed.append((fbt, "八筒", 3, fbw, "碰"))
+
+    # Add Hu
+    for c, r, t, v in (("幺鸡", fyr, fyt, fyw), ("八筒", fbr, fbt, fbw)):
+        if r == "被胡" and t:
+            for tar in (t if isinstance(t, list) else [t]): landed.append((tar, c, 1, v, "胡"))
+    return landed
+
+
+def aggregate_scores(players, final: List[Transaction]) -> Dict[str, int]:
+    timer = _timer
+    if timer: t_lap = perf_counter()
+    scores = {p: 0 for p in players}
+    for tx in final:
+        scores[tx.receiver] += tx.amount
+        scores[tx.payer] -= tx.amount
+    if timer: timer.lap("aggregate", t_lap)
+    return scores
+
+
+def render_details(players, final: List[Transaction]) -> Dict[str, List[str]]:
+    """逐人明细文字，只在展示时生成"""
+    timer = _timer
+    if timer: t_lap = perf_counter()
+    details = {p: [] for p in players}
+    for tx in final:
+        reason = tx.reason
+        details[tx.receiver].append(f"{reason}: +{tx.amount} ({tx.payer})")
+        details[tx.payer].append(f"{reason}: -{tx.amount} ({tx.receiver})")
+    if timer: timer.lap("details", t_lap)
+    return details
+
+
+def aggregate_transactions(players, final: List[Transaction]) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+    return aggregate_scores(players, final), render_details(players, final)
+
+
+# 按类别的净额矩阵 [类别][付款座位][收款座位]，反对称：F[c][i][j] == -F[c][j][i]
+FlowMatrix = List[List[List[int]]]
+
+
+def empty_flows(n: int) -> FlowMatrix:
+    return [[[0] * n for _ in range(n)] for _ in CATEGORIES]
+
+
+def add_flows(flows: FlowMatrix, seat: Dict[str, int], txs: Iterable[Transaction]) -> FlowMatrix:
+    """逐笔把转账累加进净额矩阵（流式归约），返回同一个矩阵"""
+    for tx in txs:
+        m, i, j = flows[tx.cat], seat[tx.payer], seat[tx.receiver]
+        m[i][j] += tx.amount
+        m[j][i] -= tx.amount
+    return flows
+
+
+def flow_matrix(players, txs: Iterable[Transaction]) -> FlowMatrix:
+    return add_flows(empty_flows(len(players)), {p: i for i, p in enumerate(players)}, txs)
+
+
+def settle_flows(
+        cr: CompiledRules, players, winners, method, loser, hu_shape, is_qing, special_events,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data
+) -> FlowMatrix:
+    """与 settle_compiled 同参数，直接归约成净额矩阵，不落转账列表"""
+    return flow_matrix(players, iter_settled(
+        cr, players, winners, method, loser, hu_shape, is_qing, special_events,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8, hand_total_counts, gang_data
+    ))
+
+
+def net_flows(flows: FlowMatrix) -> List[List[int]]:
+    """各类别合计的 N×N 净额：[i][j] > 0 表示 i 净付给 j"""
+    return [[sum(col) for col in zip(*rows)] for rows in zip(*flows)]
+
+
+def flow_scores(flows: FlowMatrix) -> List[int]:
+    """每个座位的得分（收到的净额之和），与 aggregate_scores 一致"""
+    return [sum(col) for col in zip(*net_flows(flows))]
+
+
+def calculate_all_pipeline(
+        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+        hand_total_counts, gang_data, common_v, fan_unit
+) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+    final = settle_transactions(
+        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+        hand_total_counts, gang_data, common_v, fan_unit
+    )
+    return aggregate_transactions(players, final)
@@ -0,0 +1,678 @@
+"""持久化账本：SQLite (WAL)，追加写入，按场次/玩家索引查询。
+
+表结构：
+    rounds        每局一行（场次、局号、摘要、座位名单与得分）
+    transactions  每局的最终转账，按类别/付款人/收款人建索引；类别存类别码，
+                  说明存 (模板码, JSON 参数)，读出时再拼文字
+    flows         每局按类别的座位间净额：只存 a < b 的非零项，amount > 0 表示 a 净付给 b
+    totals        每场次每座位的累计分，随记账在同一事务内更新
+    flow_totals   每场次按类别的净额矩阵累计，同上随记账/撤销增量更新
+    round_stats   每局每座位的统计计数（胡/自摸/点炮/责任鸡/包赔，见 stats.STAT_FIELDS）
+    player_stats  每场次每座位的统计累计与连胜/连败，随记账增量更新；撤销/重算后重扫连胜
+    sessions      每场次的局数、最新局号与版本号（每次写入 +1，导出等缓存按此失效）
+    events        每局的完整录入 (RoundInput JSON)、所用规则的指纹与规则依赖位掩码；
+                  早于此表的旧局没有录入，无法重算
+    rulesets      规则指纹 -> 规则 JSON
+改规则后 rescore() 只重算依赖位与改动项相交的局，apply_rescore() 在一个事务里写回。
+内存：明细（转账、净额、录入）都在库文件里按需读出，连接的页缓存限定为 CACHE_KIB，
+进程常驻内存不随账本大小增长。
+"""
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .kernel import CAT_CODE, CATEGORIES, R_TEXT, FlowMatrix, Transaction, empty_flows, flow_matrix
+from .rounds import Rules, RoundInput, score_round
+from .stats import (
+    NO_STREAK, S_SCORE, S_WON, STAT_FIELDS, STREAK_FIELDS, PlayerStats, build_stats, category_income, round_row,
+    scan_streaks, step_streak, window_stats,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rounds (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    session  TEXT    NOT NULL,
+    round    INTEGER NOT NULL,
+    summary  TEXT    NOT NULL,
+    players  TEXT    NOT NULL,
+    scores   TEXT    NOT NULL,
+    created  REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rounds_session ON rounds(session, id);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    round_id INTEGER NOT NULL REFERENCES rounds(id) ON DELETE CASCADE,
+    seq      INTEGER NOT NULL,
+    session  TEXT    NOT NULL,
+    cat      INTEGER NOT NULL,
+    payer    TEXT    NOT NULL,
+    receiver TEXT    NOT NULL,
+    amount   INTEGER NOT NULL,
+    code     INTEGER NOT NULL,
+    args     TEXT    NOT NULL,
+    PRIMARY KEY (round_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_tx_category ON transactions(session, cat);
+CREATE INDEX IF NOT EXISTS idx_tx_payer ON transactions(session, payer);
+CREATE INDEX IF NOT EXISTS idx_tx_receiver ON transactions(session, receiver);
+
+CREATE TABLE IF NOT EXISTS flows (
+    round_id INTEGER NOT NULL REFERENCES rounds(id) ON DELETE CASCADE,
+    cat      INTEGER NOT NULL,
+    a        INTEGER NOT NULL,
+    b        INTEGER NOT NULL,
+    amount   INTEGER NOT NULL,
+    PRIMARY KEY (round_id, cat, a, b)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS flow_totals (
+    session TEXT    NOT NULL,
+    cat     INTEGER NOT NULL,
+    a       INTEGER NOT NULL,
+    b       INTEGER NOT NULL,
+    amount  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session, cat, a, b)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS totals (
+    session TEXT    NOT NULL,
+    seat    INTEGER NOT NULL,
+    score   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session, seat)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS round_stats (
+    round_id    INTEGER NOT NULL REFERENCES rounds(id) ON DELETE CASCADE,
+    seat        INTEGER NOT NULL,
+    score       INTEGER NOT NULL,
+    won         INTEGER NOT NULL,
+    zimo        INTEGER NOT NULL,
+    dianpao     INTEGER NOT NULL,
+    liable      INTEGER NOT NULL,
+    baopei_paid INTEGER NOT NULL,
+    baopei_recv INTEGER NOT NULL,
+    PRIMARY KEY (round_id, seat)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS player_stats (
+    session     TEXT    NOT NULL,
+    seat        INTEGER NOT NULL,
+    rounds      INTEGER NOT NULL DEFAULT 0,
+    score       INTEGER NOT NULL DEFAULT 0,
+    won         INTEGER NOT NULL DEFAULT 0,
+    zimo        INTEGER NOT NULL DEFAULT 0,
+    dianpao     INTEGER NOT NULL DEFAULT 0,
+    liable      INTEGER NOT NULL DEFAULT 0,
+    baopei_paid INTEGER NOT NULL DEFAULT 0,
+    baopei_recv INTEGER NOT NULL DEFAULT 0,
+    win_run     INTEGER NOT NULL DEFAULT 0,
+    win_best    INTEGER NOT NULL DEFAULT 0,
+    lose_run    INTEGER NOT NULL DEFAULT 0,
+    lose_best   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session, seat)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS events (
+    round_id INTEGER PRIMARY KEY REFERENCES rounds(id) ON DELETE CASCADE,
+    input    TEXT    NOT NULL,
+    rules_fp TEXT    NOT NULL,
+    deps     INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS rulesets (
+    fp    TEXT PRIMARY KEY,
+    rules TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sessions (
+    session    TEXT PRIMARY KEY,
+    n_rounds   INTEGER NOT NULL DEFAULT 0,
+    last_round INTEGER NOT NULL DEFAULT 0,
+    version    INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+CACHE_KIB = 2048  # 连接的页缓存上限
+
+_TX_COLS = "payer, receiver, amount, code, args, cat"
+_STAT_COLS = ", ".join(STAT_FIELDS)
+# 统计累计按座位加上增量（撤销/重算时为负）；连胜/连败另行写入
+_STATS_ADD = (
+    f"INSERT INTO player_stats (session, seat, rounds, {_STAT_COLS}) VALUES (?,?,?,{','.join('?' * len(STAT_FIELDS))}) "
+    "ON CONFLICT(session, seat) DO UPDATE SET rounds = rounds + excluded.rounds, "
+    + ", ".join(f"{c} = {c} + excluded.{c}" for c in STAT_FIELDS))
+_STREAK_SET = (f"UPDATE player_stats SET {', '.join(f'{c} = ?' for c in STREAK_FIELDS)} "
+               "WHERE session = ? AND seat = ?")
+
+# (局号, 摘要, 座位名单, 得分, 最终转账[, 录入, 规则])；带上录入与规则的局以后才能按新规则重算
+RoundRecord = Tuple[int, str, Sequence[str], Dict[str, int], Sequence[Transaction]]
+Event = Tuple[RoundInput, Rules]
+
+
+def _flow_rows(flows: FlowMatrix) -> List[Tuple[int, int, int, int]]:
+    """净额矩阵的稀疏上三角 (cat, a, b, amount)"""
+    return [(c, a, b, m[a][b]) for c, m in enumerate(flows)
+            for a in range(len(m)) for b in range(a + 1, len(m)) if m[a][b]]
+
+
+def _flows_from_rows(rows, n_seats: int) -> FlowMatrix:
+    flows = empty_flows(n_seats)
+    for c, a, b, amount in rows:
+        if a < n_seats and b < n_seats:
+            flows[c][a][b] += amount
+            flows[c][b][a] -= amount
+    return flows
+
+
+class VersionConflict(ValueError):
+    """写入时账本版本号与调用方读到的不一致（多设备同时记账/撤销）"""
+
+
+@dataclass
+class RescoreChange:
+    round_id: int
+    round: int
+    players: List[str]
+    old_scores: List[int]
+    new_scores: List[int]
+    transactions: List[Transaction]
+
+
+@dataclass
+class RescorePlan:
+    """rescore() 的试算结果：逐局新旧得分与按人名的累计差，确认后交给 apply_rescore()"""
+    session: str
+    rules: Rules
+    changes: List[RescoreChange]
+    before: Dict[str, int]
+    checked: List[int] = field(default_factory=list)   # 有录入、本次改记为新规则的局 id
+    skipped: int = 0                                    # 没有录入（旧账）的局数
+    rescored: int = 0                                   # 实际重算的局数
+    elapsed: float = 0.0
+
+    @property
+    def diff(self) -> Dict[str, int]:
+        """按最新座位名单的累计分变化"""
+        out = dict.fromkeys(self.before, 0)
+        names = list(self.before)
+        for ch in self.changes:
+            for seat, (o, n) in enumerate(zip(ch.old_scores, ch.new_scores)):
+                if seat < len(names): out[names[seat]] += n - o
+        return out
+
+    @property
+    def after(self) -> Dict[str, int]:
+        return {p: v + self.diff[p] for p, v in self.before.items()}
+
+
+def _rescore_chunk(args) -> List[Tuple[Dict[str, int], List[Transaction]]]:
+    rules, inputs = args
+    out = []
+    for d in inputs:
+        res = score_round(RoundInput.from_dict(d), rules)
+        if res.error is not None: raise ValueError(res.error)
+        out.append((res.scores, res.transactions))
+    return out
+
+
+class LedgerStore:
+    """线程安全的账本存储；一个进程共用一个实例（Streamlit 下用 st.cache_resource 持有）"""
+
+    def __init__(self, path: str = "ledger.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.execute(f"PRAGMA cache_size=-{CACHE_KIB}")
+        self._migrate_text_reasons()
+        self._db.executescript(SCHEMA)
+        if "version" not in [r[1] for r in self._db.execute("PRAGMA table_info(sessions)")]:
+            self._db.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._backfill_flows()
+        self._backfill_stats()
+
+    def _migrate_text_reasons(self):
+        """旧库的转账表存类别名与说明文字：整表转成类别码 + 纯文字模板 (R_TEXT)"""
+        cols = [r[1] for r in self._db.execute("PRAGMA table_info(transactions)")]
+        if "reason" not in cols: return
+        case = " ".join(f"WHEN '{c}' THEN {i}" for i, c in enumerate(CATEGORIES))
+        self._db.executescript(f"""
+            BEGIN;
+            DROP INDEX idx_tx_category; DROP INDEX idx_tx_payer; DROP INDEX idx_tx_receiver;
+            ALTER TABLE transactions RENAME TO transactions_v1;
+            {SCHEMA}
+            INSERT INTO transactions SELECT round_id, seq, session, CASE category {case} END,
+                payer, receiver, amount, {R_TEXT}, json_array(reason) FROM transactions_v1;
+            DROP TABLE transactions_v1;
+            COMMIT;
+        """)
+
+    def _backfill_flows(self):
+        """早于净额矩阵的账本：按已存转账补算每局矩阵与场次累计"""
+        db = self._db
+        if db.execute("SELECT 1 FROM flows LIMIT 1").fetchone() or \
+                not db.execute("SELECT 1 FROM transactions LIMIT 1").fetchone(): return
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for rid, players in db.execute("SELECT id, players FROM rounds").fetchall():
+                txs = [self._tx(*r) for r in db.execute(
+                    f"SELECT {_TX_COLS} FROM transactions WHERE round_id = ? ORDER BY seq", (rid,))]
+                db.executemany("INSERT INTO flows VALUES (?,?,?,?,?)",
+                               [(rid,) + r for r in _flow_rows(flow_matrix(json.loads(players), txs))])
+            db.execute("DELETE FROM flow_totals")
+            db.execute("INSERT INTO flow_totals SELECT r.session, f.cat, f.a, f.b, sum(f.amount) "
+                       "FROM flows f JOIN rounds r ON r.id = f.round_id GROUP BY r.session, f.cat, f.a, f.b")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _backfill_stats(self):
+        """早于统计表的账本：按已存转账补算每局计数，再汇总出场次累计与连胜"""
+        db = self._db
+        if db.execute("SELECT 1 FROM round_stats LIMIT 1").fetchone() or \
+                not db.execute("SELECT 1 FROM rounds LIMIT 1").fetchone(): return
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for rid, players, scores in db.execute("SELECT id, players, scores FROM rounds").fetchall():
+                txs = [self._tx(*r) for r in db.execute(
+                    f"SELECT {_TX_COLS} FROM transactions WHERE round_id = ? ORDER BY seq", (rid,))]
+                db.executemany("INSERT INTO round_stats VALUES (?,?,?,?,?,?,?,?,?)",
+                               [(rid, seat, *row) for seat, row in
+                                enumerate(round_row(json.loads(players), json.loads(scores), txs))])
+            db.execute("DELETE FROM player_stats")
+            db.execute(f"INSERT INTO player_stats (session, seat, rounds, {_STAT_COLS}) "
+                       f"SELECT r.session, s.seat, count(*), {', '.join(f'sum(s.{c})' for c in STAT_FIELDS)} "
+                       "FROM round_stats s JOIN rounds r ON r.id = s.round_id GROUP BY r.session, s.seat")
+            for (session,) in db.execute("SELECT DISTINCT session FROM player_stats").fetchall():
+                self._rescan_streaks(db.cursor(), session)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _rescan_streaks(cur, session: str):
+        """撤销/重算后连胜的最长值无法倒推：按局序重扫本场次的计数行（只读得分与胡两列）"""
+        rows = cur.execute(
+            "SELECT s.round_id, s.seat, s.score, s.won FROM round_stats s JOIN rounds r ON r.id = s.round_id "
+            "WHERE r.session = ? ORDER BY s.round_id, s.seat", (session,)).fetchall()
+        rounds, last = [], None
+        for rid, seat, score, won in rows:
+            if rid != last:
+                rounds.append([])
+                last = rid
+            rounds[-1].append((score, won))
+        n_seats = max((row[1] + 1 for row in rows), default=0)
+        # 先清零：撤掉最后一局后可能一局不剩（或座位变少），没扫到的座位不能留着旧值
+        cur.execute(f"UPDATE player_stats SET {', '.join(f'{c} = 0' for c in STREAK_FIELDS)} WHERE session = ?",
+                    (session,))
+        cur.executemany(_STREAK_SET, [(*st, session, seat) for seat, st in enumerate(scan_streaks(rounds, n_seats))])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ---------- 写入 ----------
+    def append_round(self, session: str, round_no: int, summary: str, players: Sequence[str],
+                     scores: Dict[str, int], transactions: Sequence[Transaction],
+                     event: Optional[Event] = None, expected_version: Optional[int] = None) -> int:
+        return self.append_rounds(session, [(round_no, summary, players, scores, transactions) + (event or ())],
+                                  expected_version)[0]
+
+    @staticmethod
+    def _check_version(cur, session: str, expected: Optional[int]):
+        """乐观并发：写入方带上它读到的版本号，期间账本被别的设备改过就拒绝"""
+        if expected is None: return
+        row = cur.execute("SELECT version FROM sessions WHERE session = ?", (session,)).fetchone()
+        if (row[0] if row else 0) != expected: raise VersionConflict("账本已被其他设备更新，请刷新后再操作")
+
+    @staticmethod
+    def _put_event(cur, rid: int, r: RoundInput, rules: Rules, seen: Dict[int, tuple]):
+        """seen: 本批已写过的规则 id(rules) -> (rules, 指纹)；批量导入时整批共用一套规则，只算一次指纹"""
+        hit = seen.get(id(rules))
+        if hit is None or hit[0] is not rules:
+            hit = seen[id(rules)] = (rules, rules.fingerprint())
+            cur.execute("INSERT OR IGNORE INTO rulesets VALUES (?,?)",
+                        (hit[1], json.dumps(rules.to_dict(), ensure_ascii=False)))
+        fp = hit[1]
+        cur.execute("INSERT INTO events VALUES (?,?,?,?)",
+                    (rid, json.dumps(r.to_dict(), ensure_ascii=False), fp, r.rule_deps()))
+
+    def append_rounds(self, session: str, records: Iterable[RoundRecord],
+                      expected_version: Optional[int] = None) -> List[int]:
+        """批量记账：所有局、转账与累计分在同一个事务里写入，返回各局 id；
+        给了 expected_version 时版本号不符则整批不写，抛 VersionConflict"""
+        now = time.time()
+        ids = []
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_version(cur, session, expected_version)
+                delta: Dict[int, int] = {}
+                flow_delta: Dict[Tuple[int, int, int], int] = {}
+                last = 0
+                seen_rules: Dict[int, tuple] = {}
+                args_text: Dict[tuple, str] = {}  # 说明参数 -> JSON，重复度很高
+                stat_delta: Dict[int, List[int]] = {}  # 座位 -> [局数, *STAT_FIELDS]
+                streak = {seat: tuple(st) for seat, *st in cur.execute(
+                    f"SELECT seat, {', '.join(STREAK_FIELDS)} FROM player_stats WHERE session = ?", (session,))}
+                for round_no, summary, players, scores, txs, *event in records:
+                    seat_scores = [int(scores.get(p, 0)) for p in players]
+                    cur.execute(
+                        "INSERT INTO rounds (session, round, summary, players, scores, created) VALUES (?,?,?,?,?,?)",
+                        (session, round_no, summary, json.dumps(list(players), ensure_ascii=False),
+                         json.dumps(seat_scores), now))
+                    rid = cur.lastrowid
+                    ids.append(rid)
+                    if event: self._put_event(cur, rid, *event, seen_rules)
+                    tx_rows = []
+                    for k, t in enumerate(txs):
+                        a = args_text.get(t.args)
+                        if a is None: a = args_text[t.args] = json.dumps(t.args, ensure_ascii=False)
+                        tx_rows.append((rid, k, session, t.cat, t.payer, t.receiver, t.amount, t.code, a))
+                    cur.executemany("INSERT INTO transactions VALUES (?,?,?,?,?,?,?,?,?)", tx_rows)
+                    rows = _flow_rows(flow_matrix(players, txs))
+                    cur.executemany("INSERT INTO flows VALUES (?,?,?,?,?)", [(rid,) + r for r in rows])
+                    for c, a, b, amount in rows: flow_delta[c, a, b] = flow_delta.get((c, a, b), 0) + amount
+                    for seat, s in enumerate(seat_scores): delta[seat] = delta.get(seat, 0) + s
+                    stat_rows = round_row(players, seat_scores, txs)
+                    cur.executemany("INSERT INTO round_stats VALUES (?,?,?,?,?,?,?,?,?)",
+                                    [(rid, seat, *row) for seat, row in enumerate(stat_rows)])
+                    for seat, row in enumerate(stat_rows):
+                        acc = stat_delta.get(seat)
+                        if acc is None: acc = stat_delta[seat] = [0] * (1 + len(STAT_FIELDS))
+                        acc[0] += 1
+                        for k, v in enumerate(row, 1): acc[k] += v
+                        streak[seat] = step_streak(streak.get(seat, NO_STREAK), row[S_WON], row[S_SCORE])
+                    last = max(last, round_no)
+                cur.executemany(
+                    "INSERT INTO totals (session, seat, score) VALUES (?,?,?) "
+                    "ON CONFLICT(session, seat) DO UPDATE SET score = score + excluded.score",
+                    [(session, seat, s) for seat, s in delta.items()])
+                cur.executemany(
+                    "INSERT INTO flow_totals (session, cat, a, b, amount) VALUES (?,?,?,?,?) "
+                    "ON CONFLICT(session, cat, a, b) DO UPDATE SET amount = amount + excluded.amount",
+                    [(session,) + k + (v,) for k, v in flow_delta.items()])
+                cur.executemany(_STATS_ADD, [(session, seat, *acc) for seat, acc in stat_delta.items()])
+                cur.executemany(_STREAK_SET, [(*st, session, seat) for seat, st in streak.items()])
+                cur.execute(
+                    "INSERT INTO sessions (session, n_rounds, last_round, version) VALUES (?,?,?,1) "
+                    "ON CONFLICT(session) DO UPDATE SET n_rounds = n_rounds + excluded.n_rounds, "
+                    "last_round = max(last_round, excluded.last_round), version = version + 1",
+                    (session, len(ids), last))
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        return ids
+
+    def delete_last_round(self, session: str, expected_version: Optional[int] = None) -> Optional[dict]:
+        """撤销本场次最后一局：删除局与转账并回退累计分，返回被删的局记录"""
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_version(cur, session, expected_version)
+                row = cur.execute(
+                    "SELECT id, round, summary, players, scores FROM rounds WHERE session = ? "
+                    "ORDER BY id DESC LIMIT 1", (session,)).fetchone()
+                if row is None:
+                    cur.execute("ROLLBACK")
+                    return None
+                rec = self._round_row(row)
+                flows = cur.execute("SELECT cat, a, b, amount FROM flows WHERE round_id = ?", (rec["id"],))
+                cur.executemany(
+                    "UPDATE flow_totals SET amount = amount - ? WHERE session = ? AND cat = ? AND a = ? AND b = ?",
+                    [(amount, session, c, a, b) for c, a, b, amount in flows.fetchall()])
+                stats = cur.execute(f"SELECT seat, {_STAT_COLS} FROM round_stats WHERE round_id = ?", (rec["id"],))
+                cur.executemany(_STATS_ADD, [(session, seat, -1, *(-v for v in row)) for seat, *row in stats.fetchall()])
+                cur.execute("DELETE FROM rounds WHERE id = ?", (rec["id"],))
+                self._rescan_streaks(cur, session)
+                cur.executemany("UPDATE totals SET score = score - ? WHERE session = ? AND seat = ?",
+                                [(s, session, seat) for seat, s in enumerate(rec["scores"].values())])
+                last = cur.execute("SELECT max(round) FROM rounds WHERE session = ?", (session,)).fetchone()[0]
+                cur.execute("UPDATE sessions SET n_rounds = n_rounds - 1, last_round = ?, version = version + 1 "
+                            "WHERE session = ?",
+                            (last or 0, session))
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        return rec
+
+    # ---------- 改规则重算 ----------
+    def rescore(self, session: str, rules: Rules, jobs: int = 1, chunk: int = 256) -> RescorePlan:
+        """按新规则试算本场次：只重算规则依赖与改动项相交的局，不写库。
+        jobs > 1 且待算局数超过一块时分给多个进程"""
+        t0 = time.perf_counter()
+        fps = self._query("SELECT DISTINCT e.rules_fp, s.rules FROM events e JOIN rounds r ON r.id = e.round_id "
+                          "JOIN rulesets s ON s.fp = e.rules_fp WHERE r.session = ?", (session,))
+        todo, checked = [], []
+        for fp, body in fps:
+            mask = Rules.from_dict(json.loads(body)).diff_mask(rules)
+            rows = self._query(
+                "SELECT e.round_id, r.round, r.players, r.scores, e.input, e.deps & ? FROM events e "
+                "JOIN rounds r ON r.id = e.round_id WHERE r.session = ? AND e.rules_fp = ?", (mask, session, fp))
+            checked += [row[0] for row in rows]
+            todo += [row[:5] for row in rows if row[5]]
+        total = self.session_info(session)[0]
+
+        inputs = [json.loads(row[4]) for row in todo]
+        chunks = [inputs[k:k + chunk] for k in range(0, len(inputs), chunk)]
+        if jobs > 1 and len(chunks) > 1:
+            from multiprocessing import Pool
+            with Pool(min(jobs, len(chunks))) as pool:
+                parts = pool.map(_rescore_chunk, [(rules, c) for c in chunks])
+        else:
+            parts = [_rescore_chunk((rules, c)) for c in chunks]
+        results = [x for part in parts for x in part]
+
+        changes = []
+        for (rid, round_no, players, old, _), (scores, txs) in zip(todo, results):
+            players, old = json.loads(players), json.loads(old)
+            new = [scores[p] for p in players]
+            old_txs = self.round_transactions(rid)
+            if new == old and [t.astuple() for t in txs] == [t.astuple() for t in old_txs]: continue
+            changes.append(RescoreChange(rid, round_no, players, old, new, txs))
+        return RescorePlan(session, rules, changes, self.balances(session), checked, total - len(checked),
+                           len(todo), time.perf_counter() - t0)
+
+    def apply_rescore(self, plan: RescorePlan):
+        """把试算结果写回：替换各局得分/转账/净额，增量修正累计，并把已检查的局记为新规则"""
+        fp = plan.rules.fingerprint()
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                for ch in plan.changes:
+                    row = cur.execute("SELECT scores FROM rounds WHERE id = ?", (ch.round_id,)).fetchone()
+                    if row is None or json.loads(row[0]) != ch.old_scores:
+                        raise ValueError("账本在试算后有变动，请重新试算")
+                    old_flows = cur.execute("SELECT cat, a, b, amount FROM flows WHERE round_id = ?",
+                                            (ch.round_id,)).fetchall()
+                    new_flows = _flow_rows(flow_matrix(ch.players, ch.transactions))
+                    cur.execute("DELETE FROM transactions WHERE round_id = ?", (ch.round_id,))
+                    cur.execute("DELETE FROM flows WHERE round_id = ?", (ch.round_id,))
+                    cur.executemany(
+                        "INSERT INTO transactions VALUES (?,?,?,?,?,?,?,?,?)",
+                        [(ch.round_id, k, plan.session, t.cat, t.payer, t.receiver, t.amount, t.code,
+                          json.dumps(t.args, ensure_ascii=False)) for k, t in enumerate(ch.transactions)])
+                    cur.executemany("INSERT INTO flows VALUES (?,?,?,?,?)", [(ch.round_id,) + r for r in new_flows])
+                    cur.execute("UPDATE rounds SET scores = ? WHERE id = ?", (json.dumps(ch.new_scores), ch.round_id))
+                    old_stats = cur.execute(f"SELECT seat, {_STAT_COLS} FROM round_stats WHERE round_id = ?",
+                                            (ch.round_id,)).fetchall()
+                    new_stats = round_row(ch.players, ch.new_scores, ch.transactions)
+                    cur.execute("DELETE FROM round_stats WHERE round_id = ?", (ch.round_id,))
+                    cur.executemany("INSERT INTO round_stats VALUES (?,?,?,?,?,?,?,?,?)",
+                                    [(ch.round_id, seat, *row) for seat, row in enumerate(new_stats)])
+                    cur.executemany(_STATS_ADD, [(plan.session, seat, 0, *(-v for v in row)) for seat, *row in old_stats]
+                                    + [(plan.session, seat, 0, *row) for seat, row in enumerate(new_stats)])
+                    cur.executemany(
+                        "INSERT INTO flow_totals (session, cat, a, b, amount) VALUES (?,?,?,?,?) "
+                        "ON CONFLICT(session, cat, a, b) DO UPDATE SET amount = amount + excluded.amount",
+                        [(plan.session, c, a, b, -m) for c, a, b, m in old_flows] +
+                        [(plan.session, c, a, b, m) for c, a, b, m in new_flows])
+                    cur.executemany(
+                        "INSERT INTO totals (session, seat, score) VALUES (?,?,?) "
+                        "ON CONFLICT(session, seat) DO UPDATE SET score = score + excluded.score",
+                        [(plan.session, seat, n - o) for seat, (o, n) in enumerate(zip(ch.old_scores, ch.new_scores))])
+                if plan.changes: self._rescan_streaks(cur, plan.session)
+                cur.execute("INSERT OR IGNORE INTO rulesets VALUES (?,?)",
+                            (fp, json.dumps(plan.rules.to_dict(), ensure_ascii=False)))
+                cur.executemany("UPDATE events SET rules_fp = ? WHERE round_id = ?", [(fp, rid) for rid in plan.checked])
+                cur.execute("UPDATE sessions SET version = version + 1 WHERE session = ?", (plan.session,))
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+
+    def round_event(self, round_id: int) -> Optional[Event]:
+        """某局的录入与所用规则；旧账没有时为 None"""
+        rows = self._query("SELECT e.input, s.rules FROM events e JOIN rulesets s ON s.fp = e.rules_fp "
+                           "WHERE e.round_id = ?", (round_id,))
+        if not rows: return None
+        return RoundInput.from_dict(json.loads(rows[0][0])), Rules.from_dict(json.loads(rows[0][1]))
+
+    # ---------- 查询 ----------
+    def _query(self, sql: str, args: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def totals(self, session: str, n_seats: Optional[int] = None) -> List[int]:
+        """按座位顺序的累计分；n_seats 缺省为本场次出现过的座位数"""
+        rows = self._query("SELECT seat, score FROM totals WHERE session = ?", (session,))
+        if n_seats is None: n_seats = max((seat + 1 for seat, _ in rows), default=0)
+        out = [0] * n_seats
+        for seat, score in rows:
+            if seat < n_seats: out[seat] = score
+        return out
+
+    def balances(self, session: str) -> Dict[str, int]:
+        """按最新一局的座位名单给累计分署名，供 payout.min_transfers 结账"""
+        rows = self._query("SELECT players FROM rounds WHERE session = ? ORDER BY id DESC LIMIT 1", (session,))
+        if not rows: return {}
+        players = json.loads(rows[0][0])
+        return dict(zip(players, self.totals(session, len(players))))
+
+    def session_info(self, session: str) -> Tuple[int, int]:
+        """(局数, 最新局号)"""
+        rows = self._query("SELECT n_rounds, last_round FROM sessions WHERE session = ?", (session,))
+        return rows[0] if rows else (0, 0)
+
+    def version(self, session: str) -> int:
+        """本场次的写入版本号，账本内容变了它就变"""
+        rows = self._query("SELECT version FROM sessions WHERE session = ?", (session,))
+        return rows[0][0] if rows else 0
+
+    def session_flows(self, session: str, n_seats: Optional[int] = None) -> FlowMatrix:
+        """本场次按类别的净额矩阵累计（座位序）"""
+        if n_seats is None: n_seats = len(self.totals(session))
+        return _flows_from_rows(
+            self._query("SELECT cat, a, b, amount FROM flow_totals WHERE session = ?", (session,)), n_seats)
+
+    def round_flows(self, round_id: int, n_seats: Optional[int] = None) -> FlowMatrix:
+        if n_seats is None:
+            rows = self._query("SELECT players FROM rounds WHERE id = ?", (round_id,))
+            n_seats = len(json.loads(rows[0][0])) if rows else 0
+        return _flows_from_rows(
+            self._query("SELECT cat, a, b, amount FROM flows WHERE round_id = ?", (round_id,)), n_seats)
+
+    def stats(self, session: str, last: Optional[int] = None) -> List[PlayerStats]:
+        """按最新一局座位名单的玩家统计。last 缺省时直接读场次累计（与局数无关）；
+        给了 last 时只汇总最近 last 局的计数行与净额（连胜/连败也只算窗口内）"""
+        rows = self._query("SELECT players FROM rounds WHERE session = ? ORDER BY id DESC LIMIT 1", (session,))
+        if not rows: return []
+        players = json.loads(rows[0][0])
+        n = len(players)
+        if last is None:
+            acc = self._query(f"SELECT seat, rounds, {_STAT_COLS}, {', '.join(STREAK_FIELDS)} FROM player_stats "
+                              "WHERE session = ? ORDER BY seat", (session,))
+            by_seat = {seat: row for seat, *row in acc}
+            return build_stats(players, [by_seat.get(k, ()) for k in range(n)],
+                               category_income(self.session_flows(session, n)))
+        window = "SELECT id FROM rounds WHERE session = ? ORDER BY id DESC LIMIT ?"
+        stat_rows = self._query(f"SELECT round_id, seat, {_STAT_COLS} FROM round_stats "
+                                f"WHERE round_id IN ({window}) ORDER BY round_id, seat", (session, last))
+        rounds, prev = [], None
+        for rid, seat, *row in stat_rows:
+            if rid != prev:
+                rounds.append([])
+                prev = rid
+            rounds[-1].append(row)
+        flows = _flows_from_rows(self._query(
+            f"SELECT cat, a, b, sum(amount) FROM flows WHERE round_id IN ({window}) GROUP BY cat, a, b",
+            (session, last)), n)
+        return window_stats(players, rounds, category_income(flows))
+
+    def page(self, session: str, offset: int = 0, limit: int = 20) -> List[dict]:
+        """最新在前的一页局记录：{id, round, summary, players, scores}"""
+        rows = self._query(
+            "SELECT id, round, summary, players, scores FROM rounds WHERE session = ? "
+            "ORDER BY id DESC LIMIT ? OFFSET ?", (session, limit, offset))
+        return [self._round_row(r) for r in rows]
+
+    def iter_rounds(self, session: str, batch: int = 500) -> Iterable[dict]:
+        """按记账顺序分批读出全部局（导出用），不一次性载入"""
+        last_id = 0
+        while True:
+            rows = self._query(
+                "SELECT id, round, summary, players, scores FROM rounds WHERE session = ? AND id > ? "
+                "ORDER BY id LIMIT ?", (session, last_id, batch))
+            if not rows: return
+            for r in rows: yield self._round_row(r)
+            last_id = rows[-1][0]
+
+    def iter_transactions(self, session: str, batch: int = 2000) -> Iterable[Tuple[int, int, int, Transaction]]:
+        """按记账顺序分批读出全部转账：(局 id, 局号, 序号, 转账)，按主键续读，不一次性载入。
+        参数 JSON 重复度很高，解析结果按原文记忆"""
+        first = self._query("SELECT min(id) FROM rounds WHERE session = ?", (session,))[0][0]
+        if first is None: return
+        last = (first - 1, -1)  # 从本场次第一局开始沿主键续读，跳过更早场次的流水
+        parsed: Dict[str, tuple] = {}
+        while True:
+            rows = self._query(
+                f"SELECT t.round_id, r.round, t.seq, {', '.join('t.' + c for c in _TX_COLS.split(', '))} "
+                "FROM transactions t JOIN rounds r ON r.id = t.round_id "
+                "WHERE +t.session = ? AND (t.round_id, t.seq) > (?, ?) ORDER BY t.round_id, t.seq LIMIT ?",
+                (session,) + last + (batch,))
+            if not rows: return
+            for rid, round_no, seq, payer, receiver, amount, code, args, cat in rows:
+                t = parsed.get(args)
+                if t is None: t = parsed[args] = tuple(json.loads(args))
+                yield rid, round_no, seq, Transaction(payer, receiver, amount, code, t, cat)
+            last = (rows[-1][0], rows[-1][2])
+
+    @staticmethod
+    def _tx(payer, receiver, amount, code, args, cat) -> Transaction:
+        return Transaction(payer, receiver, amount, code, tuple(json.loads(args)), cat)
+
+    def round_transactions(self, round_id: int) -> List[Transaction]:
+        rows = self._query(
+            f"SELECT {_TX_COLS} FROM transactions WHERE round_id = ? ORDER BY seq", (round_id,))
+        return [self._tx(*r) for r in rows]
+
+    def player_transactions(self, session: str, player: str, category: Optional[str] = None,
+                            limit: int = 200) -> List[Tuple[int, Transaction]]:
+        """某玩家（付或收）的转账，最新在前；可按类别过滤"""
+        cat = " AND cat = ?" if category else ""
+        args = (session, player) + ((CAT_CODE[category],) if category else ())
+        sql = (f"SELECT round_id, {_TX_COLS} FROM transactions "
+               "WHERE session = ? AND {col} = ?" + cat)
+        rows = self._query(
+            f"SELECT * FROM ({sql.format(col='payer')} UNION ALL {sql.format(col='receiver')}) "
+            f"ORDER BY round_id DESC LIMIT ?", args + args + (limit,))
+        return [(r[0], self._tx(*r[1:])) for r in rows]
+
+    @staticmethod
+    def _round_row(r) -> dict:
+        rid, round_no, summary, players, scores = r
+        players = json.loads(players)
+        return {"id": rid, "round": round_no, "summary": summary, "players": players,
+                "scores": dict(zip(players, json.loads(scores)))}
@@ -0,0 +1,225 @@
+"""可选的分阶段计时：计数器 + 直方图，导出为 Prometheus 文本格式。
+
+默认关闭。关闭时内核热路径只多一次模块全局判空；enable() 后每个结算阶段
+（校验/胡/杠/翻鸡/冲锋鸡/常鸡/落地鸡/过滤/汇总）各记一次耗时。
+
+    from zhuoji import metrics
+    metrics.enable()
+    metrics.serve(9464)          # 本地抓取: curl localhost:9464/metrics
+    print(metrics.REGISTRY.render())
+"""
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+from . import kernel
+
+# 秒；覆盖单个阶段的微秒级到整页重跑的秒级
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+STAGE_SECONDS = "zhuoji_stage_seconds"
+UI_SECONDS = "zhuoji_ui_seconds"
+SERVICE_SECONDS = "zhuoji_service_seconds"
+TABLE_BYTES = "zhuoji_table_bytes"
+HELP = {
+    STAGE_SECONDS: "结算管道各阶段耗时",
+    UI_SECONDS: "页面各区块耗时",
+    SERVICE_SECONDS: "结算服务各接口的请求耗时（含排队）",
+    "zhuoji_rounds_total": "已结算的局数",
+    "zhuoji_round_errors_total": "校验未通过的局数",
+    "zhuoji_service_rejected_total": "队列满被拒绝的请求数",
+    TABLE_BYTES: "内存中各场次牌桌的估算字节数",
+    "zhuoji_tables_evicted_total": "闲置或超出上限被放掉的牌桌数",
+}
+LABEL_KEYS = {UI_SECONDS: "section", SERVICE_SECONDS: "endpoint", TABLE_BYTES: "session"}  # 其余直方图的标签名为 stage
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect_left(BUCKETS, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估计分位数"""
+        if not self.count: return 0.0
+        rank, acc = q * self.count, 0
+        for k, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank: return BUCKETS[k] if k < len(BUCKETS) else BUCKETS[-1]
+        return BUCKETS[-1]
+
+
+class Registry:
+    """线程安全的指标表：直方图与仪表按 (指标名, 标签值) 区分，计数器按指标名"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hist: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[Tuple[str, str], float] = {}
+
+    def observe(self, name: str, label: str, seconds: float):
+        with self._lock:
+            h = self.hist.get((name, label))
+            if h is None: h = self.hist[name, label] = Histogram()
+            h.observe(seconds)
+
+    def lap(self, stage: str, t0: float) -> float:
+        """记一次阶段耗时（从 t0 到现在），返回现在，便于连续分段"""
+        now = time.perf_counter()
+        self.observe(STAGE_SECONDS, stage, now - t0)
+        return now
+
+    def inc(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_gauge(self, name: str, label: str, value: Optional[float]):
+        """仪表记当前值；None 表示该标签已不存在（如牌桌被放掉）"""
+        with self._lock:
+            if value is None: self.gauges.pop((name, label), None)
+            else: self.gauges[name, label] = value
+
+    def reset(self):
+        """只清累计量；仪表是当前状态，不清"""
+        with self._lock:
+            self.hist.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> List[dict]:
+        """调试面板用：每个 (指标, 标签) 一行"""
+        with self._lock:
+            items = sorted(self.hist.items())
+        return [{"metric": name, "label": label, "count": h.count, "mean_us": h.sum / h.count * 1e6,
+                 "p50_us": h.quantile(0.5) * 1e6, "p95_us": h.quantile(0.95) * 1e6, "total_ms": h.sum * 1e3}
+                for (name, label), h in items if h.count]
+
+    def render(self) -> str:
+        """Prometheus 文本格式 0.0.4"""
+        with self._lock:
+            hist = sorted((k, (list(h.counts), h.sum, h.count)) for k, h in self.hist.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        lines, seen = [], set()
+        for name, v in counters:
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter", f"{name} {v}"]
+        for (name, label), v in gauges:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} gauge"]
+            label = label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")  # 场次号来自 URL
+            lines.append(f'{name}{{{LABEL_KEYS.get(name, "stage")}="{label}"}} {v}')
+        for (name, label), (counts, total, count) in hist:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            key = LABEL_KEYS.get(name, "stage")
+            acc = 0
+            for le, c in zip(BUCKETS + (float("inf"),), counts):
+                acc += c
+                le_s = "+Inf" if le == float("inf") else repr(le)
+                lines.append(f'{name}_bucket{{{key}="{label}",le="{le_s}"}} {acc}')
+            lines.append(f'{name}_sum{{{key}="{label}"}} {total}')
+            lines.append(f'{name}_count{{{key}="{label}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def enable(registry: Registry = REGISTRY):
+    kernel._timer = registry
+
+
+def disable():
+    kernel._timer = None
+
+
+def enabled() -> bool:
+    return kernel._timer is not None
+
+
+class _Section:
+    __slots__ = ("registry", "label", "t0")
+
+    def __init__(self, registry: Registry, label: str):
+        self.registry, self.label = registry, label
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.registry.observe(UI_SECONDS, self.label, time.perf_counter() - self.t0)
+
+
+_NULL = nullcontext()
+
+
+def section(label: str):
+    """页面区块计时：with metrics.section("sidebar"): ...；未开启时返回共享的空上下文"""
+    registry = kernel._timer
+    return _NULL if registry is None else _Section(registry, label)
+
+
+def timed(label: str):
+    """装饰器版的 section，用于整个函数（如 Streamlit 片段）"""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kw):
+            with section(label): return fn(*args, **kw)
+        return wrapper
+    return deco
+
+
+def approx_size(obj, _seen=None) -> int:
+    """对象连同其引用的容器、字符串与实例属性的粗略字节数（sys.getsizeof 递归，共享对象只算一次）"""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen: return 0
+    seen.add(id(obj))
+    n = sys.getsizeof(obj)
+    if isinstance(obj, dict): n += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)): n += sum(approx_size(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"): n += approx_size(vars(obj), seen)
+    return n
+
+
+_server: Optional[object] = None
+
+
+def serve(port: int = 9464, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+    """后台线程提供 GET /metrics；同一进程只启动一次"""
+    global _server
+    if _server is not None: return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=_server.serve_forever, name="zhuoji-metrics", daemon=True).start()
+    return _server
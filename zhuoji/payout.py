@@ -0,0 +1,162 @@
+"""结账方案：把各人净输赢清算成笔数最少的现金转账。
+
+n 个非零余额最少需要 n - k 笔，k 为余额能拆成的零和子集的最大个数（每个子集内部 |子集|-1 笔）。
+    1. 互为相反数的两人总有一个最优解让其单独成组，先直接配对；
+    2. 余下不超过 exact_limit 人时按子集做记忆化 DP（NumPy 按人数分层），求出最大 k；
+    3. 人数更多或超出时间预算时用启发式：找三人零和组，剩下的按最大欠款对最大应收贪心配对。
+结果附带下界与差距（笔数 - 下界），差距为 0 即已证明最优。
+"""
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+Transfer = Tuple[str, str, int]  # (付款人, 收款人, 金额)
+
+
+@dataclass
+class PayoutPlan:
+    transfers: List[Transfer]
+    lower_bound: int
+    exact: bool        # 零和子集划分已穷举求得
+    elapsed: float     # 秒
+
+    @property
+    def gap(self) -> int:
+        return len(self.transfers) - self.lower_bound
+
+    @property
+    def optimal(self) -> bool:
+        return self.exact or self.gap == 0
+
+
+def merge_balances(*groups: Mapping[str, int]) -> Dict[str, int]:
+    """多桌/多场次的净输赢按人名合并"""
+    out: Dict[str, int] = defaultdict(int)
+    for g in groups:
+        for p, v in g.items(): out[p] += int(v)
+    return dict(out)
+
+
+def _pay_group(group: List[Tuple[str, int]], out: List[Transfer]):
+    """一个零和组内按 最大欠款 ↔ 最大应收 贪心配对，恰好 len(group)-1 笔（末笔同时结清两人）"""
+    debt = sorted([[p, -v] for p, v in group if v < 0], key=lambda x: -x[1])
+    cred = sorted([[p, v] for p, v in group if v > 0], key=lambda x: -x[1])
+    i = j = 0
+    while i < len(debt) and j < len(cred):
+        amt = min(debt[i][1], cred[j][1])
+        out.append((debt[i][0], cred[j][0], amt))
+        debt[i][1] -= amt
+        cred[j][1] -= amt
+        if debt[i][1] == 0: i += 1
+        if cred[j][1] == 0: j += 1
+
+
+def _pair_opposites(items: List[Tuple[str, int]]) -> Tuple[List[List[Tuple[str, int]]], List[Tuple[str, int]]]:
+    """取出所有 (x, -x) 配对，返回 (二人组, 余下)"""
+    waiting: Dict[int, List[Tuple[str, int]]] = defaultdict(list)
+    pairs = []
+    for it in items:
+        match = waiting.get(-it[1])
+        if match:
+            pairs.append([match.pop(), it])
+        else:
+            waiting[it[1]].append(it)
+    return pairs, [it for bucket in waiting.values() for it in bucket]
+
+
+def _take_triples(items: List[Tuple[str, int]]) -> Tuple[List[List[Tuple[str, int]]], List[Tuple[str, int]]]:
+    """贪心取出三人零和组（两个同号 + 一个抵消二者之和），每轮 O(n²)"""
+    left = list(items)
+    triples = []
+    found = True
+    while found:
+        found = False
+        where: Dict[int, List[int]] = defaultdict(list)
+        for k, (_, v) in enumerate(left): where[v].append(k)
+        for a in range(len(left)):
+            for b in range(a + 1, len(left)):
+                va, vb = left[a][1], left[b][1]
+                if (va > 0) != (vb > 0): continue
+                c = next((k for k in where.get(-(va + vb), ()) if k != a and k != b), None)
+                if c is None: continue
+                triples.append([left[a], left[b], left[c]])
+                left = [it for k, it in enumerate(left) if k not in (a, b, c)]
+                found = True
+                break
+            if found: break
+    return triples, left
+
+
+def _lower_bound(n_pairs: int, rest: List[Tuple[str, int]]) -> int:
+    """已无相反数配对时，零和组至少 3 人且须同时含正负：k ≤ 配对数 + min(正数个数, 负数个数, n/3)"""
+    pos = sum(1 for _, v in rest if v > 0)
+    k_max = n_pairs + min(pos, len(rest) - pos, len(rest) // 3)
+    return 2 * n_pairs + len(rest) - k_max
+
+
+def _zero_sum_partition(items: List[Tuple[str, int]], deadline: float) -> Optional[List[List[Tuple[str, int]]]]:
+    """子集 DP：dp[S] = S 内最多能拆出的零和组数（S 本身零和时 +1）；超时返回 None"""
+    import numpy as np  # 延到第一次精确求解才加载，只导入本模块（或整个内核）不付 NumPy 的启动成本
+    n = len(items)
+    full = (1 << n) - 1
+    sums = np.zeros(1, dtype=np.int64)
+    for _, v in items: sums = np.concatenate([sums, sums + v])
+    zero = (sums == 0).astype(np.int8)
+    masks = np.arange(full + 1, dtype=np.int64)
+    popcount = np.zeros(full + 1, dtype=np.int8)
+    for i in range(n): popcount += (masks >> i & 1).astype(np.int8)
+    order = np.argsort(popcount, kind="stable")
+    bounds = np.searchsorted(popcount[order], np.arange(n + 2))
+    dp = np.zeros(full + 1, dtype=np.int8)
+    for k in range(1, n + 1):
+        if time.perf_counter() > deadline: return None
+        layer = order[bounds[k]:bounds[k + 1]]
+        for i in range(n):
+            sel = layer[(layer >> i & 1).astype(bool)]
+            dp[sel] = np.maximum(dp[sel], dp[sel ^ (1 << i)])
+        dp[layer] += zero[layer]
+
+    # 回溯：依次拿掉一人且保持 dp 最优，剩余集合和为 0 处即组的分界
+    groups, cur, mask = [], [], full
+    while mask:
+        z = zero[mask]
+        for i in range(n):
+            if mask >> i & 1 and dp[mask ^ (1 << i)] == dp[mask] - z: break
+        cur.append(items[i])
+        mask ^= 1 << i
+        if sums[mask] == 0:
+            groups.append(cur)
+            cur = []
+    return groups
+
+
+def min_transfers(balances: Mapping[str, int], time_budget: float = 0.5, exact_limit: int = 20) -> PayoutPlan:
+    """净输赢（总和须为 0）→ 最少笔数的转账方案"""
+    t0 = time.perf_counter()
+    items = [(p, int(v)) for p, v in balances.items() if v]
+    if sum(v for _, v in items) != 0: raise ValueError("净输赢合计不为 0，无法清算")
+
+    pairs, rest = _pair_opposites(items)
+    lower = _lower_bound(len(pairs), rest)
+    groups, exact = None, not rest
+    if rest and len(rest) <= exact_limit:
+        groups = _zero_sum_partition(rest, t0 + time_budget)
+        exact = groups is not None
+    if groups is None:
+        # 启发式：取完三人组后，余下的若够小仍在剩余预算内精确拆分
+        triples, left = _take_triples(rest)
+        sub = _zero_sum_partition(left, t0 + time_budget) if 0 < len(left) <= exact_limit else None
+        groups = triples + (sub or ([left] if left else []))
+
+    transfers: List[Transfer] = []
+    for g in pairs + groups: _pay_group(g, transfers)
+    if exact: lower = len(transfers)
+    return PayoutPlan(transfers, lower, exact, time.perf_counter() - t0)
+
+
+def settle_tables(tables: Iterable[Mapping[str, int]], merge: bool = True, **kw) -> List[PayoutPlan]:
+    """多桌结账：merge=True 时同名玩家跨桌合并后统一清算，否则每桌各自清算"""
+    tables = list(tables)
+    if merge: return [min_transfers(merge_balances(*tables), **kw)]
+    return [min_transfers(t, **kw) for t in tables]
@@ -0,0 +1,252 @@
+"""慢速参照实现：逐条照规则直写的原始结算算法（拆出 zhuoji.kernel 之前 app.py 里的版本），只供对拍。
+
+字符串说明、逐笔 dataclass、先生成全部原始转账再过滤，不做任何缓存或编译；
+zhuoji.fuzz 要求内核的 calculate_all_pipeline 与这里的输出（得分、明细、报错文字）完全一致。
+改动计分规则时两边要一起改。
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+# -------------------------------
+# 1. 基础工具函数
+# -------------------------------
+def parse_card(card_str: str) -> Optional[Tuple[int, str]]:
+    if not card_str: return None
+    try:
+        suit = card_str[-1];
+        num = int(card_str[:-1])
+        if suit not in ["筒", "条", "万"] or num < 1 or num > 9: return None
+        return num, suit
+    except:
+        return None
+
+
+def get_fan_multipliers(fan_card: str) -> Tuple[int, int]:
+    parsed = parse_card(fan_card)
+    if not parsed: return 1, 1
+    num, suit = parsed
+    if num == 9 and suit == "条": return 2, 1
+    if num == 7 and suit == "筒": return 1, 2
+    return 1, 1
+
+
+@dataclass
+class Transaction:
+    payer: str;
+    receiver: str;
+    amount: int;
+    reason: str;
+    category: str
+
+    def reverse(self):
+        return Transaction(self.receiver, self.payer, self.amount, f"未听牌包赔-{self.reason}", self.category)
+
+
+def build_common_chicken_cfg(base_yj, mul_yj, base_b8, mul_b8, fan_card):
+    f_yj, f_b8 = get_fan_multipliers(fan_card)
+    return {"幺鸡": int(base_yj) * int(mul_yj) * int(f_yj), "八筒": int(base_b8) * int(mul_b8) * int(f_b8)}
+
+
+# -------------------------------
+# 2. 校验逻辑
+# -------------------------------
+def validate_objective_facts(players, fan_card, hand_counts, f_yj_who, f_yj_res, f_yj_tar, f_b8_who, f_b8_res, f_b8_tar,
+                             e_yj, e_b8, gang_data):
+    if fan_card and sum(hand_counts.get(p, 0) for p in players) > 4: raise ValueError("翻鸡总数超过4张")
+
+    def check_tile(name, f_who, f_res, f_tar, extra_map):
+        total = sum(extra_map.get(p, 0) for p in players)
+        gangs = [g for g in gang_data if g['card'] == name and g['type'] in ["暗杠", "补杠", "普通明杠", "责任明杠"]]
+        consumed = 0
+        if f_who and f_who != "无/未现":
+            if f_res == "被碰":
+                consumed = 3
+            elif f_res == "被明杠":
+                consumed = 4
+            elif f_res == "被胡":
+                consumed = 1
+            else:
+                consumed = 1
+
+        bu_gangs = [g for g in gangs if g['type'] == "补杠"]
+        if bu_gangs:
+            if len(bu_gangs) > 1: raise ValueError(f"{name}补杠重复")
+            if not (f_who and f_res == "被碰"): raise ValueError(f"{name}补杠需基于首出被碰")
+            if bu_gangs[0]['doer'] != f_tar: raise ValueError(f"{name}补杠者必须是碰牌者")
+
+        if gangs or (f_who and f_res == "被明杠"):
+            if total != 0: raise ValueError(f"{name}有杠时，非首出应为0")
+        else:
+            if consumed + total > 4: raise ValueError(f"{name}总数超限(>4)")
+
+    check_tile("幺鸡", f_yj_who, f_yj_res, f_yj_tar, e_yj)
+    check_tile("八筒", f_b8_who, f_b8_res, f_b8_tar, e_b8)
+
+
+def validate_consistency(players, winners, method, fyw, fyr, fyt, fbw, fbr, fbt, gang_data):
+    if method == "自摸" and (fyr == "被胡" or fbr == "被胡"): raise ValueError("自摸不能接首出胡")
+    if fyr == "被胡" and fbr == "被胡": raise ValueError("双常鸡不能同时被胡")
+
+    def check_gang_conflict(tile, res):
+        has_gang = any(g['card'] == tile for g in gang_data if g['type'] in ["暗杠", "补杠", "普通明杠", "责任明杠"])
+        if res == "被胡" and has_gang: raise ValueError(f"{tile}被胡时不能有杠")
+        if has_gang and res == "被胡": raise ValueError(f"{tile}有杠时不能被胡")
+
+    check_gang_conflict("幺鸡", fyr);
+    check_gang_conflict("八筒", fbr)
+
+
+# -------------------------------
+# 3. 核心计算管道
+# -------------------------------
+def settle_transactions(
+        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+        hand_total_counts, gang_data, common_v, fan_unit
+) -> List[Transaction]:
+    """校验并生成本局最终生效的转账列表（已应用未听牌过滤/包赔）"""
+    raw_txs = []
+    winners_set = set(winners)
+    ready_set = set([p for p in ready_list if p in players]) | winners_set
+
+    # 1. Validation
+    validate_objective_facts(players, fan_card, hand_total_counts, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+                             gang_data)
+    validate_consistency(players, winners, method, fyw, fyr, fyt, fbw, fbr, fbt, gang_data)
+
+    get_price = lambda c: int(common_v.get(c, 0))
+
+    # 2. Score Calculation
+    # 2.1 Hu
+    if winners:
+        base = rules_config.get(hu_shape, 0) + (rules_config.get("清一色加成", 0) if is_qing else 0)
+        spec = sum(rules_config.get(e, 0) for e in special_events)
+        total = base + spec
+        desc = f"{hu_shape}" + ("+清" if is_qing else "") + (f"+{'+'.join(special_events)}" if special_events else "")
+        if method == "自摸":
+            for p in players:
+                if p != winners[0]: raw_txs.append(Transaction(p, winners[0], total, f"自摸({desc})", "hu"))
+        elif method == "点炮" and loser:
+            for w in winners: raw_txs.append(Transaction(loser, w, total, f"点炮({desc})", "hu"))
+
+    # 2.2 Gang
+    for g in gang_data:
+        d, t, v, c = g['doer'], g['type'], g['victim'], g['card']
+        if not d: continue
+        score = 4 if t == "暗杠" else 2
+        if t in ["暗杠", "补杠"]:
+            for p in players:
+                if p != d: raw_txs.append(Transaction(p, d, score, f"{t}-{c}", "gang"))
+        elif v and v in players:
+            raw_txs.append(Transaction(v, d, score, f"{t}-{c}", "gang"))
+
+    # 2.3 Fan Chicken
+    for i in range(len(players)):
+        for j in range(i + 1, len(players)):
+            p1, p2 = players[i], players[j]
+            c1, c2 = hand_total_counts.get(p1, 0), hand_total_counts.get(p2, 0)
+            if c1 != c2:
+                win, los = (p1, p2) if c1 > c2 else (p2, p1)
+                raw_txs.append(Transaction(los, win, abs(c1 - c2) * fan_unit, "翻鸡互斥", "chicken_fan_luck"))
+
+    # 2.4 Common Chicken
+    # Charge
+    for card, who, res in [("幺鸡", fyw, fyr), ("八筒", fbw, fbr)]:
+        if who and who != "无/未现" and res == "安全":
+            u = get_price(card)
+            if u > 0:
+                for p in players:
+                    if p != who: raw_txs.append(Transaction(p, who, u * 2, f"冲锋鸡-{card}", "chicken_charge"))
+
+    # Extra (Split)
+    for card, e_map in [("幺鸡", extra_yj), ("八筒", extra_b8)]:
+        u = get_price(card)
+        if u > 0:
+            for owner, count in e_map.items():
+                if count > 0:
+                    for p in players:
+                        if p != owner: raw_txs.append(
+                            Transaction(p, owner, count * u, f"常鸡-{card}({count}张)", "chicken_extra"))
+
+    # Landed
+    landed = []
+    for g in gang_data:
+        if g['card'] in ["幺鸡", "八筒"]:
+            vic = g['victim']
+            if g['type'] == "补杠":
+                if g['card'] == "幺鸡" and fyr == "被碰" and fyt == g['doer']:
+                    vic = fyw
+                elif g['card'] == "八筒" and fbr == "被碰" and fbt == g['doer']:
+                    vic = fbw
+            landed.append({'o': g['doer'], 'c': g['card'], 'n': 4, 'v': vic, 't': g['type']})
+
+    # Add Peng
+    if fyr == "被碰" and fyt and not any(
+            g['card'] == "幺鸡" and g['type'] == "补杠" and g['doer'] == fyt for g in gang_data):
+        landed.append({'o': fyt, 'c': "幺鸡", 'n': 3, 'v': fyw, 't': "碰"})
+    if fbr == "被碰" and fbt and not any(
+            g['card'] == "八筒" and g['type'] == "补杠" and g['doer'] == fbt for g in gang_data):
+        landed.append({'o': fbt, 'c': "八筒", 'n': 3, 'v': fbw, 't': "碰"})
+
+    # Add Hu
+    def add_h(c, r, t, v):
+        if r == "被胡" and t:
+            for tar in (t if isinstance(t, list) else [t]): landed.append({'o': tar, 'c': c, 'n': 1, 'v': v, 't': "胡"})
+
+    add_h("幺鸡", fyr, fyt, fyw);
+    add_h("八筒", fbr, fbt, fbw)
+
+    for l in landed:
+        o, c, n, v, t = l['o'], l['c'], l['n'], l['v'], l['t']
+        u = get_price(c)
+        if u <= 0: continue
+        for p in players:
+            if p == o: continue
+            is_liable = (v and p == v)
+            amt = (2 * u) + (u * (n - 1)) if is_liable else (u * n)
+            reason = f"{t}鸡-{c}({n}张{',责任' if is_liable else ''})"
+            raw_txs.append(Transaction(p, o, amt, reason, "chicken_resp"))
+
+    # 3. Filter
+    final = []
+    zero_income = set()
+    if method == "点炮" and loser and ("热炮" in special_events or "抢杠胡" in special_events) and loser in ready_set:
+        zero_income.add(loser)
+
+    for tx in raw_txs:
+        if tx.receiver in zero_income: continue
+        if tx.receiver in ready_set:
+            final.append(tx)
+        else:
+            if tx.category in ["gang", "chicken_charge", "chicken_resp", "chicken_extra"]:
+                if tx.payer in ready_set: final.append(tx.reverse())
+            else:
+                pass
+
+    return final
+
+
+def aggregate_transactions(players, final: List[Transaction]) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+    scores = {p: 0 for p in players}
+    details = {p: [] for p in players}
+    for tx in final:
+        scores[tx.receiver] += tx.amount
+        scores[tx.payer] -= tx.amount
+        details[tx.receiver].append(f"{tx.reason}: +{tx.amount} ({tx.payer})")
+        details[tx.payer].append(f"{tx.reason}: -{tx.amount} ({tx.receiver})")
+
+    return scores, details
+
+
+def calculate_all_pipeline(
+        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+        hand_total_counts, gang_data, common_v, fan_unit
+) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+    final = settle_transactions(
+        players, winners, method, loser, hu_shape, is_qing, special_events, rules_config,
+        fan_card, ready_list, fyw, fyr, fyt, fbw, fbr, fbt, extra_yj, extra_b8,
+        hand_total_counts, gang_data, common_v, fan_unit
+    )
+    return aggregate_transactions(players, final)
@@ -0,0 +1,195 @@
+"""单局输入记录与批量结算入口。"""
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from .cache import SettlementCache, round_fingerprint
+from .kernel import (
+    CompiledRules, FlowMatrix, Transaction, Violation, build_common_chicken_cfg, check_round, compile_rules,
+    settle_compiled, settle_scores, aggregate_scores, render_details, flow_matrix,
+)
+
+DEFAULT_RULES_CONFIG: Dict[str, int] = {
+    "平胡": 5, "大对子": 15, "七对": 25, "龙七对": 50, "清一色加成": 25,
+    "报听胡": 25, "杀报": 50, "杠上花": 25, "抢杠胡": 25, "热炮": 25, "天胡": 75, "地胡": 50,
+}
+
+# 规则项 -> 位；RoundInput.rule_deps() 与 Rules.diff_mask() 都按此编码，两者相与非零才需重算
+RULE_KEYS = tuple(DEFAULT_RULES_CONFIG) + ("base_yj", "mul_yj", "base_b8", "mul_b8", "fan_unit")
+RULE_BIT = {k: 1 << i for i, k in enumerate(RULE_KEYS)}
+
+
+@dataclass
+class Rules:
+    """侧边栏规则：牌型/事件分值、常鸡底分与倍数、翻鸡互斥单位"""
+    rules_config: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_RULES_CONFIG))
+    base_yj: int = 2
+    mul_yj: int = 1
+    base_b8: int = 2
+    mul_b8: int = 1
+    fan_unit: int = 1
+
+    def common_v(self, fan_card: str) -> Dict[str, int]:
+        return build_common_chicken_cfg(self.base_yj, self.mul_yj, self.base_b8, self.mul_b8, fan_card)
+
+    def compile(self, fan_card: str) -> CompiledRules:
+        """常鸡单价随翻牌变化，因此按翻牌编译"""
+        return compile_rules(self.rules_config, self.common_v(fan_card), self.fan_unit)
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Rules":
+        known = {f.name for f in fields(cls)}
+        kw = {k: v for k, v in d.items() if k in known}
+        if "rules_config" in kw:
+            kw["rules_config"] = {**DEFAULT_RULES_CONFIG, **kw["rules_config"]}
+        return cls(**kw)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def fingerprint(self) -> str:
+        """稳定的短指纹（账本里按此引用一套规则）"""
+        body = json.dumps(self.to_dict(), ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(body.encode("utf-8")).hexdigest()[:16]
+
+    def _value(self, key: str) -> int:
+        return getattr(self, key) if key in _RULE_ATTRS else self.rules_config.get(key, 0)
+
+    def diff_mask(self, other: "Rules") -> int:
+        """两套规则取值不同的项（位掩码）"""
+        return sum(bit for k, bit in RULE_BIT.items() if self._value(k) != other._value(k))
+
+
+_RULE_ATTRS = frozenset(RULE_KEYS[len(DEFAULT_RULES_CONFIG):])
+
+
+@dataclass
+class RoundInput:
+    """一局的全部录入项，字段名与 calculate_all_pipeline 参数一致"""
+    players: List[str]
+    winners: List[str] = field(default_factory=list)
+    method: str = "自摸"
+    loser: Optional[str] = None
+    hu_shape: str = "平胡"
+    is_qing: bool = False
+    special_events: List[str] = field(default_factory=list)
+    fan_card: str = ""
+    ready_list: Optional[List[str]] = None  # None 表示全员听牌（与界面默认一致）
+    fyw: str = "无/未现"
+    fyr: str = "安全"
+    fyt: Union[str, List[str], None] = None
+    fbw: str = "无/未现"
+    fbr: str = "安全"
+    fbt: Union[str, List[str], None] = None
+    extra_yj: Dict[str, int] = field(default_factory=dict)
+    extra_b8: Dict[str, int] = field(default_factory=dict)
+    hand_total_counts: Dict[str, int] = field(default_factory=dict)
+    gang_data: List[dict] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "RoundInput":
+        return cls(**{k: v for k, v in d.items() if k in _ROUND_FIELDS})
+
+    def to_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    def fingerprint(self) -> tuple:
+        """规范化的可哈希指纹，相同指纹的局结算结果相同"""
+        return round_fingerprint(
+            self.players, self.winners, self.method, self.loser, self.hu_shape, self.is_qing, self.special_events,
+            self.fan_card, self.players if self.ready_list is None else self.ready_list,
+            self.fyw, self.fyr, self.fyt, self.fbw, self.fbr, self.fbt, self.extra_yj, self.extra_b8,
+            self.hand_total_counts, self.gang_data)
+
+    def violations(self) -> List[Violation]:
+        """全部校验问题，空列表表示通过"""
+        return check_round(self.players, self.winners, self.method, self.fan_card, self.hand_total_counts,
+                           self.fyw, self.fyr, self.fyt, self.fbw, self.fbr, self.fbt, self.extra_yj, self.extra_b8,
+                           self.gang_data)
+
+    def unknown_names(self) -> Dict[str, List[str]]:
+        """各人名字段里不在 players 中的名字（字典字段看键，杠表看 doer/victim）；
+        有的会让结算出错，有的会被静默当成没人（比如听牌名单里的错名），所以结算前先查"""
+        seats, out = set(self.players), {}
+        for f in NAME_FIELDS:
+            v = getattr(self, f)
+            names = [v] if isinstance(v, str) else list(v or ())
+            bad = [n for n in names if n not in seats and n != "无/未现"]
+            if bad: out[f] = bad
+        bad = [g.get(k) for g in self.gang_data if isinstance(g, dict) for k in ("doer", "victim")
+               if g.get(k) is not None and g.get(k) not in seats]
+        if bad: out["gang_data"] = bad
+        return out
+
+    def rule_deps(self) -> int:
+        """本局结果用到的规则项（位掩码）：与 kernel._iter_raw 的取值条件一一对应，只看结构不看分值，
+        所以分值从 0 改成非 0 也算依赖。杠分固定，不依赖规则"""
+        deps = 0
+        if self.winners and (self.method == "自摸" or self.loser):
+            deps |= RULE_BIT.get(self.hu_shape, 0)
+            if self.is_qing: deps |= RULE_BIT["清一色加成"]
+            for e in self.special_events: deps |= RULE_BIT.get(e, 0)
+        if len({self.hand_total_counts.get(p, 0) for p in self.players}) > 1: deps |= RULE_BIT["fan_unit"]
+        for tile, who, res, tar, extra, keys in (
+                ("幺鸡", self.fyw, self.fyr, self.fyt, self.extra_yj, ("base_yj", "mul_yj")),
+                ("八筒", self.fbw, self.fbr, self.fbt, self.extra_b8, ("base_b8", "mul_b8"))):
+            if (who and who != "无/未现" and res == "安全") or any(c > 0 for c in extra.values()) \
+                    or (res in ("被碰", "被胡") and tar) or any(g['card'] == tile for g in self.gang_data):
+                for k in keys: deps |= RULE_BIT[k]
+        return deps
+
+
+_ROUND_FIELDS = frozenset(f.name for f in fields(RoundInput))
+NAME_FIELDS = ("winners", "loser", "ready_list", "fyw", "fyt", "fbw", "fbt", "extra_yj", "extra_b8",
+               "hand_total_counts")
+
+
+def unknown_names_error(unknown: Dict[str, List[str]]) -> str:
+    """RoundInput.unknown_names() 的结果 -> 一行错误文字"""
+    return "未知玩家：" + "；".join(f"{f} {'、'.join(map(str, v))}" for f, v in unknown.items())
+
+
+@dataclass
+class RoundResult:
+    scores: Optional[Dict[str, int]] = None
+    transactions: List[Transaction] = field(default_factory=list)
+    error: Optional[str] = None                               # 第一条问题的文字，与界面报错一致
+    violations: List[Violation] = field(default_factory=list)  # 校验不通过时的全部问题
+
+    @property
+    def details(self) -> Dict[str, List[str]]:
+        return render_details(list(self.scores or {}), self.transactions)
+
+    @property
+    def flows(self) -> FlowMatrix:
+        return flow_matrix(list(self.scores or {}), self.transactions)
+
+
+def score_round(r: RoundInput, rules: Rules, compiled: Optional[CompiledRules] = None,
+                cache: Optional[SettlementCache] = None, transactions: bool = True) -> RoundResult:
+    """结算单局；校验不通过时返回带 error / violations 的结果，全程不走异常。传入 cache 时相同指纹的局只算一次。
+    transactions=False 时只算得分（settle_scores，不生成流水，也不查缓存）"""
+    violations = r.violations()
+    if violations: return RoundResult(error=violations[0].message, violations=violations)
+    ready = r.players if r.ready_list is None else r.ready_list
+    if compiled is None: compiled = rules.compile(r.fan_card)
+    args = (compiled, r.players, r.winners, r.method, r.loser, r.hu_shape, r.is_qing, r.special_events,
+            r.fan_card, ready, r.fyw, r.fyr, r.fyt, r.fbw, r.fbr, r.fbt, r.extra_yj, r.extra_b8,
+            r.hand_total_counts, r.gang_data)
+    if not transactions: return RoundResult(settle_scores(*args, checked=True))
+    settle = cache.settle_compiled if cache is not None else settle_compiled
+    final = settle(*args, checked=True)
+    return RoundResult(aggregate_scores(r.players, final), final)
+
+
+def score_many(rounds: Iterable[Union[RoundInput, dict]], rules: Optional[Rules] = None,
+               cache: Optional[SettlementCache] = None, transactions: bool = True) -> Iterator[RoundResult]:
+    """按输入顺序逐局结算，惰性产出结果，内存占用与局数无关；传入 cache 可对重复局去重"""
+    rules = rules or Rules()
+    by_fan: Dict[str, CompiledRules] = {}  # 同一规则下只随翻牌变化
+    for r in rounds:
+        if not isinstance(r, RoundInput): r = RoundInput.from_dict(r)
+        cr = by_fan.get(r.fan_card)
+        if cr is None: cr = by_fan[r.fan_card] = rules.compile(r.fan_card)
+        yield score_round(r, rules, cr, cache, transactions)
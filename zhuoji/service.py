@@ -0,0 +1,313 @@
+"""本机结算服务：asyncio 上的 JSON over HTTP，供记分机器人、赛程表等其他工具调用同一套规则内核。
+
+    python -m zhuoji.service --port 8765 -j 4 [--rules rules.json] [--batch 64] [--delay-ms 2] [--queue 2048]
+
+接口（POST，请求体为一局 RoundInput 字段的 JSON，也可以是多局的数组；可带 "rules" 覆盖默认规则，
+带 "round" 时原样回写）：
+    /score     只算得分          200 {"scores"}，校验不通过 422 {"error", "violations"}
+    /settle    得分 + 转账流水 + 每人明细（calculate_all_pipeline 的结果）
+    /validate  只校验            200 {"ok", "violations", "messages"}
+字段有误回 400 {"error"}；引用了 players 以外的人名时另带 "unknown": {字段: [人名]}。
+数组一次最多 --queue 局，更长的回 413；队列剩余空间不够整个数组时整批回 503，不会只算一部分。
+    GET /stats    各接口的 p50/p99/最大耗时、批大小、队列深度、拒绝数（JSON）
+    GET /metrics  Prometheus 文本格式
+violations 为 [问题码, 牌, 玩家]，问题码见 kernel.VALIDATION_FORMATS。
+
+并发请求先进有界队列，后台任务把同时到达的请求攒成小批（最多 --batch 个或等 --delay-ms），
+整批交给进程池，一次进程间往返摊到整批；在途批数不超过进程数的 2 倍。
+进程池跟不上时队列会满，新请求立即返回 503 并带 Retry-After，而不是无限排队拖慢所有人。
+-j 0 时在事件循环线程里直接算，适合单核机器或调试。
+"""
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+from .kernel import CompiledRules
+from .rounds import RoundInput, Rules, score_round, unknown_names_error
+
+ENDPOINTS = ("score", "settle", "validate")
+MAX_BODY = 1 << 20
+LATENCY_WINDOW = 8192  # 每个接口保留最近这么多次耗时，算分位数
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           422: "Unprocessable Entity", 503: "Service Unavailable"}
+
+# (接口, 一局的 JSON 对象)
+Job = Tuple[str, dict]
+Reply = Tuple[int, dict]
+
+_rules: Optional[Rules] = None
+_rulesets: Dict[str, Rules] = {}
+_compiled: Dict[Tuple[str, str], CompiledRules] = {}
+
+
+def _init_worker(rules: Rules):
+    global _rules
+    _rules = rules
+    _rulesets.clear()
+    _compiled.clear()
+
+
+def _rules_for(d: dict) -> Tuple[str, Rules]:
+    """请求自带规则时按其 JSON 复用已编译的规则；各缓存超过 256 项就整体清空"""
+    body = d.get("rules")
+    if body is None: return "", _rules
+    key = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    rules = _rulesets.get(key)
+    if rules is None:
+        if len(_rulesets) >= 256: _rulesets.clear()
+        rules = _rulesets[key] = Rules.from_dict(body)
+    return key, rules
+
+
+def _run_one(kind: str, d: dict) -> Reply:
+    try:
+        if not isinstance(d, dict): raise ValueError("每局须为 JSON 对象")
+        r = RoundInput.from_dict(d)
+        if not isinstance(r.players, list) or not r.players: raise ValueError("players 须为非空列表")
+        out = {"round": d["round"]} if "round" in d else {}
+        unknown = r.unknown_names()
+        if unknown:
+            out.update(error=unknown_names_error(unknown), unknown=unknown)
+            return 400, out
+        if kind == "validate":
+            v = r.violations()
+            out.update(ok=not v, violations=[list(x) for x in v], messages=[x.message for x in v])
+            return 200, out
+        key, rules = _rules_for(d)
+        cr = _compiled.get((key, r.fan_card))
+        if cr is None:
+            if len(_compiled) >= 256: _compiled.clear()
+            cr = _compiled[key, r.fan_card] = rules.compile(r.fan_card)
+        res = score_round(r, rules, cr, transactions=kind == "settle")
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        return 400, {"error": str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"}
+    if res.error is not None:
+        out.update(error=res.error, violations=[list(x) for x in res.violations])
+        return 422, out
+    out["scores"] = res.scores
+    if kind == "settle":
+        out["transactions"] = [{"payer": t.payer, "receiver": t.receiver, "amount": t.amount,
+                                "category": t.category, "reason": t.reason} for t in res.transactions]
+        out["details"] = res.details
+    return 200, out
+
+
+def _run_batch(jobs: List[Job]) -> List[Reply]:
+    return [_run_one(kind, d) for kind, d in jobs]
+
+
+class LatencyWindow:
+    """最近 LATENCY_WINDOW 次耗时（毫秒）的精确分位数；累计次数不受窗口限制"""
+
+    def __init__(self):
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+        self.count = 0
+
+    def add(self, ms: float):
+        self.recent.append(ms)
+        self.count += 1
+
+    def summary(self) -> dict:
+        v = sorted(self.recent)
+        if not v: return {"count": self.count}
+        q = lambda p: v[min(len(v) - 1, int(p * len(v)))]
+        return {"count": self.count, "p50_ms": q(0.5), "p99_ms": q(0.99), "max_ms": v[-1]}
+
+
+class ScoringService:
+    def __init__(self, rules: Optional[Rules] = None, jobs: int = 1, batch: int = 64, delay: float = 0.002,
+                 queue: int = 2048, registry: metrics.Registry = metrics.REGISTRY):
+        self.rules, self.jobs, self.batch, self.delay = rules or Rules(), jobs, batch, delay
+        self.registry = registry
+        self.queue: Optional[asyncio.Queue] = None
+        self.queue_size = queue
+        self.latency = {k: LatencyWindow() for k in ENDPOINTS}
+        self.batches = 0
+        self.batched = 0
+        self.rejected = 0
+        self._pool = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: set = set()
+
+    # ---------- 调度 ----------
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        self.queue = asyncio.Queue(self.queue_size)
+        if self.jobs > 0:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(self.jobs, initializer=_init_worker, initargs=(self.rules,))
+            # 先把进程都拉起来：首个请求不用等启动，子进程也不会继承监听套接字
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(self._pool, _run_batch, []) for _ in range(self.jobs)])
+        else:
+            _init_worker(self.rules)
+        self._slots = asyncio.Semaphore(max(1, self.jobs) * 2)
+        self._spawn(self._batcher())
+        return await asyncio.start_server(self._handle, host, port)
+
+    def _spawn(self, coro):
+        """保留任务引用直到结束，免得被回收"""
+        t = asyncio.create_task(coro)
+        self._tasks.add(t)
+        t.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        for t in list(self._tasks): t.cancel()
+        if self._pool is not None: self._pool.shutdown(cancel_futures=True)
+
+    def submit(self, kind: str, d: dict) -> "asyncio.Future[Reply]":
+        """入队；队列满时抛 asyncio.QueueFull，由调用方回 503"""
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((kind, d, fut))
+        return fut
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.delay
+            while len(items) < self.batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    left = deadline - loop.time()
+                    if left <= 0: break
+                    try:
+                        items.append(await asyncio.wait_for(self.queue.get(), left))
+                    except asyncio.TimeoutError:
+                        break
+            await self._slots.acquire()
+            self.batches += 1
+            self.batched += len(items)
+            self._spawn(self._dispatch(items))
+
+    async def _dispatch(self, items):
+        try:
+            jobs = [(kind, d) for kind, d, _ in items]
+            if self._pool is None:
+                replies = _run_batch(jobs)
+            else:
+                replies = await asyncio.get_running_loop().run_in_executor(self._pool, _run_batch, jobs)
+            for (_, _, fut), reply in zip(items, replies):
+                if not fut.done(): fut.set_result(reply)
+        except Exception as e:  # 进程池出错时整批回 503，不让请求挂住
+            for _, _, fut in items:
+                if not fut.done(): fut.set_result((503, {"error": f"{type(e).__name__}: {e}"}))
+        finally:
+            self._slots.release()
+
+    # ---------- HTTP ----------
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, object, str]:
+        name = path.split("?")[0].strip("/")
+        if method == "GET" and name == "stats": return 200, self.stats(), "application/json"
+        if method == "GET" and name == "metrics": return 200, self.registry.render(), "text/plain; version=0.0.4"
+        if name not in ENDPOINTS: return 404, {"error": f"未知接口: /{name}"}, "application/json"
+        if method != "POST": return 405, {"error": "请用 POST"}, "application/json"
+        t0 = time.perf_counter()
+        try:
+            data = json.loads(body or b"null")
+        except ValueError as e:
+            return 400, {"error": f"JSON 解析失败: {e}"}, "application/json"
+        try:
+            if isinstance(data, list):
+                if len(data) > self.queue_size:
+                    return 413, {"error": f"一次最多 {self.queue_size} 局，请分批提交"}, "application/json"
+                # 入队之间没有 await：先看剩余空间，够整个数组才一起入队，不会算了一半再回 503
+                if self.queue_size - self.queue.qsize() < len(data): raise asyncio.QueueFull
+                replies = await asyncio.gather(*[self.submit(name, d) for d in data])
+                status, payload = 200, [{"status": s, **p} for s, p in replies]
+            else:
+                status, payload = await self.submit(name, data)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            self.registry.inc("zhuoji_service_rejected_total")
+            return 503, {"error": "服务繁忙，请稍后重试"}, "application/json"
+        dt = time.perf_counter() - t0
+        self.latency[name].add(dt * 1e3)
+        self.registry.observe(metrics.SERVICE_SECONDS, name, dt)
+        return status, payload, "application/json"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """HTTP/1.1，支持 keep-alive；只认 Content-Length 的请求体"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip(): break
+                method, path, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""): break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                n = int(headers.get("content-length") or 0)
+                if n > MAX_BODY:
+                    writer.write(_response(413, {"error": "请求体过大"}, "application/json", False))
+                    break
+                body = await reader.readexactly(n) if n else b""
+                status, payload, ctype = await self._route(method, path, body)
+                keep = headers.get("connection", "").lower() != "close"
+                writer.write(_response(status, payload, ctype, keep))
+                await writer.drain()
+                if not keep: break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def stats(self) -> dict:
+        return {"endpoints": {k: w.summary() for k, w in self.latency.items()},
+                "batches": self.batches, "mean_batch": self.batched / self.batches if self.batches else 0.0,
+                "queue": self.queue.qsize() if self.queue else 0, "rejected": self.rejected, "jobs": self.jobs}
+
+
+def _response(status: int, payload, ctype: str, keep: bool) -> bytes:
+    body = payload.encode("utf-8") if isinstance(payload, str) else \
+        json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {ctype}; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep else 'close'}\r\n")
+    if status == 503: head += "Retry-After: 1\r\n"
+    return (head + "\r\n").encode("latin-1") + body
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m zhuoji.service", description="本机 JSON 结算服务")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--rules", help="默认规则 JSON 文件，缺省使用界面默认值")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="结算进程数，0 表示在事件循环里直接算")
+    ap.add_argument("--batch", type=int, default=64, help="每批最多请求数")
+    ap.add_argument("--delay-ms", type=float, default=2.0, help="攒批最长等待（毫秒）")
+    ap.add_argument("--queue", type=int, default=2048, help="排队上限，满了回 503")
+    args = ap.parse_args(argv)
+
+    rules = Rules()
+    if args.rules:
+        with open(args.rules, encoding="utf-8") as f:
+            rules = Rules.from_dict(json.load(f))
+    service = ScoringService(rules, args.jobs, args.batch, args.delay_ms / 1e3, args.queue)
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM): loop.add_signal_handler(sig, stop.set)
+        server = await service.start(args.host, args.port)
+        print(f"结算服务 http://{args.host}:{args.port}（{args.jobs} 进程，批 ≤{args.batch}，"
+              f"等待 ≤{args.delay_ms:g}ms，队列 {args.queue}）", file=sys.stderr, flush=True)
+        try:
+            async with server: await stop.wait()
+        finally:
+            await service.close()
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""规则配置的蒙特卡洛模拟：随机生成合法的局，在一组规则下结算并统计。
+
+    python -m zhuoji.simulate --rounds 1000000 --jobs 8 --grid 平胡=5,10 base_yj=2,3 --seed 1
+
+局输入只取决于随机流，与规则无关：每个块先生成一批局，再依次用网格里的每套规则结算，
+所以同一种子下各套规则比较的是同一批牌局。块的随机流由 SeedSequence 按块号派生，
+结果与进程数、调度顺序无关；块之间只回传几十个累加量，进程数增加时近似线性提速。
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+from dataclasses import dataclass, field, fields
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .kernel import CATEGORIES, CATEGORY_LABELS, CompiledRules, iter_settled
+from .rounds import Rules, RoundInput
+
+PLAYERS = ["A", "B", "C", "D"]
+FAN_CARDS = [f"{n}{s}" for s in ["筒", "条", "万"] for n in range(1, 10)]
+SHAPES = ["平胡", "大对子", "七对", "龙七对"]
+
+
+@dataclass
+class SimProfile:
+    """随机牌局的分布参数（概率均为每局/每人独立抽样）"""
+    p_zimo: float = 0.4
+    p_multi_win: float = 0.05      # 点炮时一炮多响
+    shape_weights: Tuple[float, ...] = (0.6, 0.2, 0.15, 0.05)
+    p_qing: float = 0.12
+    p_event: float = 0.15
+    p_fan: float = 0.9             # 有翻牌
+    p_ready: float = 0.6           # 非胡牌者听牌
+    p_first_seen: float = 0.85     # 常鸡首出出现
+    first_weights: Tuple[float, ...] = (0.75, 0.15, 0.04, 0.06)  # 安全/被碰/被明杠/被胡
+    p_bu_gang: float = 0.25        # 被碰后补杠
+    p_extra: float = 0.35          # 每张剩余常鸡落在某人手里
+    p_hand: float = 0.3            # 每张翻鸡落在某人手里
+    max_gangs: int = 2
+
+
+def random_round(rng: random.Random, prof: SimProfile, players: Sequence[str] = PLAYERS) -> RoundInput:
+    """按界面的录入约束生成一局，构造即满足 validate_objective_facts / validate_consistency"""
+    players = list(players)
+    if rng.random() < prof.p_zimo:
+        method, winners, loser = "自摸", [rng.choice(players)], None
+    else:
+        method = "点炮"
+        loser = rng.choice(players)
+        others = [p for p in players if p != loser]
+        multi = rng.random() < prof.p_multi_win and len(others) > 1
+        winners = rng.sample(others, rng.randint(2, len(others)) if multi else 1)
+    events = []
+    if rng.random() < prof.p_event:
+        opts = ["报听胡", "杀报", "天胡", "地胡"] + (["杠上花"] if method == "自摸" else ["热炮", "抢杠胡"])
+        events.append(rng.choice(opts))
+    r = RoundInput(
+        players, winners, method, loser,
+        hu_shape=rng.choices(SHAPES, prof.shape_weights)[0], is_qing=rng.random() < prof.p_qing,
+        special_events=events, fan_card=rng.choice(FAN_CARDS) if rng.random() < prof.p_fan else "",
+        ready_list=[p for p in players if p in winners or rng.random() < prof.p_ready],
+    )
+
+    # 首出：自摸或另一张已被胡时不能被胡
+    first = []
+    for tile in ("幺鸡", "八筒"):
+        who, res, tar = "无/未现", "安全", None
+        if rng.random() < prof.p_first_seen:
+            who = rng.choice(players)
+            res = rng.choices(["安全", "被碰", "被明杠", "被胡"], prof.first_weights)[0]
+            if res == "被胡" and (method == "自摸" or any(f[1] == "被胡" for f in first)): res = "安全"
+            if res == "被胡":
+                tar = list(winners)
+            elif res != "安全":
+                tar = rng.choice([p for p in players if p != who])
+        first.append((who, res, tar))
+    (r.fyw, r.fyr, r.fyt), (r.fbw, r.fbr, r.fbt) = first
+
+    gangs = []
+    for _ in range(rng.randint(0, prof.max_gangs)):
+        t, doer = rng.choice(["暗杠", "普通明杠"]), rng.choice(players)
+        gangs.append({'doer': doer, 'type': t, 'card': "杂牌",
+                      'victim': rng.choice([p for p in players if p != doer]) if t == "普通明杠" else None})
+    for tile, (who, res, tar) in zip(("幺鸡", "八筒"), first):
+        if res == "被明杠": gangs.append({'doer': tar, 'type': '责任明杠', 'card': tile, 'victim': who})
+        if res == "被碰" and rng.random() < prof.p_bu_gang:
+            gangs.append({'doer': tar, 'type': '补杠', 'card': tile, 'victim': None})
+    r.gang_data = gangs
+
+    # 非首出常鸡：有杠时为 0，否则与首出合计不超过 4 张
+    for tile, (who, res, _), attr in zip(("幺鸡", "八筒"), first, ("extra_yj", "extra_b8")):
+        if res == "被明杠" or any(g['card'] == tile for g in gangs): continue
+        used = 0 if who == "无/未现" else {"被碰": 3, "被胡": 1}.get(res, 1)
+        counts: Dict[str, int] = {}
+        for _ in range(4 - used):
+            if rng.random() < prof.p_extra:
+                p = rng.choice(players)
+                counts[p] = counts.get(p, 0) + 1
+        setattr(r, attr, counts)
+    if r.fan_card:
+        for _ in range(4):
+            if rng.random() < prof.p_hand:
+                p = rng.choice(players)
+                r.hand_total_counts[p] = r.hand_total_counts.get(p, 0) + 1
+    return r
+
+
+@dataclass
+class SimStats:
+    """一套规则下的流式累加量，可跨块合并"""
+    n_seats: int = len(PLAYERS)
+    rounds: int = 0
+    errors: int = 0
+    seat_sum: List[int] = field(default_factory=list)
+    seat_sumsq: List[int] = field(default_factory=list)
+    moved: List[int] = field(default_factory=lambda: [0] * len(CATEGORIES))  # 按类别的转账总额
+
+    def __post_init__(self):
+        if not self.seat_sum: self.seat_sum = [0] * self.n_seats
+        if not self.seat_sumsq: self.seat_sumsq = [0] * self.n_seats
+
+    def merge(self, o: "SimStats") -> "SimStats":
+        self.rounds += o.rounds
+        self.errors += o.errors
+        for acc, add in ((self.seat_sum, o.seat_sum), (self.seat_sumsq, o.seat_sumsq), (self.moved, o.moved)):
+            for k, v in enumerate(add): acc[k] += v
+        return self
+
+    @property
+    def seat_mean(self) -> List[float]:
+        return [s / self.rounds for s in self.seat_sum] if self.rounds else []
+
+    @property
+    def seat_var(self) -> List[float]:
+        if not self.rounds: return []
+        return [q / self.rounds - (s / self.rounds) ** 2 for s, q in zip(self.seat_sum, self.seat_sumsq)]
+
+    @property
+    def variance(self) -> float:
+        """单人单局得分的方差（各座位合并）"""
+        n = self.rounds * self.n_seats
+        return sum(self.seat_sumsq) / n - (sum(self.seat_sum) / n) ** 2 if n else 0.0
+
+    @property
+    def share(self) -> Dict[str, float]:
+        total = sum(self.moved)
+        return {c: (m / total if total else 0.0) for c, m in zip(CATEGORIES, self.moved)}
+
+    def as_dict(self) -> dict:
+        return {"rounds": self.rounds, "errors": self.errors, "variance": self.variance,
+                "std": self.variance ** 0.5, "seat_mean": self.seat_mean, "seat_var": self.seat_var,
+                "moved_per_round": sum(self.moved) / self.rounds if self.rounds else 0.0, "share": self.share}
+
+
+def score_into(stats: SimStats, r: RoundInput, cr: CompiledRules):
+    seat = {p: k for k, p in enumerate(r.players)}
+    scores = [0] * len(r.players)
+    moved = stats.moved
+    try:
+        for tx in iter_settled(
+                cr, r.players, r.winners, r.method, r.loser, r.hu_shape, r.is_qing, r.special_events,
+                r.fan_card, r.ready_list, r.fyw, r.fyr, r.fyt, r.fbw, r.fbr, r.fbt, r.extra_yj, r.extra_b8,
+                r.hand_total_counts, r.gang_data):
+            scores[seat[tx.payer]] -= tx.amount
+            scores[seat[tx.receiver]] += tx.amount
+            moved[tx.cat] += tx.amount
+    except ValueError:
+        stats.errors += 1
+        return
+    stats.rounds += 1
+    for k, s in enumerate(scores):
+        stats.seat_sum[k] += s
+        stats.seat_sumsq[k] += s * s
+
+
+def rule_grid(base: Optional[Rules] = None, **axes: Iterable[int]) -> List[Rules]:
+    """规则网格：键为 Rules 字段（base_yj / fan_unit …）或 rules_config 里的牌型/事件名"""
+    base = base or Rules()
+    names = {f.name for f in fields(Rules)} - {"rules_config"}
+    keys = list(axes)
+    out = []
+    for combo in itertools.product(*(list(axes[k]) for k in keys)):
+        kw = {f.name: getattr(base, f.name) for f in fields(Rules)}
+        kw["rules_config"] = dict(base.rules_config)
+        for k, v in zip(keys, combo):
+            if k in names:
+                kw[k] = v
+            elif k in kw["rules_config"]:
+                kw["rules_config"][k] = v
+            else:
+                raise KeyError(f"未知规则项: {k}")
+        out.append(Rules(**kw))
+    return out
+
+
+def seat_names(seats: int) -> List[str]:
+    return PLAYERS if seats == len(PLAYERS) else [chr(65 + k) for k in range(seats)]
+
+
+def simulate_chunk(rulesets: Sequence[Rules], n: int, seed: int,
+                   profile: Optional[SimProfile] = None, seats: int = len(PLAYERS)) -> List[SimStats]:
+    """生成 n 局并在每套规则下结算；编译结果按 (规则, 翻牌) 复用"""
+    rng, prof, players = random.Random(seed), profile or SimProfile(), seat_names(seats)
+    rounds = [random_round(rng, prof, players) for _ in range(n)]
+    out = []
+    for rules in rulesets:
+        stats, compiled = SimStats(seats), {}
+        for r in rounds:
+            cr = compiled.get(r.fan_card)
+            if cr is None: cr = compiled[r.fan_card] = rules.compile(r.fan_card)
+            score_into(stats, r, cr)
+        out.append(stats)
+    return out
+
+
+def _run_chunk(args) -> List[SimStats]:
+    return simulate_chunk(*args)
+
+
+def chunk_seeds(seed: int, n_chunks: int) -> List[int]:
+    """每块一条独立随机流（SeedSequence 派生），与进程数无关"""
+    from numpy.random import SeedSequence
+    return [int(s.generate_state(1, dtype="uint64")[0]) for s in SeedSequence(seed).spawn(n_chunks)]
+
+
+def simulate(rulesets: Sequence[Rules], rounds: int, jobs: int = 1, seed: int = 0, chunk: int = 20000,
+             profile: Optional[SimProfile] = None, seats: int = len(PLAYERS)) -> List[SimStats]:
+    """每套规则模拟 rounds 局（每局 seats 人），按块分发到 jobs 个进程，返回与 rulesets 对应的统计"""
+    sizes = [chunk] * (rounds // chunk) + ([rounds % chunk] if rounds % chunk else [])
+    tasks = [(list(rulesets), n, s, profile, seats) for n, s in zip(sizes, chunk_seeds(seed, len(sizes)))]
+    total = [SimStats(seats) for _ in rulesets]
+
+    def consume(results: Iterator[List[SimStats]]):
+        for part in results:
+            for acc, s in zip(total, part): acc.merge(s)
+
+    if jobs <= 1:
+        consume(map(_run_chunk, tasks))
+    else:
+        from multiprocessing import Pool
+        with Pool(jobs) as pool: consume(pool.imap_unordered(_run_chunk, tasks))
+    return total
+
+
+def _parse_axis(spec: str) -> Tuple[str, List[int]]:
+    k, _, vs = spec.partition("=")
+    if not vs: raise argparse.ArgumentTypeError(f"网格写法应为 名称=值1,值2: {spec}")
+    return k, [int(v) for v in vs.split(",")]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m zhuoji.simulate", description="捉鸡规则蒙特卡洛模拟")
+    ap.add_argument("--rounds", type=int, default=100000, help="每套规则模拟的局数")
+    ap.add_argument("--grid", nargs="*", type=_parse_axis, default=[], metavar="名称=值,...",
+                    help="规则网格，如 平胡=5,10 base_yj=2,3 fan_unit=1,2")
+    ap.add_argument("--rules", help="基准规则 JSON 文件（Rules 字段）")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="并行进程数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--seats", type=int, default=len(PLAYERS), help="每局人数（2–8）")
+    ap.add_argument("--chunk", type=int, default=20000, help="每块局数")
+    ap.add_argument("--json", action="store_true", help="以 JSON 行输出")
+    args = ap.parse_args(argv)
+
+    base = Rules()
+    if args.rules:
+        with open(args.rules, encoding="utf-8") as f:
+            base = Rules.from_dict(json.load(f))
+    axes = dict(args.grid)
+    rulesets = rule_grid(base, **axes) if axes else [base]
+
+    t0 = time.perf_counter()
+    results = simulate(rulesets, args.rounds, args.jobs, args.seed, args.chunk, seats=args.seats)
+    elapsed = time.perf_counter() - t0
+    keys = list(axes)
+    for rules, st in zip(rulesets, results):
+        setting = {k: getattr(rules, k) if hasattr(rules, k) else rules.rules_config[k] for k in keys}
+        if args.json:
+            print(json.dumps({"rules": setting, **st.as_dict()}, ensure_ascii=False))
+            continue
+        share = " ".join(f"{lab}{v:.0%}" for lab, v in zip(CATEGORY_LABELS, st.share.values()))
+        mean = " ".join(f"{m:+.2f}" for m in st.seat_mean)
+        print(f"{setting or '默认规则'}  标准差 {st.variance ** 0.5:.1f}  座位期望 [{mean}]  {share}"
+              + (f"  无效 {st.errors}" if st.errors else ""))
+    n = args.rounds * len(rulesets)
+    print(f"{n} 局·规则 用时 {elapsed:.1f}s（{n / elapsed:,.0f}/s，{args.jobs} 进程）", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""按玩家的统计：胜率、点炮率、分类别收入、未听牌包赔、责任鸡次数、连胜/连败。
+
+每局每座位一行计数（round_row，字段见 STAT_FIELDS），账本在记账的同一事务里把它加进场次累计，
+撤销/重算时减去旧行，与 totals/flow_totals 一样不回放流水。连胜/连败的当前值随记账逐局推进；
+撤销或重算后“最长”无法倒推，只对该场次逐局重扫一次计数行。
+分类别收入直接取按类别的净额矩阵（flow_totals），不另存。
+胜负与点炮从胡牌转账推出，不依赖录入，早于录入表的旧账也能统计。
+"""
+from dataclasses import dataclass, field
+from typing import Iterable, List, Sequence, Tuple
+
+from .kernel import CATEGORIES, FlowMatrix, R_DIANPAO, R_LIABLE, R_REVERSED, R_TEXT, R_ZIMO, Transaction
+
+STAT_FIELDS = ("score", "won", "zimo", "dianpao", "liable", "baopei_paid", "baopei_recv")
+STREAK_FIELDS = ("win_run", "win_best", "lose_run", "lose_best")
+NO_STREAK = (0, 0, 0, 0)
+
+S_SCORE, S_WON, S_ZIMO, S_DIANPAO, S_LIABLE, S_BAOPEI_PAID, S_BAOPEI_RECV = range(len(STAT_FIELDS))
+
+
+def _text_code(text: str) -> int:
+    """旧账的文字说明 -> 模板码，只认统计用得到的几种"""
+    if text.startswith("未听牌包赔-"): return R_REVERSED
+    if text.startswith("自摸("): return R_ZIMO
+    if text.startswith("点炮("): return R_DIANPAO
+    return R_LIABLE if "责任" in text else R_TEXT
+
+
+def round_row(players: Sequence[str], scores: Sequence[int], txs: Iterable[Transaction]) -> List[List[int]]:
+    """一局按座位的计数行（与 STAT_FIELDS 同序）；包赔按金额计，责任鸡按笔数计"""
+    seat = {p: k for k, p in enumerate(players)}
+    rows = [[s, 0, 0, 0, 0, 0, 0] for s in scores]
+    for t in txs:
+        code = t.code if t.code != R_TEXT else _text_code(t.args[0])
+        if code & R_REVERSED:
+            rows[seat[t.payer]][S_BAOPEI_PAID] += t.amount
+            rows[seat[t.receiver]][S_BAOPEI_RECV] += t.amount
+        elif code == R_ZIMO:
+            rows[seat[t.receiver]][S_WON] = rows[seat[t.receiver]][S_ZIMO] = 1
+        elif code == R_DIANPAO:
+            rows[seat[t.receiver]][S_WON] = 1
+            rows[seat[t.payer]][S_DIANPAO] = 1
+        elif code == R_LIABLE:
+            rows[seat[t.payer]][S_LIABLE] += 1
+    return rows
+
+
+def step_streak(st: Tuple[int, int, int, int], won: int, score: int) -> Tuple[int, int, int, int]:
+    """连胜按胡牌计，连败按本局得分为负计"""
+    win_run = st[0] + 1 if won else 0
+    lose_run = st[2] + 1 if score < 0 else 0
+    return win_run, max(st[1], win_run), lose_run, max(st[3], lose_run)
+
+
+def scan_streaks(rounds: Iterable[Sequence[Sequence[int]]], n_seats: int) -> List[Tuple[int, int, int, int]]:
+    """按局序重扫计数行得出各座位的连胜/连败"""
+    out = [NO_STREAK] * n_seats
+    for rows in rounds:
+        for seat, row in enumerate(rows):
+            if seat < n_seats: out[seat] = step_streak(out[seat], row[S_WON], row[S_SCORE])
+    return out
+
+
+def category_income(flows: FlowMatrix) -> List[List[int]]:
+    """[座位][类别] 的净收入"""
+    per_cat = [[sum(col) for col in zip(*m)] for m in flows]
+    return [list(v) for v in zip(*per_cat)] if per_cat and per_cat[0] else []
+
+
+@dataclass
+class PlayerStats:
+    player: str
+    rounds: int = 0
+    score: int = 0
+    won: int = 0
+    zimo: int = 0
+    dianpao: int = 0
+    liable: int = 0
+    baopei_paid: int = 0
+    baopei_recv: int = 0
+    win_run: int = 0
+    win_best: int = 0
+    lose_run: int = 0
+    lose_best: int = 0
+    income: List[int] = field(default_factory=lambda: [0] * len(CATEGORIES))  # 按类别的净收入
+
+    @property
+    def win_rate(self) -> float:
+        return self.won / self.rounds if self.rounds else 0.0
+
+    @property
+    def dianpao_rate(self) -> float:
+        return self.dianpao / self.rounds if self.rounds else 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.score / self.rounds if self.rounds else 0.0
+
+
+def build_stats(players: Sequence[str], rows: Sequence[Sequence[int]],
+                income: Sequence[Sequence[int]]) -> List[PlayerStats]:
+    """rows[座位] 为 (局数, *STAT_FIELDS, *STREAK_FIELDS)，缺的座位按 0 计"""
+    zero = (0,) * (1 + len(STAT_FIELDS) + len(STREAK_FIELDS))
+    return [PlayerStats(p, *(rows[seat] if seat < len(rows) and rows[seat] else zero),
+                        list(income[seat]) if seat < len(income) else [0] * len(CATEGORIES))
+            for seat, p in enumerate(players)]
+
+
+def window_stats(players: Sequence[str], rounds: Sequence[Sequence[Sequence[int]]],
+                 income: Sequence[Sequence[int]]) -> List[PlayerStats]:
+    """近 N 局：rounds 为按局序的计数行，只在窗口内累加，连胜/连败也只算窗口内"""
+    n = len(players)
+    sums = [[0] * len(STAT_FIELDS) for _ in range(n)]
+    played = [0] * n
+    for rows in rounds:
+        for seat, row in enumerate(rows[:n]):
+            played[seat] += 1
+            for k, v in enumerate(row): sums[seat][k] += v
+    streaks = scan_streaks(rounds, n)
+    return build_stats(players, [(played[k], *sums[k], *streaks[k]) for k in range(n)], income)
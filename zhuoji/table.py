@@ -0,0 +1,193 @@
+"""同桌多设备共享的牌桌状态：每个服务进程每个场次只存一份，各浏览器会话只持有引用。
+
+    table = Table(store, 场次号)       # 界面里按场次号放进 st.cache_resource
+    snap = table.poll()                  # 轮询：内存里比版本号，隔 CHECK_INTERVAL 秒才查一次库
+    table.record(snap.version, ...)      # 记账带上读到的版本号，期间别的设备记过账则抛 VersionConflict
+
+快照只有版本号、局数、座位名单与累计分，大小与局数无关；历史、流水、矩阵仍按需从账本查。
+草稿：某台设备试算后把本局录入挂到牌桌上（版本号递增，后写覆盖先写），其余设备据此提示“已试算”。
+变动通知：版本号或草稿号变了即为有变动；poll() 给轮询方用，wait() 给能阻塞等待的服务用。
+同进程内的写入经 Table 即时可见；其他进程（导入脚本等）写的账由 poll() 定期比对库里的版本号发现。
+
+    tables = TableRegistry(store)        # 一个进程一份，界面里放进 st.cache_resource
+    table = tables.get(场次号)           # 闲置超时或超出上限的桌被放掉，再来时从账本重读
+
+牌桌只是账本的缓存：放掉一张桌只丢未记账的草稿，局与累计分都在账本里。
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from . import metrics
+from .ledger import LedgerStore
+
+CHECK_INTERVAL = 1.0  # 秒；同一张桌的所有设备共用这一次查库
+IDLE_SECONDS = 1800.0  # 半小时没有设备来取的桌从内存里放掉
+MAX_TABLES = 256
+MAX_BYTES = 16 << 20  # 全部牌桌的估算占用上限
+SWEEP_INTERVAL = 10.0  # 秒；没有新桌时隔这么久才检查一次闲置
+
+
+@dataclass(frozen=True)
+class Draft:
+    seq: int             # 草稿号，每次提交 +1
+    round_no: int        # 草稿所属的局号（记账后作废）
+    device: str
+    summary: str
+    data: dict           # RoundInput.to_dict()
+
+
+@dataclass(frozen=True)
+class TableSnapshot:
+    version: int         # 账本版本号（sessions.version）
+    n_rounds: int
+    last_round: int
+    players: List[str]   # 最新一局的座位名单，未记账时为空
+    totals: List[int]    # 按座位顺序的累计分
+    draft: Optional[Draft] = None
+
+    @property
+    def key(self) -> tuple:
+        """变动标记：账本版本号 + 草稿号"""
+        return self.version, self.draft.seq if self.draft else 0
+
+
+class Table:
+    def __init__(self, store: LedgerStore, session: str):
+        self.store, self.session = store, session
+        self._cond = threading.Condition()
+        self._draft_seq = 0
+        self._checked = 0.0
+        self._size: Tuple[tuple, int] = ((), 0)
+        self._snap = self._load(None)
+
+    def _load(self, draft: Optional[Draft]) -> TableSnapshot:
+        balances = self.store.balances(self.session)
+        n_rounds, last_round = self.store.session_info(self.session)
+        return TableSnapshot(self.store.version(self.session), n_rounds, last_round, list(balances),
+                             list(balances.values()), draft)
+
+    def _publish(self, snap: TableSnapshot) -> TableSnapshot:
+        with self._cond:
+            self._snap = snap
+            self._checked = time.monotonic()
+            self._cond.notify_all()
+        return snap
+
+    def snapshot(self) -> TableSnapshot:
+        return self._snap
+
+    def nbytes(self) -> int:
+        """内存占用粗估（名单、累计分与草稿），快照变了才重算"""
+        snap = self._snap
+        if self._size[0] != snap.key: self._size = (snap.key, metrics.approx_size(snap))
+        return self._size[1]
+
+    def reload(self) -> TableSnapshot:
+        """账本在别处被改过（重算、其他进程导入）后重读；局号变了则草稿作废"""
+        with self._cond:
+            snap = self._snap
+            fresh = self._load(snap.draft)
+            if snap.draft and fresh.last_round != snap.last_round:
+                fresh = TableSnapshot(fresh.version, fresh.n_rounds, fresh.last_round, fresh.players, fresh.totals)
+            return self._publish(fresh)
+
+    def poll(self) -> TableSnapshot:
+        """轮询用：平时只返回内存快照，每 CHECK_INTERVAL 秒查一次库里的版本号"""
+        snap = self._snap
+        if time.monotonic() - self._checked < CHECK_INTERVAL: return snap
+        self._checked = time.monotonic()
+        return self.reload() if self.store.version(self.session) != snap.version else snap
+
+    def wait(self, key: tuple, timeout: float = 30.0) -> TableSnapshot:
+        """阻塞到快照的变动标记不等于 key 或超时"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._snap.key != key, timeout)
+            return self._snap
+
+    def record(self, expected_version: int, round_no: int, summary: str, players: Sequence[str],
+               scores: dict, transactions, event=None) -> TableSnapshot:
+        """记一局：版本号不符抛 VersionConflict（同一局已被别的设备记过）；累计分增量更新，草稿作废"""
+        with self._cond:
+            self.store.append_round(self.session, round_no, summary, players, scores, transactions, event,
+                                    expected_version)
+            snap = self._snap
+            if snap.version != expected_version or snap.players != list(players):
+                return self._publish(self._load(None))  # 快照落后于账本或换了座位名单，整体重读
+            return self._publish(TableSnapshot(
+                expected_version + 1, snap.n_rounds + 1, max(snap.last_round, round_no), snap.players,
+                [t + scores.get(p, 0) for t, p in zip(snap.totals, players)]))
+
+    def undo(self, expected_version: int) -> Optional[dict]:
+        """撤销最后一局，返回被删的局记录；版本号不符抛 VersionConflict"""
+        with self._cond:
+            rec = self.store.delete_last_round(self.session, expected_version)
+            if rec is not None: self._publish(self._load(None))
+            return rec
+
+    def put_draft(self, round_no: int, device: str, summary: str, data: dict) -> Draft:
+        """挂上本局草稿；只接受下一局的草稿，过期的（别的设备已记过这一局）丢弃"""
+        with self._cond:
+            snap = self._snap
+            if round_no <= snap.last_round: return snap.draft
+            self._draft_seq += 1
+            draft = Draft(self._draft_seq, round_no, device, summary, data)
+            self._snap = TableSnapshot(snap.version, snap.n_rounds, snap.last_round, snap.players, snap.totals,
+                                       draft)
+            self._cond.notify_all()
+            return draft
+
+
+class TableRegistry:
+    """按场次号取牌桌，最近取过的排在最后；新开一桌或每隔 SWEEP_INTERVAL 秒检查一次，
+    放掉闲置超过 idle 秒的桌，再按最久未用的顺序放到张数与估算字节都不超上限。
+    放掉的桌上还在 wait() 的调用方会等到超时，之后应重新 get()"""
+
+    def __init__(self, store: LedgerStore, max_tables: int = MAX_TABLES, max_bytes: int = MAX_BYTES,
+                 idle: float = IDLE_SECONDS):
+        self.store, self.max_tables, self.max_bytes, self.idle = store, max_tables, max_bytes, idle
+        self._lock = threading.Lock()
+        self._tables: "OrderedDict[str, Table]" = OrderedDict()
+        self._used: dict = {}  # 场次号 -> 最近一次 get() 的时刻
+        self._swept = time.monotonic()
+        self.evicted = 0
+
+    def get(self, session: str) -> Table:
+        now = time.monotonic()
+        with self._lock:
+            table = self._tables.get(session)
+            fresh = table is None
+            if fresh: table = self._tables[session] = Table(self.store, session)
+            else: self._tables.move_to_end(session)
+            self._used[session] = now
+            if fresh or now - self._swept >= SWEEP_INTERVAL: self._sweep(now, keep=session)
+        return table
+
+    def _sweep(self, now: float, keep: str):
+        self._swept = now
+        sizes = {sid: t.nbytes() for sid, t in self._tables.items()}
+        total = sum(sizes.values())
+        for sid in list(self._tables):
+            if sid == keep: continue
+            if now - self._used[sid] < self.idle and len(self._tables) <= self.max_tables and total <= self.max_bytes:
+                break  # 往后的都更近用过
+            del self._tables[sid], self._used[sid]
+            total -= sizes[sid]
+            self.evicted += 1
+            if metrics.enabled():
+                metrics.REGISTRY.inc("zhuoji_tables_evicted_total")
+                metrics.REGISTRY.set_gauge(metrics.TABLE_BYTES, sid, None)
+        if metrics.enabled():
+            for sid in self._tables: metrics.REGISTRY.set_gauge(metrics.TABLE_BYTES, sid, sizes[sid])
+
+    def usage(self) -> List[Tuple[str, int, float]]:
+        """各桌的 (场次号, 估算字节, 闲置秒数)，占用大的在前"""
+        now = time.monotonic()
+        with self._lock:
+            rows = [(sid, t.nbytes(), now - self._used[sid]) for sid, t in self._tables.items()]
+        return sorted(rows, key=lambda r: -r[1])
+
+    def __len__(self) -> int:
+        return len(self._tables)
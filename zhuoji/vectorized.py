@@ -0,0 +1,343 @@
+"""NumPy 列式批量结算：一次处理成千上万局，结果与 calculate_all_pipeline 逐局一致。
+
+思路：未听牌过滤只取决于 (付款人, 收款人, 是否可包赔类别)，与金额无关，
+所以先把各结算块的原始转账累加进 flow[n, 付款座位, 收款座位, 类别]，再整体套用过滤。
+类别 0 = 胡/翻鸡（收款人未听牌时作废），类别 1 = 杠/常鸡（收款人未听牌时反向包赔）。
+“其余所有人付给某人”的块直接广播到整列：自己付给自己的那一格在过滤后恰好抵消。
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .kernel import (
+    TILES, V_BU_DOER, V_BU_DUP, V_BU_NO_PENG, V_DOUBLE_HU, V_FAN_TOTAL, V_GANG_EXTRA, V_HU_GANG, V_TILE_TOTAL,
+    V_ZIMO_FIRST_HU, Violation, get_fan_multipliers,
+)
+from .rounds import Rules, RoundInput
+
+METHODS = ["自摸", "点炮"]                      # 其他取值编码为 2，不产生胡分
+RESULTS = ["安全", "被碰", "被明杠", "被胡"]      # 其他取值编码为 4
+GANG_TYPES = ["暗杠", "补杠", "普通明杠", "责任明杠"]  # 其他取值编码为 4
+GANG_CARDS = ["杂牌", "幺鸡", "八筒"]             # 其他取值按杂牌处理
+NO_WHO = "无/未现"
+
+R_SAFE, R_PENG, R_MINGGANG, R_HU, R_OTHER = range(5)
+G_AN, G_BU, G_MING, G_RESP, G_OTHER = range(5)
+
+
+@dataclass
+class RoundBatch:
+    """N 局 × P 座位的列式输入。座位下标对应每局 players 的顺序，-1 表示无。
+
+    两种首出牌（0=幺鸡, 1=八筒）的列形状为 [N, 2]；杠表按行展开，g_round 指向所属局。
+    """
+    winners: np.ndarray        # bool[N, P]
+    first_winner: np.ndarray   # int[N]      winners[0]，自摸收款人
+    method: np.ndarray         # int[N]
+    loser: np.ndarray          # int[N]
+    shape: np.ndarray          # int[N]      下标指向 shape_names
+    is_qing: np.ndarray        # bool[N]
+    events: np.ndarray         # int[N, E]   各事件出现次数，列对应 event_names
+    has_fan: np.ndarray        # bool[N]
+    fan_mult: np.ndarray       # int[N, 2]   get_fan_multipliers
+    ready: np.ndarray          # bool[N, P]  ready_list ∩ players（不含胡牌者）
+    who: np.ndarray            # int[N, 2]
+    who_given: np.ndarray      # bool[N, 2]  首出字段非空（含 "无/未现"）
+    res: np.ndarray            # int[N, 2]
+    tar: np.ndarray            # int[N, 2]   被碰/被明杠的对象
+    hu_tar: np.ndarray         # int[N, 2, P] 被胡对象出现次数
+    extra: np.ndarray          # int[N, 2, P]
+    hand: np.ndarray           # int[N, P]
+    g_round: np.ndarray        # int[G]
+    g_doer: np.ndarray         # int[G]
+    g_type: np.ndarray         # int[G]
+    g_card: np.ndarray         # int[G]      0=杂牌, 1=幺鸡, 2=八筒
+    g_victim: np.ndarray       # int[G]
+    shape_names: List[str]
+    event_names: List[str]
+
+    @property
+    def n_rounds(self) -> int:
+        return self.winners.shape[0]
+
+    @property
+    def n_seats(self) -> int:
+        return self.winners.shape[1]
+
+    @classmethod
+    def from_rounds(cls, rounds: Iterable[Union[RoundInput, dict]]) -> "RoundBatch":
+        """把逐局记录转成列式批次；所有局座位数须相同，名字须属于本局 players。
+
+        None 与空字符串视为同一个 "未填"；首出为 "无/未现" 时结局照原样保留。
+        """
+        rounds = [r if isinstance(r, RoundInput) else RoundInput.from_dict(r) for r in rounds]
+        n = len(rounds)
+        n_seats = len(rounds[0].players) if rounds else 4
+        shape_names = ["平胡", "大对子", "七对", "龙七对"]
+        event_names = ["报听胡", "杀报", "杠上花", "热炮", "抢杠胡", "天胡", "地胡"]
+        shape_idx = {s: i for i, s in enumerate(shape_names)}
+        event_idx = {e: i for i, e in enumerate(event_names)}
+
+        winners = np.zeros((n, n_seats), bool)
+        first_winner = np.full(n, -1, np.int64)
+        method = np.zeros(n, np.int64)
+        loser = np.full(n, -1, np.int64)
+        shape = np.zeros(n, np.int64)
+        is_qing = np.zeros(n, bool)
+        event_rows: List[Tuple[int, int]] = []
+        has_fan = np.zeros(n, bool)
+        fan_mult = np.ones((n, 2), np.int64)
+        ready = np.zeros((n, n_seats), bool)
+        who = np.full((n, 2), -1, np.int64)
+        who_given = np.zeros((n, 2), bool)
+        res = np.zeros((n, 2), np.int64)
+        tar = np.full((n, 2), -1, np.int64)
+        hu_tar = np.zeros((n, 2, n_seats), np.int64)
+        extra = np.zeros((n, 2, n_seats), np.int64)
+        hand = np.zeros((n, n_seats), np.int64)
+        g_round, g_doer, g_type, g_card, g_victim = [], [], [], [], []
+
+        for i, r in enumerate(rounds):
+            if len(r.players) != n_seats: raise ValueError(f"第{i + 1}局座位数与批次不一致")
+            seat = {p: k for k, p in enumerate(r.players)}
+
+            def idx(name, allow_none=True):
+                if not name and allow_none: return -1
+                if name not in seat: raise ValueError(f"第{i + 1}局出现未知玩家: {name}")
+                return seat[name]
+
+            for w in r.winners: winners[i, idx(w, False)] = True
+            if r.winners: first_winner[i] = idx(r.winners[0], False)
+            method[i] = METHODS.index(r.method) if r.method in METHODS else 2
+            loser[i] = idx(r.loser)
+            if r.hu_shape not in shape_idx:
+                shape_idx[r.hu_shape] = len(shape_names)
+                shape_names.append(r.hu_shape)
+            shape[i] = shape_idx[r.hu_shape]
+            is_qing[i] = bool(r.is_qing)
+            for e in r.special_events:
+                if e not in event_idx:
+                    event_idx[e] = len(event_names)
+                    event_names.append(e)
+                event_rows.append((i, event_idx[e]))
+            has_fan[i] = bool(r.fan_card)
+            fan_mult[i] = get_fan_multipliers(r.fan_card)
+            for p in (r.players if r.ready_list is None else r.ready_list):
+                if p in seat: ready[i, seat[p]] = True
+
+            for t, (w_, res_, tar_) in enumerate([(r.fyw, r.fyr, r.fyt), (r.fbw, r.fbr, r.fbt)]):
+                who_given[i, t] = bool(w_)
+                who[i, t] = -1 if w_ == NO_WHO else idx(w_)
+                res[i, t] = RESULTS.index(res_) if res_ in RESULTS else R_OTHER
+                if isinstance(tar_, list):
+                    for x in tar_: hu_tar[i, t, idx(x, False)] += 1
+                elif tar_:
+                    tar[i, t] = idx(tar_)
+                    hu_tar[i, t, tar[i, t]] += 1
+
+            for k, p in enumerate(r.players):
+                extra[i, 0, k] = r.extra_yj.get(p, 0)
+                extra[i, 1, k] = r.extra_b8.get(p, 0)
+                hand[i, k] = r.hand_total_counts.get(p, 0)
+
+            for g in r.gang_data:
+                g_round.append(i)
+                g_doer.append(idx(g['doer']))
+                g_type.append(GANG_TYPES.index(g['type']) if g['type'] in GANG_TYPES else G_OTHER)
+                g_card.append(GANG_CARDS.index(g['card']) if g['card'] in GANG_CARDS else 0)
+                g_victim.append(seat.get(g['victim'], -1) if g['victim'] else -1)
+
+        events = np.zeros((n, len(event_names)), np.int64)
+        if event_rows:
+            ev = np.array(event_rows, np.int64)
+            np.add.at(events, (ev[:, 0], ev[:, 1]), 1)
+        as_arr = lambda a: np.asarray(a, np.int64)
+        return cls(winners, first_winner, method, loser, shape, is_qing, events, has_fan, fan_mult, ready,
+                   who, who_given, res, tar, hu_tar, extra, hand,
+                   as_arr(g_round), as_arr(g_doer), as_arr(g_type), as_arr(g_card), as_arr(g_victim),
+                   shape_names, event_names)
+
+
+def _per_round_count(n: int, g_round: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    return np.bincount(g_round[mask], minlength=n)
+
+
+def batch_violations(b: RoundBatch) -> Tuple[np.ndarray, np.ndarray]:
+    """check_round 的向量版：返回 (codes int64[N, 3], bu_seat int64[N, 2])。
+
+    codes 每格为问题码的位掩码（1 << V_*），第 0 列为整局的问题，第 1/2 列为幺鸡/八筒的问题；
+    bu_seat 为该牌第一条补杠的座位（V_BU_DOER 的相关玩家），没有为 -1。用 decode_violations 还原成逐条问题。
+    """
+    n = b.n_rounds
+    codes = np.zeros((n, 3), np.int64)
+    bu_seat = np.full((n, 2), -1, np.int64)
+    bit = lambda code, mask: np.where(mask, np.int64(1) << code, 0)
+    codes[:, 0] |= bit(V_FAN_TOTAL, b.has_fan & (b.hand.sum(axis=1) > 4))
+    counted = b.g_type < G_OTHER
+    hu = b.res == R_HU
+    for t in range(2):
+        on_tile = counted & (b.g_card == t + 1)
+        n_gang = _per_round_count(n, b.g_round, on_tile)
+        bu = on_tile & (b.g_type == G_BU)
+        n_bu = _per_round_count(n, b.g_round, bu)
+        bu_seat[b.g_round[bu][::-1], t] = b.g_doer[bu][::-1]  # 倒序赋值，重复时留下第一条
+
+        res, who_given = b.res[:, t], b.who_given[:, t]
+        total = b.extra[:, t].sum(axis=1)
+        consumed = np.where(b.who[:, t] >= 0, np.select([res == R_PENG, res == R_MINGGANG], [3, 4], 1), 0)
+        gang_like = (n_gang > 0) | (who_given & (res == R_MINGGANG))
+        c = codes[:, t + 1]
+        c |= bit(V_BU_DUP, n_bu > 1)
+        c |= bit(V_BU_NO_PENG, (n_bu > 0) & ~(who_given & (res == R_PENG)))
+        c |= bit(V_BU_DOER, (n_bu > 0) & (bu_seat[:, t] != b.tar[:, t]))
+        c |= bit(V_GANG_EXTRA, gang_like & (total != 0))
+        c |= bit(V_TILE_TOTAL, ~gang_like & (consumed + total > 4))
+        c |= bit(V_HU_GANG, (n_gang > 0) & hu[:, t])
+    codes[:, 0] |= bit(V_ZIMO_FIRST_HU, (b.method == 0) & hu.any(axis=1))
+    codes[:, 0] |= bit(V_DOUBLE_HU, hu.all(axis=1))
+    return codes, bu_seat
+
+
+# 与 check_round 相同的先后：客观事实（整局、幺鸡、八筒）在前，一致性在后
+_ORDER = [(0, V_FAN_TOTAL)] + [(t, c) for t in (1, 2) for c in (V_BU_DUP, V_BU_NO_PENG, V_BU_DOER, V_GANG_EXTRA,
+                                                              V_TILE_TOTAL)] + \
+         [(0, V_ZIMO_FIRST_HU), (0, V_DOUBLE_HU), (1, V_HU_GANG), (2, V_HU_GANG)]
+
+
+def decode_violations(codes: np.ndarray, bu_seat: np.ndarray, players: List[str]) -> List[Violation]:
+    """batch_violations 的一行 -> 与 check_round 相同的问题列表"""
+    out = []
+    for col, code in _ORDER:
+        if not int(codes[col]) >> code & 1: continue
+        tile = TILES[col - 1] if col else None
+        seat = int(bu_seat[col - 1]) if code == V_BU_DOER else -1
+        out.append(Violation(code, tile, players[seat] if seat >= 0 else None))
+    return out
+
+
+def validate_batch(b: RoundBatch) -> np.ndarray:
+    """validate_objective_facts + validate_consistency 的向量版，返回 bool[N]（True = 通过）"""
+    return ~batch_violations(b)[0].any(axis=1)
+
+
+def settle_batch(b: RoundBatch, rules: Optional[Rules] = None, chunk: int = 1 << 15) -> Tuple[np.ndarray, np.ndarray]:
+    """返回 (scores int64[N, P], ok bool[N])；校验不通过的局得分全为 0"""
+    rules = rules or Rules()
+    n, n_seats = b.n_rounds, b.n_seats
+    ok = validate_batch(b)
+    scores = np.zeros((n, n_seats), np.int64)
+    for lo in range(0, n, chunk):
+        hi = min(n, lo + chunk)
+        scores[lo:hi] = _settle_chunk(b, rules, lo, hi)
+    scores[~ok] = 0
+    return scores, ok
+
+
+def _settle_chunk(b: RoundBatch, rules: Rules, lo: int, hi: int) -> np.ndarray:
+    n, n_seats = hi - lo, b.n_seats
+    rc = rules.rules_config
+    shape_val = np.array([rc.get(s, 0) for s in b.shape_names], np.int64)
+    event_val = np.array([rc.get(e, 0) for e in b.event_names], np.int64)
+    events = b.events[lo:hi]
+    winners, ready, method = b.winners[lo:hi], b.ready[lo:hi], b.method[lo:hi]
+    who, res, tar = b.who[lo:hi], b.res[lo:hi], b.tar[lo:hi]
+
+    # 常鸡单价 u[n, tile]
+    base = np.array([int(rules.base_yj) * int(rules.mul_yj), int(rules.base_b8) * int(rules.mul_b8)], np.int64)
+    u = base[None, :] * b.fan_mult[lo:hi]
+    u_pos = u > 0
+
+    flow0 = np.zeros((n, n_seats, n_seats), np.int64)  # [n, payer, receiver]，胡/翻鸡
+    flow1 = np.zeros((n, n_seats, n_seats), np.int64)  # 杠/常鸡，可包赔
+    to_all = np.zeros((n, n_seats), np.int64)          # 其余所有人付给该座位（类别 1）
+
+    # 2.1 Hu
+    total = shape_val[b.shape[lo:hi]] + np.where(b.is_qing[lo:hi], rc.get("清一色加成", 0), 0) + events @ event_val
+    any_win = winners.any(axis=1)
+    zimo = np.flatnonzero(any_win & (method == 0))
+    flow0[zimo, :, b.first_winner[lo:hi][zimo]] += total[zimo, None]
+    loser = b.loser[lo:hi]
+    dp = np.flatnonzero(any_win & (method == 1) & (loser >= 0))
+    flow0[dp, loser[dp], :] += total[dp, None] * winners[dp]
+
+    # 2.2 Gang / 落地鸡（杠）
+    sel = (b.g_round >= lo) & (b.g_round < hi) & (b.g_doer >= 0)
+    g_n, g_d, g_t = b.g_round[sel] - lo, b.g_doer[sel], b.g_type[sel]
+    g_c, g_v = b.g_card[sel], b.g_victim[sel]
+    g_score = np.where(g_t == G_AN, 4, 2)
+    to_everyone = (g_t == G_AN) | (g_t == G_BU)
+    np.add.at(to_all, (g_n[to_everyone], g_d[to_everyone]), g_score[to_everyone])
+    m = ~to_everyone & (g_v >= 0)
+    np.add.at(flow1, (g_n[m], g_v[m], g_d[m]), g_score[m])
+
+    chick = g_c > 0
+    g_n, g_d, g_t, g_c, g_v = g_n[chick], g_d[chick], g_t[chick], g_c[chick] - 1, g_v[chick]
+    g_u = u[g_n, g_c]
+    on_peng = (g_t == G_BU) & (res[g_n, g_c] == R_PENG) & (tar[g_n, g_c] == g_d)
+    g_v = np.where(on_peng, who[g_n, g_c], g_v)
+    m = g_u > 0
+    np.add.at(to_all, (g_n[m], g_d[m]), 4 * g_u[m])
+    m &= g_v >= 0
+    np.add.at(flow1, (g_n[m], g_v[m], g_d[m]), g_u[m])
+
+    # 2.3 Fan Chicken：[n, p, r] = hand[r] - hand[p]
+    hand = b.hand[lo:hi]
+    flow0 += np.clip(hand[:, None, :] - hand[:, :, None], 0, None) * int(rules.fan_unit)
+
+    # 2.4 Common Chicken
+    bu_by = np.zeros((n, 2, n_seats), bool)
+    bu = chick & (b.g_type[sel] == G_BU)
+    bu_by[b.g_round[sel][bu] - lo, b.g_card[sel][bu] - 1, b.g_doer[sel][bu]] = True
+    for t in range(2):
+        ut, okt = u[:, t], u_pos[:, t]
+        # 冲锋鸡
+        m = np.flatnonzero((who[:, t] >= 0) & (res[:, t] == R_SAFE) & okt)
+        to_all[m, who[m, t]] += 2 * ut[m]
+        # 常鸡
+        cnt = b.extra[lo:hi, t]
+        to_all += np.where((cnt > 0) & okt[:, None], cnt * ut[:, None], 0)
+        # 碰（已补杠的由杠表计入）
+        m = np.flatnonzero((res[:, t] == R_PENG) & (tar[:, t] >= 0) & okt)
+        m = m[~bu_by[m, t, tar[m, t]]]
+        to_all[m, tar[m, t]] += 3 * ut[m]
+        liable = m[who[m, t] >= 0]
+        flow1[liable, who[liable, t], tar[liable, t]] += ut[liable]
+        # 被胡
+        m = np.flatnonzero((res[:, t] == R_HU) & okt)
+        cnt = b.hu_tar[lo:hi, t][m] * ut[m, None]
+        to_all[m] += cnt
+        liable = who[m, t] >= 0
+        flow1[m[liable], who[m[liable], t], :] += cnt[liable]
+
+    flow1 += to_all[:, None, :]
+
+    # 3. Filter
+    loser_ready = np.zeros(n, bool)
+    has_loser = loser >= 0
+    loser_ready[has_loser] = ready[has_loser, loser[has_loser]] | winners[has_loser, loser[has_loser]]
+    ev_zero = np.zeros(n, bool)
+    for e in ("热炮", "抢杠胡"):
+        if e in b.event_names: ev_zero |= events[:, b.event_names.index(e)] > 0
+    zi = np.where((method == 1) & has_loser & ev_zero & loser_ready, loser, -1)
+
+    ready_all = ready | winners
+    open_r = np.arange(n_seats)[None, :] != zi[:, None]
+    keep = ready_all & open_r                                     # 收款人听牌：照付
+    rev = (~ready_all & open_r)[:, None, :] & ready_all[:, :, None]  # 收款人未听牌、付款人听牌：反向包赔
+    flow = flow0 + flow1
+    flow *= keep[:, None, :]
+    flow1 *= rev
+    return (flow.sum(axis=1) - flow.sum(axis=2)) + (flow1.sum(axis=2) - flow1.sum(axis=1))
+
+
+def score_rounds(rounds: Iterable[Union[RoundInput, dict]], rules: Optional[Rules] = None
+                 ) -> Tuple[np.ndarray, np.ndarray]:
+    """逐局记录 → 列式批次 → 批量结算"""
+    return settle_batch(RoundBatch.from_rounds(rounds), rules)
+
+
+def scores_as_dicts(players_per_round: List[List[str]], scores: np.ndarray, ok: np.ndarray
+                    ) -> List[Optional[Dict[str, int]]]:
+    """还原成与 calculate_all_pipeline 相同的 {玩家: 分} 形式，校验失败的局为 None"""
+    return [dict(zip(p, map(int, s))) if k else None for p, s, k in zip(players_per_round, scores, ok)]
@@ -0,0 +1,190 @@
+"""录入中的一局“假如……”推演：穷举尚未确定的项，给出每人的得分分布。
+
+可变项：翻牌（按常鸡单价归成至多 4 类：无翻牌 / 普通 / 9条 / 7筒）、幺鸡/八筒首出结局（含被碰后是否补杠）、
+部分玩家是否听牌。原始转账可拆成互不影响的三块，分别记忆化后相加：
+    固定块   胡 + 杂牌杠 + 翻鸡互斥，与可变项无关，只算一次
+    幺鸡块   冲锋鸡/常鸡/落地鸡/幺鸡杠，只取决于幺鸡结局与幺鸡单价
+    八筒块   同上
+听牌过滤只看 (付款人, 收款人, 是否可包赔)，所以每块压成 [付款座位, 收款座位] 的两张表，
+全部组合 × 全部听牌情形一次性用 NumPy 套过滤。校验不通过的首出组合整枝剪掉。
+"""
+import itertools
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from .kernel import (
+    REVERSIBLE_MASK, TILES, CompiledRules, _iter_raw, check_consistency, check_objective_facts,
+)
+from .rounds import Rules, RoundInput
+
+if TYPE_CHECKING:
+    import numpy as np  # 运行时在用到的函数里再导入，只导入本模块不加载 NumPy
+
+FAN_CARDS = [""] + [f"{n}{s}" for s in ["筒", "条", "万"] for n in range(1, 10)]
+NO_WHO = "无/未现"
+
+# 首出结局 (首出者, 结局, 对象, 是否补杠)
+Outcome = Tuple[str, str, object, bool]
+
+
+@dataclass
+class WhatIfResult:
+    players: List[str]
+    dist: Dict[str, Counter]   # 玩家 -> {得分: 情形数}
+    total: int                 # 合法情形数
+    pruned: int                # 校验不通过剪掉的情形数
+    elapsed: float             # 秒
+
+    def summary(self) -> Dict[str, Tuple[int, float, int]]:
+        """玩家 -> (最少, 平均, 最多)"""
+        out = {}
+        for p, c in self.dist.items():
+            n = sum(c.values())
+            out[p] = (min(c), sum(s * k for s, k in c.items()) / n, max(c)) if n else (0, 0.0, 0)
+        return out
+
+
+def tile_outcomes(players: Sequence[str], winners: Sequence[str], who: Optional[str] = None) -> List[Outcome]:
+    """一张常鸡首出的全部结局；who 为 None 时首出者也未知（含未现）"""
+    whos = [NO_WHO] + list(players) if who is None else [who]
+    out: List[Outcome] = []
+    for w in whos:
+        if w == NO_WHO:
+            out.append((w, "安全", None, False))
+            continue
+        out.append((w, "安全", None, False))
+        for t in players:
+            if t == w: continue
+            out += [(w, "被碰", t, False), (w, "被碰", t, True), (w, "被明杠", t, False)]
+        out.append((w, "被胡", list(winners), False))
+    return out
+
+
+def _base_outcome(r: RoundInput, tile: str) -> Outcome:
+    who, res, tar = (r.fyw, r.fyr, r.fyt) if tile == "幺鸡" else (r.fbw, r.fbr, r.fbt)
+    bu = any(g['card'] == tile and g['type'] == "补杠" for g in r.gang_data)
+    return who, res, tar, bu
+
+
+def _auto_gangs(tile: str, o: Outcome) -> List[dict]:
+    """与界面一致：被明杠自动登记责任明杠，被碰可勾选补杠"""
+    who, res, tar, bu = o
+    if who == NO_WHO or not tar: return []
+    if res == "被明杠": return [{'doer': tar, 'type': '责任明杠', 'card': tile, 'victim': who}]
+    if res == "被碰" and bu: return [{'doer': tar, 'type': '补杠', 'card': tile, 'victim': None}]
+    return []
+
+
+class _Tables:
+    """原始转账块 -> (普通表, 可包赔表)，均为 [付款座位, 收款座位] 的金额"""
+
+    def __init__(self, players: Sequence[str]):
+        self.seat = {p: k for k, p in enumerate(players)}
+        self.n = len(players)
+
+    def __call__(self, txs) -> "np.ndarray":
+        import numpy as np
+        t = np.zeros((2, self.n, self.n), dtype=np.int64)
+        for tx in txs: t[REVERSIBLE_MASK >> tx.cat & 1, self.seat[tx.payer], self.seat[tx.receiver]] += tx.amount
+        return t
+
+
+def what_if(base: RoundInput, rules: Rules, fan_cards: Optional[Sequence[str]] = None,
+            yj: Optional[Sequence[Outcome]] = None, b8: Optional[Sequence[Outcome]] = None,
+            ready_unknown: Sequence[str] = ()) -> WhatIfResult:
+    """base 为当前录入；fan_cards / yj / b8 给出要穷举的取值（None 表示沿用 base），
+    ready_unknown 里的玩家听牌与否都算一遍"""
+    import numpy as np
+    t0 = time.perf_counter()
+    players, winners = list(base.players), list(base.winners)
+    fan_cards = [base.fan_card] if fan_cards is None else list(fan_cards)
+    alts = {"幺鸡": list(yj) if yj is not None else [_base_outcome(base, "幺鸡")],
+            "八筒": list(b8) if b8 is not None else [_base_outcome(base, "八筒")]}
+    extras = {"幺鸡": base.extra_yj, "八筒": base.extra_b8}
+    user_gangs = [g for g in base.gang_data if not (g['card'] in TILES and g['type'] in ("责任明杠", "补杠"))]
+    tile_gangs = {t: [g for g in user_gangs if g['card'] == t] for t in TILES}
+    plain_gangs = [g for g in user_gangs if g['card'] not in TILES]
+    table = _Tables(players)
+
+    # 翻牌按编译结果（即常鸡单价）分类；有无翻牌另影响翻鸡张数校验
+    classes: Dict[tuple, List] = {}
+    for f in fan_cards:
+        cr = rules.compile(f)
+        classes.setdefault((cr.key, bool(f)), [cr, f, 0])[2] += 1
+
+    # 首出组合的校验（与翻牌无关的部分），不合法的整枝剪掉
+    pairs = []
+    for a, b in itertools.product(range(len(alts["幺鸡"])), range(len(alts["八筒"]))):
+        (yw, yr, yt, _), (bw, br, bt, _) = alts["幺鸡"][a], alts["八筒"][b]
+        gangs = user_gangs + _auto_gangs("幺鸡", alts["幺鸡"][a]) + _auto_gangs("八筒", alts["八筒"][b])
+        if not check_objective_facts(players, "", base.hand_total_counts, yw, yr, yt, bw, br, bt,
+                                     base.extra_yj, base.extra_b8, gangs) and \
+                not check_consistency(players, winners, base.method, yw, yr, yt, bw, br, bt, gangs):
+            pairs.append((a, b))
+    fan_ok = not check_objective_facts(players, "1条", base.hand_total_counts, NO_WHO, "安全", None,
+                                       NO_WHO, "安全", None, {}, {}, [])
+
+    # 三块原始转账，按各自的依赖记忆化
+    const = table(_iter_raw(
+        next(iter(classes.values()))[0], players, winners, base.method, base.loser, base.hu_shape, base.is_qing,
+        base.special_events, NO_WHO, "安全", None, NO_WHO, "安全", None, {}, {}, base.hand_total_counts,
+        plain_gangs))
+    memo: Dict[tuple, "np.ndarray"] = {}
+
+    def tile_block(cr: CompiledRules, tile: str, k: int) -> "np.ndarray":
+        key = (tile, k, cr.price[TILES.index(tile)])
+        hit = memo.get(key)
+        if hit is None:
+            o = alts[tile][k]
+            first = (o[0], o[1], o[2]) if tile == "幺鸡" else (NO_WHO, "安全", None)
+            second = (o[0], o[1], o[2]) if tile == "八筒" else (NO_WHO, "安全", None)
+            e_yj, e_b8 = (extras[tile], {}) if tile == "幺鸡" else ({}, extras[tile])
+            hit = memo[key] = table(_iter_raw(
+                cr, players, [], base.method, None, base.hu_shape, False, [], *first, *second, e_yj, e_b8, {},
+                tile_gangs[tile] + _auto_gangs(tile, o)))
+        return hit
+
+    blocks, weights, pruned = [], [], 0
+    for cr, f, count in classes.values():
+        if bool(f) and not fan_ok:
+            pruned += count * len(alts["幺鸡"]) * len(alts["八筒"])
+            continue
+        pruned += count * (len(alts["幺鸡"]) * len(alts["八筒"]) - len(pairs))
+        for a, b in pairs:
+            blocks.append(const + tile_block(cr, "幺鸡", a) + tile_block(cr, "八筒", b))
+            weights.append(count)
+
+    # 听牌情形：已知部分来自 base，ready_unknown 逐一取真/假；胡牌者恒为听牌
+    known = set(players if base.ready_list is None else base.ready_list) | set(winners)
+    unknown = [p for p in ready_unknown if p in players and p not in winners]
+    masks = []
+    for bits in itertools.product((False, True), repeat=len(unknown)):
+        ready = (known - set(unknown)) | {p for p, on in zip(unknown, bits) if on}
+        masks.append([p in ready for p in players])
+    n_masks = len(masks)
+    pruned *= n_masks
+
+    dist = {p: Counter() for p in players}
+    if blocks:
+        T = np.stack(blocks)                       # [K, 2, 付, 收]
+        R = np.array(masks, dtype=bool)            # [M, P]
+        Z = np.zeros_like(R)
+        if base.method == "点炮" and base.loser in players and \
+                ("热炮" in base.special_events or "抢杠胡" in base.special_events):
+            li = players.index(base.loser)
+            Z[:, li] = R[:, li]
+        keep = (R & ~Z).astype(np.int64)            # 收款人听牌且不是零收入
+        rev = ((~R & ~Z)[:, None, :] & R[:, :, None]).astype(np.int64)  # [M, 付, 收]：收款人未听、付款人听牌时反向
+        A, B = T[:, 0], T[:, 1]
+        # 正向：收款人 j 收、付款人 i 付；反向：原付款人 i 收、原收款人 j 付
+        fwd = np.einsum("kij,mj->kmij", A + B, keep)
+        back = np.einsum("kij,mij->kmij", B, rev)
+        scores = fwd.sum(axis=2) - fwd.sum(axis=3) + back.sum(axis=3) - back.sum(axis=2)   # [K, M, P]
+        w = np.repeat(np.array(weights, dtype=np.int64), n_masks)
+        for k, p in enumerate(players):
+            vals, inv = np.unique(scores[:, :, k].ravel(), return_inverse=True)
+            dist[p] = Counter(dict(zip(vals.tolist(), np.bincount(inv, weights=w).astype(int).tolist())))
+    total = int(sum(weights)) * n_masks
+    return WhatIfResult(players, dist, total, pruned, time.perf_counter() - t0)